@@ -0,0 +1,600 @@
+#!/usr/env/python
+# This module simulates many independent traces at once. The state of N
+# simulations on the same machine (see machine_config.py) is kept in NumPy
+# arrays with one row per simulation: station busy/ready bits, operand and
+# destination tags, register tags and values, functional unit and buffer
+# slot occupancy with their start times, the CDB queue and the instruction
+# tables. Every clock cycle the Write-Result, Issue, Start-Execution and
+# Complete-Execution blocks of tomasulo_sim.py are applied to all of the
+# simulations together, walking the stations and buffer slots in the same
+# order as the simulator does, so each simulation produces exactly the
+# instruction table and register file that run_tomasulo_sim would.
+# A simulation that reaches a situation in which tomasulo_sim.py would
+# raise an error (e.g. a division by zero), or that outgrows the fixed
+# capacity of the arrays, is flagged and re-run with the regular simulator.
+# NumPy is needed by this module only.
+
+
+import sys
+import argparse
+try:
+    import numpy as np
+except ImportError:
+    raise ImportError("batch_sim.py requires NumPy (pip install numpy); "
+                      "the rest of the simulator does not.")
+import instruction_reader as ir
+import instruction_table as it
+import register_file as rf
+import machine_config as mc
+import binary_trace as bt
+import tomasulo_sim as ts
+
+
+# Operation codes and the class (reservation station and functional unit)
+# each of them is issued to. Classes are numbered in the order of rs_list.
+OPCODES     = ("LD", "SD", "ADDD", "SUBD", "MULTD", "DIVD")
+LOAD, STORE, ADD, MULT = 0, 1, 2, 3
+OP_CLASS    = np.array([LOAD, STORE, ADD, ADD, MULT, MULT])
+OP_LD, OP_SD, OP_ADDD, OP_SUBD, OP_MULTD, OP_DIVD = range(6)
+NUM_REGS    = len(rf.REGISTER_BANKS)*rf.REGISTER_BANK_SIZE
+
+# Register names in the order of RegisterFile.items() and their ids.
+REGISTER_NAMES = rf.create_register_file().names()
+REGISTER_IDS   = np.array([rf.register_id(name) for name in REGISTER_NAMES])
+
+# Attributes of a BatchState holding one row per simulation.
+PER_SIM_ARRAYS = ("trace_idx", "length", "opcode", "dest", "latency", "error",
+                  "busy", "ready", "st_op", "st_dest", "st_inst", "st_slot",
+                  "qi", "vj_tag", "vk_tag", "vj", "vk", "reg_value",
+                  "reg_tags", "reg_ntags", "slot_occ", "slot_inst",
+                  "slot_begin", "queue", "queue_head", "queue_len", "issue",
+                  "exec_start", "exec_compl", "write_result", "next_instr",
+                  "num_written", "finished", "halted", "final_clock")
+
+# Parameters of a MachineConfig modelled by the batch. Any other parameter
+# must keep its default value.
+SUPPORTED_PARAMETERS = ("num_ld_stations", "num_sd_stations",
+                        "num_addd_stations", "num_multd_stations",
+                        "num_load_slots", "num_store_slots", "load_latency",
+                        "store_latency", "add_latency", "mult_latency",
+                        "div_latency")
+
+# The running simulations are packed together once fewer than this
+# fraction of the rows of a batch are still running.
+REPACK_FRACTION = 0.5
+
+# Reasons for a simulation to be handed back to the regular simulator.
+ERR_NONE          = 0
+ERR_UNSUPPORTED   = 1 # Trace uses something the arrays cannot represent
+ERR_CAPACITY      = 2 # A register tag list or the CDB queue overflowed
+ERR_CONTENTION    = 3 # resolve_contention found a register without a tag
+ERR_INVALID_OP    = 4 # Broadcast of a station that holds no instruction
+ERR_ARITHMETIC    = 5 # Division by zero or a non-finite/missing value
+
+
+# The result of one simulation of the batch. clock_cycle is the last
+# simulated cycle, instr_table holds the issued instructions and registers
+# the (name, value) pairs of the register file. completed is False if the
+# simulation halted or hit max_cycles before every instruction wrote its
+# result. If the regular simulator was used for this trace and raised an
+# exception, error holds that exception and the other fields are None.
+class BatchResult:
+    def __init__(self, clock_cycle, instr_table, registers, completed,
+                 error=None, fallback=False):
+        self.clock_cycle = clock_cycle
+        self.instr_table = instr_table
+        self.registers   = registers
+        self.completed   = completed
+        self.error       = error
+        self.fallback    = fallback
+
+
+# Turn a trace (a file name or a list of Instructions) into its list of
+# Instructions.
+def load_trace(trace):
+    if not isinstance(trace, str):
+        return list(trace)
+    if bt.is_binary_trace(trace):
+        return list(bt.iter_binary_instructions(trace))
+    return list(ir.iter_instructions(trace))
+
+
+# Holds the NumPy state of N simulations of the given decoded traces.
+class BatchState:
+    def __init__(self, traces, config):
+        self.config   = config
+        num_sims      = len(traces)
+        max_len       = max([len(trace) for trace in traces] + [1])
+        self.num_sims = num_sims
+        self.trace_idx = np.arange(num_sims)
+
+        # Stations are numbered from 1 as in reservation_stations.py;
+        # column 0 is unused so that a tag of 0 means "no tag".
+        counts = [config.num_ld_stations, config.num_sd_stations,
+                  config.num_addd_stations, config.num_multd_stations]
+        self.num_stations  = sum(counts)
+        self.rs_start      = np.cumsum([1] + counts[:-1])
+        self.rs_count      = np.array(counts)
+        self.station_class = np.zeros(self.num_stations + 1, dtype=np.int64)
+        for cls in range(4):
+            start = self.rs_start[cls]
+            self.station_class[start:start+counts[cls]] = cls
+
+        # Buffer slots of all functional units side by side: the load
+        # buffer, the store buffer, then the single slot of the add and
+        # mult units, which behave like one-slot buffers.
+        slots = [config.num_load_slots, config.num_store_slots, 1, 1]
+        self.slot_start = np.cumsum([0] + slots[:-1])
+        self.slot_count = np.array(slots)
+        self.num_slots  = sum(slots)
+        self.slot_class = np.repeat(np.arange(4), slots)
+
+        # Decoded traces. Operands are either a register id or a value.
+        shape = (num_sims, max_len)
+        self.length   = np.array([len(trace) for trace in traces])
+        self.opcode   = np.zeros(shape, dtype=np.int64)
+        self.dest     = np.zeros(shape, dtype=np.int64)
+        self.latency  = np.zeros(shape, dtype=np.int64)
+        self.src_reg  = np.zeros((2,) + shape, dtype=bool)
+        self.src      = np.zeros((2,) + shape, dtype=np.float64)
+        self.error    = np.zeros(num_sims, dtype=np.int64)
+        for row, trace in enumerate(traces):
+            self.decode_trace(row, trace)
+
+        # Stations (num_sims x num_stations+1).
+        st_shape     = (num_sims, self.num_stations + 1)
+        self.busy    = np.zeros(st_shape, dtype=bool)
+        self.ready   = np.zeros(st_shape, dtype=bool)
+        self.st_op   = np.full(st_shape, -1, dtype=np.int64)
+        self.st_dest = np.full(st_shape, -1, dtype=np.int64)
+        self.st_inst = np.full(st_shape, -1, dtype=np.int64)
+        self.st_slot = np.full(st_shape, -1, dtype=np.int64)
+        self.qi      = np.zeros(st_shape, dtype=np.int64)
+        self.vj_tag  = np.zeros(st_shape, dtype=np.int64)
+        self.vk_tag  = np.zeros(st_shape, dtype=np.int64)
+        self.vj      = np.full(st_shape, np.nan)
+        self.vk      = np.full(st_shape, np.nan)
+
+        # Register file: values and a list of tags per register (the first
+        # entry is the oldest). A register holds at most one tag per
+        # station and a few stale ones, so twice the number of stations is
+        # plenty; overflowing simulations are handed back.
+        self.tag_depth = 2*self.num_stations + 2
+        self.reg_value = np.full((num_sims, NUM_REGS),
+                                 float(rf.DEFAULT_REG_VALUE))
+        self.reg_tags  = np.zeros((num_sims, NUM_REGS, self.tag_depth),
+                                  dtype=np.int64)
+        self.reg_ntags = np.zeros((num_sims, NUM_REGS), dtype=np.int64)
+
+        # Buffer slots.
+        self.slot_occ   = np.zeros((num_sims, self.num_slots), dtype=bool)
+        self.slot_inst  = np.full((num_sims, self.num_slots), -1,
+                                  dtype=np.int64)
+        self.slot_begin = np.zeros((num_sims, self.num_slots), dtype=np.int64)
+
+        # CDB queue of completed instructions, kept as a ring buffer.
+        self.queue_size = self.num_stations + self.num_slots + 2
+        self.queue      = np.zeros((num_sims, self.queue_size), dtype=np.int64)
+        self.queue_head = np.zeros(num_sims, dtype=np.int64)
+        self.queue_len  = np.zeros(num_sims, dtype=np.int64)
+
+        # Instruction tables and progress.
+        self.issue        = np.zeros(shape, dtype=np.int64)
+        self.exec_start   = np.zeros(shape, dtype=np.int64)
+        self.exec_compl   = np.zeros(shape, dtype=np.int64)
+        self.write_result = np.zeros(shape, dtype=np.int64)
+        self.next_instr   = np.zeros(num_sims, dtype=np.int64)
+        self.num_written  = np.zeros(num_sims, dtype=np.int64)
+        self.finished     = self.length == 0
+        self.halted       = np.zeros(num_sims, dtype=bool)
+        self.final_clock  = np.zeros(num_sims, dtype=np.int64)
+        self.clock_cycle  = 0
+
+    def decode_trace(self, row, trace):
+        for idx, instr in enumerate(trace):
+            if instr.operation not in OPCODES:
+                self.error[row] = ERR_UNSUPPORTED
+                return
+            ids = (instr.dest_id, instr.operand1_id, instr.operand2_id)
+            if any(reg is not None and reg >= NUM_REGS for reg in ids):
+                self.error[row] = ERR_UNSUPPORTED
+                return
+            self.opcode[row, idx]  = OPCODES.index(instr.operation)
+            self.dest[row, idx]    = instr.dest_id
+            self.latency[row, idx] = instr.latency
+            for num, (operand, reg) in enumerate(((instr.operand1,
+                                                   instr.operand1_id),
+                                                  (instr.operand2,
+                                                   instr.operand2_id))):
+                self.src_reg[num, row, idx] = reg is not None
+                self.src[num, row, idx] = operand if reg is None else reg
+
+    # Drop every simulation but the ones in the given rows, so that the
+    # simulations still running are not slowed down by finished ones.
+    def keep(self, rows):
+        for name in PER_SIM_ARRAYS:
+            setattr(self, name, getattr(self, name)[rows])
+        self.src_reg  = self.src_reg[:, rows]
+        self.src      = self.src[:, rows]
+        self.num_sims = len(rows)
+
+    # Rows of the simulations that are still running.
+    def running(self):
+        return ~(self.finished | self.halted | (self.error != ERR_NONE))
+
+    # Whether the functional unit of the given class has a free slot, for
+    # the given rows.
+    def unit_available(self, rows, cls):
+        start = self.slot_start[cls]
+        return ~self.slot_occ[rows, start:start+self.slot_count[cls]].all(
+            axis=1)
+
+    # Append tag to the register of each row unless it is already the
+    # register's first tag (rf.load_register_tag).
+    def load_register_tag(self, rows, regs, tags):
+        ntags = self.reg_ntags[rows, regs]
+        head  = self.reg_tags[rows, regs, 0]
+        add   = (ntags == 0) | (head != tags)
+        full  = add & (ntags >= self.tag_depth)
+        self.error[rows[full]] = ERR_CAPACITY
+        add  &= ~full
+        rows, regs, tags, ntags = rows[add], regs[add], tags[add], ntags[add]
+        self.reg_tags[rows, regs, ntags] = tags
+        self.reg_ntags[rows, regs] = ntags + 1
+
+    # rf.is_register_available for a register and an expected tag (0 for
+    # none, in which case the register must have no tag at all).
+    def register_available(self, rows, regs, tags):
+        ntags = self.reg_ntags[rows, regs]
+        head  = self.reg_tags[rows, regs, 0]
+        return (ntags == 0) | ((tags != 0) & (head == tags))
+
+    # Fill in one operand of the newly issued stations (read_operand in
+    # reservation_stations.py).
+    def read_operand(self, rows, instrs, stations, num, tag_field,
+                     value_field):
+        is_reg  = self.src_reg[num, rows, instrs]
+        operand = self.src[num, rows, instrs]
+        imm     = ~is_reg
+        tag_field[rows[imm], stations[imm]] = 0
+        value_field[rows[imm], stations[imm]] = operand[imm]
+
+        rows, stations = rows[is_reg], stations[is_reg]
+        regs  = operand[is_reg].astype(np.int64)
+        avail = self.register_available(rows, regs, stations)
+        tag_field[rows[avail], stations[avail]] = 0
+        value_field[rows[avail], stations[avail]] = self.reg_value[
+            rows[avail], regs[avail]]
+        wait = ~avail
+        tag_field[rows[wait], stations[wait]] = self.reg_tags[rows[wait],
+                                                             regs[wait], 0]
+
+    # rs.is_station_ready for the given rows and stations, without the
+    # side effect on the register tags.
+    def station_ready(self, rows, stations, classes):
+        vj  = self.vj_tag[rows, stations]
+        vk  = self.vk_tag[rows, stations]
+        ok  = ((vj == 0) | (vj == stations)) & ((vk == 0) | (vk == stations))
+        ok &= self.register_available(rows, self.st_dest[rows, stations],
+                                      self.qi[rows, stations])
+        for cls in range(4):
+            in_cls = classes == cls
+            if in_cls.any():
+                ok[in_cls] &= self.unit_available(rows[in_cls], cls)
+        return ok
+
+    # Write-Result/Broadcast Block.
+    def write_result_stage(self):
+        rows = np.nonzero(self.running() & (self.queue_len > 0))[0]
+        if len(rows) == 0: return
+
+        # resolve_contention looks up the tag of every queued instruction's
+        # destination register and fails if one of them has none.
+        multi = rows[self.queue_len[rows] > 1]
+        for offset in range(self.queue_size):
+            pending = multi[self.queue_len[multi] > offset]
+            if len(pending) == 0: break
+            instrs = self.queue[pending, (self.queue_head[pending] + offset) %
+                                self.queue_size]
+            no_tag = self.reg_ntags[pending, self.dest[pending, instrs]] == 0
+            self.error[pending[no_tag]] = ERR_CONTENTION
+        rows = rows[self.error[rows] == ERR_NONE]
+
+        instrs = self.queue[rows, self.queue_head[rows]]
+        dests  = self.dest[rows, instrs]
+        no_tag = self.reg_ntags[rows, dests] == 0
+        self.halted[rows[no_tag]] = True
+        self.final_clock[rows[no_tag]] = self.clock_cycle
+        rows, instrs, dests = rows[~no_tag], instrs[~no_tag], dests[~no_tag]
+        if len(rows) == 0: return
+        tags = self.reg_tags[rows, dests, 0]
+
+        # Empty the functional unit slot of the station named by the tag:
+        # the buffer slot its instruction went into, if it has started, or
+        # the single slot of the add or mult unit.
+        classes = self.station_class[tags]
+        slots   = np.where(classes >= ADD, self.slot_start[classes],
+                           self.st_slot[rows, tags])
+        held    = slots >= 0
+        self.slot_occ[rows[held], slots[held]]   = False
+        self.slot_inst[rows[held], slots[held]]  = -1
+        self.slot_begin[rows[held], slots[held]] = 0
+
+        self.write_result[rows, instrs] = self.clock_cycle
+        self.num_written[rows] += 1
+
+        # Compute the value of the station (execute_station_op).
+        ops      = self.st_op[rows, tags]
+        vj       = self.vj[rows, tags]
+        vk       = self.vk[rows, tags]
+        st_dest  = np.maximum(self.st_dest[rows, tags], 0)
+        dest_val = self.reg_value[rows, st_dest]
+        with np.errstate(all="ignore"):
+            value = np.select([ops == OP_ADDD, ops == OP_SUBD,
+                               ops == OP_MULTD, ops == OP_DIVD],
+                              [vj + vk, vj - vk, vj*vk, vj/vk], dest_val)
+        self.error[rows[ops < 0]] = ERR_INVALID_OP
+        bad = ((ops == OP_DIVD) & (vk == 0)) | ~np.isfinite(value)
+        self.error[rows[bad & (ops >= 0)]] = ERR_ARITHMETIC
+        self.reg_value[rows, dests] = value
+
+        # Update and clear the operand tags waiting on the broadcast tag,
+        # and the tag of the producing station itself.
+        tag_col = tags[:, None]
+        match   = self.vj_tag[rows] == tag_col
+        self.vj[rows] = np.where(match, value[:, None], self.vj[rows])
+        self.vj_tag[rows] = np.where(match, 0, self.vj_tag[rows])
+        match   = self.vk_tag[rows] == tag_col
+        self.vk[rows] = np.where(match, value[:, None], self.vk[rows])
+        self.vk_tag[rows] = np.where(match, 0, self.vk_tag[rows])
+        own = self.qi[rows, tags] == tags
+        self.qi[rows[own], tags[own]] = 0
+
+        # Remove the first tag of the destination register.
+        self.reg_tags[rows, dests, :-1] = self.reg_tags[rows, dests, 1:]
+        self.reg_tags[rows, dests, -1] = 0
+        self.reg_ntags[rows, dests] -= 1
+
+        # Clear the station.
+        self.busy[rows, tags]    = False
+        self.ready[rows, tags]   = False
+        self.st_op[rows, tags]   = -1
+        self.st_dest[rows, tags] = -1
+        self.st_inst[rows, tags] = -1
+        self.st_slot[rows, tags] = -1
+        self.qi[rows, tags]      = 0
+        self.vj_tag[rows, tags]  = 0
+        self.vk_tag[rows, tags]  = 0
+        self.vj[rows, tags]      = np.nan
+        self.vk[rows, tags]      = np.nan
+
+        self.queue_head[rows] = (self.queue_head[rows] + 1) % self.queue_size
+        self.queue_len[rows] -= 1
+
+    # Issue-Instruction Block.
+    def issue_stage(self):
+        rows = np.nonzero(self.running() &
+                          (self.next_instr < self.length))[0]
+        if len(rows) == 0: return
+        instrs  = self.next_instr[rows]
+        classes = OP_CLASS[self.opcode[rows, instrs]]
+
+        # Lowest free station of each instruction's reservation station.
+        stations = np.zeros(len(rows), dtype=np.int64)
+        for cls in range(4):
+            in_cls = np.nonzero(classes == cls)[0]
+            if len(in_cls) == 0: continue
+            start = self.rs_start[cls]
+            free  = ~self.busy[rows[in_cls], start:start+self.rs_count[cls]]
+            has_free = free.any(axis=1)
+            stations[in_cls[has_free]] = start + free[has_free].argmax(axis=1)
+        issued = stations > 0
+        rows, instrs = rows[issued], instrs[issued]
+        classes, stations = classes[issued], stations[issued]
+        if len(rows) == 0: return
+
+        self.issue[rows, instrs] = self.clock_cycle
+        dests = self.dest[rows, instrs]
+        self.busy[rows, stations]    = True
+        self.st_op[rows, stations]   = self.opcode[rows, instrs]
+        self.st_dest[rows, stations] = dests
+        self.st_inst[rows, stations] = instrs
+        self.qi[rows, stations]      = stations
+        self.load_register_tag(rows, dests, stations)
+        self.read_operand(rows, instrs, stations, 0, self.vj_tag, self.vj)
+        self.read_operand(rows, instrs, stations, 1, self.vk_tag, self.vk)
+
+        ready = self.station_ready(rows, stations, classes)
+        self.load_register_tag(rows[ready], dests[ready], stations[ready])
+        self.ready[rows[ready], stations[ready]] = True
+        self.next_instr[rows] += 1
+
+    # Start-Execution Block, visiting the busy stations in index order.
+    def start_execution_stage(self, active):
+        for station in range(1, self.num_stations + 1):
+            busy = active & self.busy[:, station]
+            if not busy.any(): continue
+            cls = self.station_class[station]
+
+            rows = np.nonzero(busy & self.ready[:, station])[0]
+            if len(rows):
+                instrs = self.st_inst[rows, station]
+                go = ((self.exec_start[rows, instrs] == 0) &
+                      self.unit_available(rows, cls))
+                rows, instrs = rows[go], instrs[go]
+                if len(rows):
+                    start = self.slot_start[cls]
+                    slots = start + self.slot_occ[
+                        rows, start:start+self.slot_count[cls]].argmin(axis=1)
+                    self.exec_start[rows, instrs] = self.clock_cycle
+                    self.slot_occ[rows, slots]   = True
+                    self.slot_inst[rows, slots]  = instrs
+                    self.slot_begin[rows, slots] = self.clock_cycle
+                    self.st_slot[rows, station]  = slots
+
+            rows = np.nonzero(busy & ~self.ready[:, station])[0]
+            if len(rows):
+                stations = np.full(len(rows), station)
+                ready = self.station_ready(rows, stations,
+                                           np.full(len(rows), cls))
+                rows = rows[ready]
+                self.load_register_tag(rows, self.st_dest[rows, station],
+                                       stations[ready])
+                self.ready[rows, station] = True
+
+    # Complete-Execution Block, visiting the slots of the load buffer,
+    # store buffer, add unit and mult unit in order.
+    def complete_execution_stage(self, active):
+        for slot in range(self.num_slots):
+            rows = np.nonzero(active & self.slot_occ[:, slot])[0]
+            if len(rows) == 0: continue
+            instrs = self.slot_inst[rows, slot]
+            done   = (self.latency[rows, instrs] ==
+                      self.clock_cycle - self.slot_begin[rows, slot] + 1)
+            rows, instrs = rows[done], instrs[done]
+            if len(rows) == 0: continue
+            self.exec_compl[rows, instrs] = self.clock_cycle
+            full = self.queue_len[rows] >= self.queue_size
+            self.error[rows[full]] = ERR_CAPACITY
+            rows, instrs = rows[~full], instrs[~full]
+            tail = (self.queue_head[rows] + self.queue_len[rows]) % \
+                   self.queue_size
+            self.queue[rows, tail] = instrs
+            self.queue_len[rows] += 1
+
+    # Advance every running simulation by one clock cycle.
+    def simulate_cycle(self):
+        self.clock_cycle += 1
+        self.write_result_stage()
+        self.issue_stage()
+        active = self.running() & ((self.next_instr < self.length) |
+                                   (self.num_written < self.next_instr))
+        self.start_execution_stage(active)
+        self.complete_execution_stage(active)
+
+        done = (self.running() & (self.next_instr == self.length) &
+                (self.num_written == self.length))
+        self.finished |= done
+        self.final_clock[done] = self.clock_cycle
+
+    # Build the BatchResult of the simulation in the given row.
+    def result(self, row, completed):
+        num_issued = int(self.next_instr[row])
+        table = it.InstructionTable(num_issued)
+        for column, values in ((table.issue, self.issue),
+                               (table.exec_start, self.exec_start),
+                               (table.exec_complete, self.exec_compl),
+                               (table.write_result, self.write_result)):
+            column[:] = it.array('l', values[row, :num_issued].tolist())
+        table.num_completed = int(self.num_written[row])
+        registers = list(zip(REGISTER_NAMES,
+                             self.reg_value[row, REGISTER_IDS].tolist()))
+        return BatchResult(int(self.final_clock[row]), table, registers,
+                           completed)
+
+
+# Run a single trace with the regular simulator, for the simulations the
+# batch could not handle.
+def run_fallback(trace, config, max_cycles):
+    try:
+        result = ts.simulate(trace, config, max_cycles=max_cycles)
+    except Exception as exc:
+        return BatchResult(None, None, None, False, exc, True)
+    return BatchResult(result.clock_cycle, result.instr_table,
+                       result.reg_file.items(), result.completed, None, True)
+
+
+# Raise a ValueError if the given MachineConfig uses a feature of the
+# simulator that the batch does not model.
+def check_config(config):
+    defaults = dict(mc.DEFAULT_PARAMETERS)
+    for name in mc.PARAMETERS:
+        if (name not in SUPPORTED_PARAMETERS and
+            getattr(config, name) != defaults[name]):
+            raise ValueError("Machine parameter %s is not supported by "
+                             "batch simulation!" % name)
+
+
+# Simulate every trace (file names or lists of Instructions) on the machine
+# described by config (the default machine if none is given) and return a
+# BatchResult per trace, in order. Simulations still running after
+# max_cycles are stopped there and marked as not completed.
+def run_batch(traces, config=None, max_cycles=None):
+    if config is None: config = mc.MachineConfig()
+    check_config(config)
+    mc.apply_config(config)
+    traces  = [load_trace(trace) for trace in traces]
+    state   = BatchState(traces, config)
+    results = [None]*len(traces)
+
+    while True:
+        running = state.running()
+        if not running.any(): break
+        if max_cycles is not None and state.clock_cycle >= max_cycles:
+            break
+        if running.sum() < REPACK_FRACTION*state.num_sims:
+            collect_results(state, np.nonzero(~running)[0], traces, results,
+                            max_cycles)
+            state.keep(np.nonzero(running)[0])
+        state.simulate_cycle()
+
+    collect_results(state, np.arange(state.num_sims), traces, results,
+                    max_cycles)
+    return results
+
+
+# Store the BatchResults of the simulations in the given rows of the batch
+# into results, at the index of their trace.
+def collect_results(state, rows, traces, results, max_cycles):
+    config = state.config
+    for row in rows:
+        idx = state.trace_idx[row]
+        if state.error[row] != ERR_NONE:
+            results[idx] = run_fallback(traces[idx], config, max_cycles)
+            mc.apply_config(config)
+        elif state.finished[row] or state.halted[row]:
+            results[idx] = state.result(row, bool(state.finished[row]))
+        else:
+            state.final_clock[row] = state.clock_cycle
+            results[idx] = state.result(row, False)
+
+
+# Compare a BatchResult against a run of the regular simulator. Returns
+# True if the instruction tables, final clock cycles and registers match.
+def verify_result(result, trace, config=None, max_cycles=None):
+    mc.apply_config(config)
+    expected = run_fallback(load_trace(trace), config, max_cycles)
+    if result.error is not None or expected.error is not None:
+        return type(result.error) == type(expected.error)
+    return (result.clock_cycle == expected.clock_cycle and
+            result.completed == expected.completed and
+            all(result.instr_table.column(name) ==
+                expected.instr_table.column(name) for name in it.COLUMNS) and
+            result.registers == expected.registers)
+
+
+# Main block: simulate every trace given on the command line as one batch
+# and print the final clock cycle of each. --verify re-runs every trace
+# with the regular simulator and reports any mismatch.
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Simulate many traces "
+                                     "at once")
+    parser.add_argument("traces", nargs="+")
+    parser.add_argument("--max-cycles", type=int, default=None)
+    parser.add_argument("--verify", action="store_true")
+    args = parser.parse_args()
+
+    results    = run_batch(args.traces, max_cycles=args.max_cycles)
+    mismatches = 0
+    for trace, result in zip(args.traces, results):
+        if result.error is not None:
+            print("%s: error %r" % (trace, result.error))
+        else:
+            print("%s: %s at Clock Cycle %d" %
+                  (trace, "Finished" if result.completed else "Stopped",
+                   result.clock_cycle))
+        if args.verify and not verify_result(result, trace,
+                                             max_cycles=args.max_cycles):
+            print("%s: MISMATCH with tomasulo_sim" % trace)
+            mismatches += 1
+    if mismatches: sys.exit(1)
@@ -0,0 +1,270 @@
+#!/usr/env/python
+# This module benchmarks the simulator itself. Synthetic traces of
+# increasing size (10 up to 10^6 instructions by default) are generated and
+# run through run_tomasulo_sim end-to-end, and through the simulation loop
+# with the Write-Result, Issue, Start-Execution and Complete-Execution
+# blocks timed separately. For every size the wall time, simulated cycles
+# per second, peak RSS and time per instruction are reported, along with
+# the scaling exponent between consecutive sizes (1.0 means linear). The
+# report is written as JSON and can be compared against an earlier report
+# to catch performance regressions.
+
+
+import os
+import sys
+import json
+import math
+import time
+import random
+import resource
+import argparse
+import tempfile
+import platform
+import profiling as prof
+import machine_config as mc
+import output_writers as ow
+import tomasulo_sim as ts
+from concurrent.futures import ProcessPoolExecutor
+
+
+DEFAULT_SIZES     = [10, 100, 1000, 10000, 100000, 1000000]
+DEFAULT_SEED      = 0
+DEFAULT_TOLERANCE = 0.25 # Allowed slowdown before a run is a regression
+
+# The synthetic traces take the base address of loads and stores from
+# registers that are never written, so that their addresses stay valid with
+# a data memory (see data_memory.py), and always divide by one of them,
+# which keeps its default (non-zero) value. Otherwise, loads and stores
+# write their own registers in round-robin order, and arithmetic
+# instructions read loaded and computed registers and write their own
+# group, which keeps the traces of a given size and seed the same from one
+# benchmark run to the next. Mixed traces let loads and stores name any
+# other register as well, so that they wait on arithmetic instructions and
+# are waited on by them.
+BASE_REGS  = ["R%d" % num for num in range(0, 4)]
+LOAD_REGS  = ["F%d" % num for num in range(0, 8)]
+STORE_REGS = ["R%d" % num for num in range(4, 12)]
+ARITH_REGS = (["F%d" % num for num in range(8, 32)] +
+              ["R%d" % num for num in range(12, 32)])
+MIXED_REGS = LOAD_REGS + STORE_REGS + ARITH_REGS
+OP_WEIGHTS = (("LD", 25), ("SD", 15), ("ADDD", 20), ("SUBD", 15),
+              ("MULTD", 15), ("DIVD", 10))
+STAGES     = (("write_result", "write_result_stage"),
+              ("issue", "issue_stage"),
+              ("start_execution", "start_execution_stage"),
+              ("complete_execution", "complete_execution_stage"))
+
+
+# Yield the lines of a synthetic trace with the given number of
+# instructions, a mixed one if mixed is set. The same seed always gives the
+# same trace.
+def generate_trace(num_instrs, seed=DEFAULT_SEED, mixed=False):
+    rand = random.Random(seed)
+    ops  = [op for op, weight in OP_WEIGHTS for i in range(weight)]
+    sources = LOAD_REGS + ARITH_REGS
+    num_loads = num_stores = 0
+    for i in range(num_instrs):
+        op = rand.choice(ops)
+        if op == "LD":
+            if mixed: dest = rand.choice(MIXED_REGS)
+            else:     dest = LOAD_REGS[num_loads % len(LOAD_REGS)]
+            yield "LD %s %d+ %s" % (dest, rand.randint(0, 99),
+                                    rand.choice(BASE_REGS))
+            num_loads += 1
+        elif op == "SD":
+            if mixed: dest = rand.choice(MIXED_REGS)
+            else:     dest = STORE_REGS[num_stores % len(STORE_REGS)]
+            yield "SD %s %d+ %s" % (dest, rand.randint(0, 99),
+                                    rand.choice(BASE_REGS))
+            num_stores += 1
+        else:
+            if op == "DIVD": operand2 = rand.choice(BASE_REGS)
+            else:            operand2 = rand.choice(sources + BASE_REGS)
+            yield "%s %s %s %s" % (op, rand.choice(ARITH_REGS),
+                                   rand.choice(sources), operand2)
+
+
+# Write a synthetic trace to the given file.
+def write_trace(filename, num_instrs, seed=DEFAULT_SEED, mixed=False):
+    with open(filename, 'w') as fp:
+        for line in generate_trace(num_instrs, seed, mixed):
+            fp.write(line + "\n")
+
+
+# Peak resident set size of this process, in bytes.
+def peak_rss():
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin": return usage
+    return usage*1024
+
+
+# Run the trace through run_tomasulo_sim, discarding its output. Returns
+# the wall time and number of simulated cycles.
+def run_end_to_end(filename, event_driven=False):
+    start = time.perf_counter()
+    result = ts.run_tomasulo_sim(filename, event_driven,
+                                 writer=ow.NullWriter())
+    return time.perf_counter() - start, result.clock_cycle
+
+
+# Run the trace through run_simulation with the block functions of the
+# simulator replaced by timed wrappers (see profiling.py), so that the
+# blocks are timed inside the real simulation loop. Returns the wall time,
+# number of simulated cycles and a dictionary from block name to its total
+# time and number of calls.
+def run_stages(filename, event_driven=False):
+    profiler = prof.Profiler()
+    for name, func_name in STAGES:
+        profiler.patch(ts, func_name)
+    try:
+        start = time.perf_counter()
+        state = ts.run_simulation(filename, event_driven=event_driven)
+        wall_time = time.perf_counter() - start
+    finally:
+        profiler.unpatch()
+    stages = {}
+    for name, func_name in STAGES:
+        calls, seconds = profiler.stats.get(func_name, (0, 0.0))
+        stages[name] = {"seconds": seconds, "calls": calls}
+    return wall_time, state.clock_cycle, stages
+
+
+# Benchmark one trace size. This runs in a fresh worker process so that
+# the peak RSS belongs to this size alone. The best of repeat runs is kept.
+def run_benchmark(args):
+    num_instrs, seed, repeat, event_driven = args
+    fd, filename = tempfile.mkstemp(suffix=".txt", prefix="tomasulo_bench_")
+    os.close(fd)
+    try:
+        write_trace(filename, num_instrs, seed)
+        wall_time = stage_time = None
+        for i in range(repeat):
+            seconds, cycles = run_end_to_end(filename, event_driven)
+            if wall_time is None or seconds < wall_time: wall_time = seconds
+            seconds, stage_cycles, run = run_stages(filename, event_driven)
+            if stage_cycles != cycles:
+                raise RuntimeError("Stage-timed run took %d cycles instead "
+                                   "of %d!" % (stage_cycles, cycles))
+            if stage_time is None or seconds < stage_time:
+                stage_time, stages = seconds, run
+    finally:
+        os.remove(filename)
+
+    return {"num_instructions": num_instrs,
+            "total_cycles":     cycles,
+            "wall_seconds":     wall_time,
+            "cycles_per_second": cycles/wall_time if wall_time else None,
+            "ns_per_instruction": 1e9*wall_time/num_instrs,
+            "peak_rss_bytes":   peak_rss(),
+            "stage_wall_seconds": stage_time,
+            "stages":           stages}
+
+
+# Add the scaling exponent of the wall time between each size and the
+# previous one: 1.0 for linear growth, 2.0 for quadratic, etc.
+def add_scaling(results):
+    prev = None
+    for result in results:
+        result["scaling_exponent"] = None
+        if prev is not None and prev["wall_seconds"] > 0:
+            size_ratio = result["num_instructions"]/prev["num_instructions"]
+            time_ratio = result["wall_seconds"]/prev["wall_seconds"]
+            if size_ratio > 1 and time_ratio > 0:
+                result["scaling_exponent"] = (math.log(time_ratio) /
+                                              math.log(size_ratio))
+        prev = result
+    return results
+
+
+# Run the whole suite and return the report.
+def run_suite(sizes=DEFAULT_SIZES, seed=DEFAULT_SEED, repeat=1,
+              event_driven=False):
+    results = []
+    for num_instrs in sorted(sizes):
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            results.append(executor.submit(run_benchmark,
+                                           (num_instrs, seed, repeat,
+                                            event_driven)).result())
+    return {"python": platform.python_version(),
+            "machine": platform.machine(),
+            "seed": seed,
+            "repeat": repeat,
+            "event_driven": event_driven,
+            "results": add_scaling(results)}
+
+
+# Compare a report against a baseline report. Returns a list of messages,
+# one for every size whose cycles per second dropped by more than the
+# tolerance (a fraction) or whose number of simulated cycles changed.
+def find_regressions(report, baseline, tolerance=DEFAULT_TOLERANCE):
+    messages = []
+    base_results = {result["num_instructions"]: result
+                    for result in baseline["results"]}
+    for result in report["results"]:
+        base = base_results.get(result["num_instructions"])
+        if base is None: continue
+        if result["total_cycles"] != base["total_cycles"]:
+            messages.append("%d instructions: %d simulated cycles, baseline "
+                            "%d" % (result["num_instructions"],
+                                    result["total_cycles"],
+                                    base["total_cycles"]))
+        if (base["cycles_per_second"] and
+            result["cycles_per_second"] <
+            (1 - tolerance)*base["cycles_per_second"]):
+            messages.append("%d instructions: %.0f cycles/s, baseline %.0f" %
+                            (result["num_instructions"],
+                             result["cycles_per_second"],
+                             base["cycles_per_second"]))
+    return messages
+
+
+# Print a table of the report.
+def print_report(report, fp=sys.stdout):
+    fp.write("%10s %10s %10s %12s %10s %10s %8s\n" %
+             ("Instrs", "Cycles", "Wall (s)", "Cycles/s", "ns/Instr",
+              "RSS (MB)", "Scaling"))
+    for result in report["results"]:
+        scaling = result["scaling_exponent"]
+        fp.write("%10d %10d %10.4f %12.0f %10.0f %10.1f %8s\n" %
+                 (result["num_instructions"], result["total_cycles"],
+                  result["wall_seconds"], result["cycles_per_second"] or 0,
+                  result["ns_per_instruction"],
+                  result["peak_rss_bytes"]/2.0**20,
+                  "-" if scaling is None else "%.2f" % scaling))
+        fp.write("%10s" % "")
+        fp.write("  ".join("%s %.4fs" % (name, result["stages"][name]
+                                         ["seconds"])
+                           for name, func_name in STAGES) + "\n")
+
+
+# Main block: run the suite, print a table and optionally write the JSON
+# report and compare it against a baseline report. Exits with status 1 if
+# a regression was found.
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the simulator")
+    parser.add_argument("--sizes", type=mc.int_list, default=DEFAULT_SIZES,
+                        help="Comma separated trace sizes")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--repeat", type=int, default=1,
+                        help="Keep the best of this many runs")
+    parser.add_argument("--event-driven", action="store_true")
+    parser.add_argument("--output", default=None,
+                        help="File for the JSON report")
+    parser.add_argument("--baseline", default=None,
+                        help="JSON report to compare against")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args()
+
+    report = run_suite(args.sizes, args.seed, args.repeat, args.event_driven)
+    print_report(report)
+    if args.output is not None:
+        with open(args.output, 'w') as fp:
+            json.dump(report, fp, indent=2)
+
+    if args.baseline is not None:
+        with open(args.baseline, 'r') as fp:
+            baseline = json.load(fp)
+        regressions = find_regressions(report, baseline, args.tolerance)
+        for message in regressions:
+            print("REGRESSION: " + message)
+        if regressions: sys.exit(1)
@@ -0,0 +1,188 @@
+#!/usr/env/python
+# This module implements a compact, pre-decoded binary format for 
+# instruction traces, a converter from the text format read by
+# instruction_reader.py and a loader that memory-maps a binary trace and
+# decodes its records on demand. Converting a trace once lets repeated
+# runs skip tokenizing and parsing the text entirely.
+#
+# A binary trace starts with a 16 byte header: the magic bytes followed 
+# by the number of records as an unsigned 64-bit integer. The magic bytes
+# are "TOMTRC" followed by a two digit version; a trace of another version
+# is still recognised as binary but is refused when opened, since its
+# records would be decoded wrongly. Each record is 16 bytes, little-endian:
+#   opcode (u8), operand1 kind (u8), operand2 kind (u8), padding (1 byte),
+#   destination register id (u16), padding (2 bytes),
+#   operand1 value (i32), operand2 value (i32)
+# An operand's value is either a register id (see register_file.py) or an
+# immediate, depending on its kind.
+
+
+import os
+import sys
+import mmap
+import struct
+import instruction_reader as ir
+
+
+TRACE_MAGIC   = b"TOMTRC02" # 02: register ids interleave the banks
+TRACE_PREFIX  = TRACE_MAGIC[:6] # Shared by every version of the format
+HEADER_FORMAT = struct.Struct("<8sQ")
+RECORD_FORMAT = struct.Struct("<BBBxHxxii")
+OPCODES       = ("LD", "SD", "ADDD", "SUBD", "MULTD", "DIVD")
+OPERAND_REG   = 0 # Operand value is a register id
+OPERAND_IMM   = 1 # Operand value is an immediate
+
+
+# Encode an operand of an Instruction, given with its register id (None
+# for an immediate), as a (kind, value) pair. Immediate operands have
+# already been parsed to ints by the Instruction.
+def encode_operand(operand, operand_id):
+    if operand_id is None: return (OPERAND_IMM, operand)
+    return (OPERAND_REG, operand_id)
+
+
+# Decode a (kind, value) pair back into the register id and the immediate
+# value of an Instruction operand, one of which is None.
+def decode_operand(kind, value):
+    if kind == OPERAND_IMM: return (None, value)
+    elif kind == OPERAND_REG:
+        if value < 0:
+            raise ValueError("Invalid register id %d in binary trace!" % 
+                             value)
+        return (value, None)
+    else: raise ValueError("Invalid operand kind %d in binary trace!" % kind)
+
+
+# Pack an Instruction into a binary trace record.
+def encode_instruction(instr):
+    try:
+        opcode = OPCODES.index(instr.operation)
+    except ValueError:
+        raise ValueError("Invalid instruction operation: %s" % 
+                         str(instr.operation))
+    (kind1, value1) = encode_operand(instr.operand1, instr.operand1_id)
+    (kind2, value2) = encode_operand(instr.operand2, instr.operand2_id)
+    return RECORD_FORMAT.pack(opcode, kind1, kind2, instr.dest_id,
+                              value1, value2)
+
+
+# Unpack the record at the given offset of the buffer into an Instruction
+# with the given index. The register ids are used as they are, without
+# going through register names.
+def decode_instruction(buf, offset, idx):
+    (opcode, kind1, kind2, dest, 
+     value1, value2) = RECORD_FORMAT.unpack_from(buf, offset)
+    (operand1_id, operand1) = decode_operand(kind1, value1)
+    (operand2_id, operand2) = decode_operand(kind2, value2)
+    return ir.Instruction.from_ids(OPCODES[opcode], dest, operand1_id,
+                                   operand2_id, idx, operand1, operand2)
+
+
+# Determine if the given file is a binary trace, of any version, by checking
+# the start of its magic bytes.
+def is_binary_trace(filename):
+    try:
+        with open(filename, 'rb') as fp:
+            return fp.read(len(TRACE_PREFIX)) == TRACE_PREFIX
+    except (IOError, OSError):
+        return False
+
+
+# Convert a text trace into a binary trace. The text file is decoded one
+# instruction at a time and records are written through a buffered file,
+# so traces of any length can be converted. Returns the number of records.
+def convert_text_trace(text_filename, binary_filename):
+    count = 0
+    with open(binary_filename, 'wb') as fp:
+        fp.write(HEADER_FORMAT.pack(TRACE_MAGIC, 0))
+        for instr in ir.iter_instructions(text_filename):
+            fp.write(encode_instruction(instr))
+            count += 1
+        fp.seek(0)
+        fp.write(HEADER_FORMAT.pack(TRACE_MAGIC, count))
+
+    return count
+
+
+# A BinaryTrace memory-maps a binary trace file. Records are only decoded
+# into Instruction objects when they are accessed, either by index or by
+# iterating over the trace, so only the pages actually touched are read.
+class BinaryTrace:
+    def __init__(self, filename):
+        self._filename = filename
+        self._fp       = open(filename, 'rb')
+        try:
+            self._buf = mmap.mmap(self._fp.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._fp.close()
+            raise ValueError("%s is not a binary trace!" % filename)
+        if len(self._buf) < HEADER_FORMAT.size:
+            self.close()
+            raise ValueError("%s is not a binary trace!" % filename)
+        (magic, count) = HEADER_FORMAT.unpack_from(self._buf, 0)
+        if magic != TRACE_MAGIC:
+            self.close()
+            if magic.startswith(TRACE_PREFIX):
+                raise ValueError("%s: unsupported binary trace version, "
+                                 "regenerate with binary_trace.py" % filename)
+            raise ValueError("%s is not a binary trace!" % filename)
+        if len(self._buf) < HEADER_FORMAT.size + count*RECORD_FORMAT.size:
+            self.close()
+            raise ValueError("Binary trace %s is truncated!" % filename)
+        self._num_records = count
+
+    @property
+    def filename(self):
+        return self._filename
+
+    def __len__(self):
+        return self._num_records
+
+    def __getitem__(self, idx):
+        if idx < 0: idx += self._num_records
+        if not (0 <= idx < self._num_records):
+            raise IndexError("Record %d is out of range for the trace!" % idx)
+        return decode_instruction(self._buf, 
+                                  HEADER_FORMAT.size + idx*RECORD_FORMAT.size,
+                                  idx)
+
+    def __iter__(self):
+        offset = HEADER_FORMAT.size
+        for idx in range(self._num_records):
+            yield decode_instruction(self._buf, offset, idx)
+            offset += RECORD_FORMAT.size
+
+    def close(self):
+        if getattr(self, "_buf", None) is not None:
+            self._buf.close()
+            self._buf = None
+        self._fp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+# Lazily decode the instructions of a binary trace in program order,
+# starting with the record at index 'start'. The file is unmapped once the
+# generator is exhausted or closed.
+def iter_binary_instructions(filename, start=0):
+    with BinaryTrace(filename) as trace:
+        if start == 0:
+            for instr in trace:
+                yield instr
+        else:
+            for idx in range(start, len(trace)):
+                yield trace[idx]
+
+
+# Convert a text trace to a binary trace from the command line:
+#   python binary_trace.py input.txt output.trc
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print("Usage: python binary_trace.py <text trace> <binary trace>")
+        sys.exit(1)
+    num_records = convert_text_trace(sys.argv[1], sys.argv[2])
+    print("Wrote %d records to %s" % (num_records, sys.argv[2]))
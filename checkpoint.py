@@ -0,0 +1,157 @@
+#!/usr/env/python
+# This module saves the complete state of a running simulation to a file
+# and restores it, possibly in a fresh process, so that the simulation can
+# be resumed with the same results as if it had never stopped. Besides the
+# SimulatorState, the state of a simulation lives in module-level objects:
+# the reservation stations and functional units, the index of stations
+# waiting on each tag, the instruction latencies and the issue width. All
+# of them are pickled together, so objects shared between them (e.g. an
+# Instruction held by a station, a functional unit and the CDB queue) are
+# still shared after loading. A checkpoint file is the magic string
+# followed by the compressed pickle.
+# The instruction stream is not pickled: for a trace file, the file's name
+# and the number of instructions already taken are saved and the file is
+# reopened past them on loading; for a list (or any other iterable) of
+# instructions, the instructions still left in the stream are saved.
+
+
+import io
+import os
+import zlib
+import pickle
+import binary_trace as bt
+import instruction_reader as ir
+import reservation_stations as rs
+import functional_units as fu
+
+
+CHECKPOINT_MAGIC  = b"TOMCKP04" # 04: instructions name registers lazily
+COMPRESSION_LEVEL = 6 # zlib level of the pickled snapshot
+
+
+# The size and modification time of a trace file, used to refuse to resume
+# from a checkpoint whose trace has changed since it was taken.
+def trace_fingerprint(filename):
+    if filename is None: filename = ir.DEFAULT_INPUT_FILE
+    info = os.stat(filename)
+    return (info.st_size, info.st_mtime_ns)
+
+
+# True if the simulation reads its instructions from a trace file rather
+# than from a list of instructions.
+def reads_trace_file(source):
+    return source is None or isinstance(source, str)
+
+
+# Open a stream over the given trace file, past the first num_taken
+# instructions.
+def reopen_trace(source, num_taken, lookahead):
+    if source is not None and bt.is_binary_trace(source):
+        instructions = bt.iter_binary_instructions(source, num_taken)
+    else:
+        instructions = ir.iter_instructions(source, num_taken)
+    return ir.InstructionStream(instructions, lookahead, num_taken)
+
+
+# Pickles the snapshot, saving the instruction stream of the state by
+# reference (see persistent_id) instead of by value. When the instructions
+# come from a list, the list the state was created with is replaced by the
+# instructions left in the stream.
+class CheckpointPickler(pickle.Pickler):
+    def __init__(self, fp, state):
+        pickle.Pickler.__init__(self, fp, pickle.HIGHEST_PROTOCOL)
+        self._state     = state
+        self._remaining = None
+        if not reads_trace_file(state.source):
+            self._remaining = state.instr_source.remaining()
+
+    def persistent_id(self, obj):
+        state = self._state
+        if obj is state.instr_source:
+            stream = state.instr_source
+            if self._remaining is None:
+                return ("trace", state.source, 
+                        trace_fingerprint(state.source), stream.num_taken,
+                        stream.lookahead)
+            return ("instructions", self._remaining, stream.num_taken,
+                    stream.lookahead)
+        if self._remaining is not None and obj is state.source:
+            return ("source", self._remaining)
+        return None
+
+
+# Unpickles a snapshot, reopening the instruction stream it refers to. A
+# state saved by the simulator running as the main script refers to the
+# SimulatorState class of __main__, which is looked up in tomasulo_sim.
+class CheckpointUnpickler(pickle.Unpickler):
+    def find_class(self, module, name):
+        if module == "__main__" and name == "SimulatorState":
+            module = "tomasulo_sim"
+        return pickle.Unpickler.find_class(self, module, name)
+
+    def persistent_load(self, pid):
+        if pid[0] == "trace":
+            (kind, source, fingerprint, num_taken, lookahead) = pid
+            if trace_fingerprint(source) != fingerprint:
+                raise ValueError("Trace %s has changed since the checkpoint "
+                                 "was taken!" %
+                                 (source or ir.DEFAULT_INPUT_FILE))
+            return reopen_trace(source, num_taken, lookahead)
+        if pid[0] == "instructions":
+            (kind, instructions, num_taken, lookahead) = pid
+            return ir.InstructionStream(instructions, lookahead, num_taken)
+        if pid[0] == "source":
+            return pid[1]
+        raise pickle.UnpicklingError("Unknown reference in checkpoint: %r" %
+                                     (pid,))
+
+
+# Write the given SimulatorState, along with the module-level state it
+# depends on, to the given file. The file is written under a temporary name
+# and then renamed, so an interrupted save never leaves a partial
+# checkpoint behind.
+def save_checkpoint(state, filename):
+    snapshot = {"latencies":     dict(ir.latencies),
+                "issue_width":   ir.issue_width,
+                "stations":      (rs.load_rs, rs.store_rs, rs.add_rs,
+                                  rs.mult_rs),
+                "units":         (fu.load_fu, fu.store_fu, fu.add_fu,
+                                  fu.mult_fu),
+                "tag_consumers": rs.tag_consumers,
+                "state":         state}
+    buf = io.BytesIO()
+    CheckpointPickler(buf, state).dump(snapshot)
+    data = zlib.compress(buf.getvalue(), COMPRESSION_LEVEL)
+
+    tmp_filename = filename + ".tmp"
+    with open(tmp_filename, 'wb') as fp:
+        fp.write(CHECKPOINT_MAGIC)
+        fp.write(data)
+    os.replace(tmp_filename, filename)
+
+
+# Read a checkpoint written by save_checkpoint, restore the module-level
+# state of the simulator from it and return the SimulatorState, which can
+# be passed to advance_simulation to carry on from the saved clock cycle.
+def load_checkpoint(filename):
+    with open(filename, 'rb') as fp:
+        magic = fp.read(len(CHECKPOINT_MAGIC))
+        if magic[:6] == CHECKPOINT_MAGIC[:6] and magic != CHECKPOINT_MAGIC:
+            raise ValueError("Checkpoint %s was written by another version "
+                             "of the simulator!" % filename)
+        if magic != CHECKPOINT_MAGIC:
+            raise ValueError("%s is not a checkpoint!" % filename)
+        data = fp.read()
+    try:
+        data = zlib.decompress(data)
+    except zlib.error:
+        raise ValueError("Checkpoint %s is corrupt!" % filename)
+    snapshot = CheckpointUnpickler(io.BytesIO(data)).load()
+
+    ir.latencies.update(snapshot["latencies"])
+    ir.set_issue_width(snapshot["issue_width"])
+    (rs.load_rs, rs.store_rs, rs.add_rs, rs.mult_rs) = snapshot["stations"]
+    (fu.load_fu, fu.store_fu, fu.add_fu, fu.mult_fu) = snapshot["units"]
+    rs.reset_tag_consumers()
+    rs.tag_consumers.update(snapshot["tag_consumers"])
+    return snapshot["state"]
@@ -0,0 +1,254 @@
+#!/usr/env/python
+# This module models the data memory read by LD and written by SD. It is
+# off by default, in which case a load or store only passes the value of
+# its register through, as the simulator was written.
+# The address of a load or store is the sum of its two operands, the
+# offset and the base register in e.g. "LD F6 34+ R2". Memory is addressed
+# by word, each word holding one double like a register, and words that
+# were never stored to hold DEFAULT_MEMORY_VALUE, the value registers start
+# with, so that loaded values can be divided by. The image the memory
+# starts from is either empty (SparseImage) or a file of little-endian
+# doubles, word 0 first, that is mapped into memory rather than read
+# (MappedImage), so only the words that are touched are ever loaded. Words
+# that are stored to are kept apart from the file, which is never written.
+# Loads and stores go through a load/store queue (DataMemory) in program
+# order. A store's address and data are known once it starts executing,
+# and it is written to the image when it has written its result and every
+# older load and store has left the queue, so the image only ever holds
+# the stores older than the oldest load still waiting to read. A load can
+# only start once every older store has started, so its address can be
+# told apart from theirs (disambiguation); it then takes the data of the
+# youngest older store to the same address still in the queue (store-to-
+# load forwarding), or reads the image.
+
+
+import os
+import math
+import mmap
+import struct
+import register_file as rf
+from collections import deque
+
+
+DEFAULT_MEMORY_VALUE = float(rf.DEFAULT_REG_VALUE)
+WORD_FORMAT = "<d" # Format of a word in a memory image file
+WORD_SIZE   = struct.calcsize(WORD_FORMAT)
+
+
+# The word address given by an offset and a base. Raises a ValueError if
+# it is not a non-negative integer.
+def effective_address(offset, base):
+    address = offset + base
+    if (not math.isfinite(address) or address < 0 or
+        address != int(address)):
+        raise ValueError("Invalid memory address: %r" % (address,))
+    return int(address)
+
+
+# A memory image in which every word starts with the default value. Only
+# the words that have been stored to are kept.
+class SparseImage:
+    def __init__(self):
+        self._stored = {}
+
+    @property
+    def stored(self):
+        return self._stored
+
+    # The file the image starts from, None for an empty image.
+    @property
+    def filename(self):
+        return None
+
+    def read(self, address):
+        return self._stored.get(address, DEFAULT_MEMORY_VALUE)
+
+    def write(self, address, value):
+        self._stored[address] = value
+
+
+# A memory image that starts with the words of the given file, mapped
+# read-only. Words past the end of the file hold the default value. A
+# pickled image (e.g. in a checkpoint) refers to the file, which is mapped
+# again when it is unpickled, along with the words stored so far.
+class MappedImage(SparseImage):
+    def __init__(self, filename):
+        SparseImage.__init__(self)
+        self._filename = filename
+        self.open_image()
+
+    @property
+    def filename(self):
+        return self._filename
+
+    @property
+    def num_words(self):
+        return self._num_words
+
+    def open_image(self):
+        info = os.stat(self._filename)
+        self._fingerprint = (info.st_size, info.st_mtime_ns)
+        self._num_words   = info.st_size // WORD_SIZE
+        self._map         = None
+        if self._num_words:
+            with open(self._filename, 'rb') as fp:
+                self._map = mmap.mmap(fp.fileno(), 0,
+                                      access=mmap.ACCESS_READ)
+
+    def read(self, address):
+        value = self._stored.get(address)
+        if value is not None:
+            return value
+        if address >= self._num_words:
+            return DEFAULT_MEMORY_VALUE
+        return struct.unpack_from(WORD_FORMAT, self._map,
+                                  address*WORD_SIZE)[0]
+
+    def __getstate__(self):
+        return {"filename": self._filename, "fingerprint": self._fingerprint,
+                "stored": self._stored}
+
+    def __setstate__(self, saved):
+        self._filename = saved["filename"]
+        self._stored   = saved["stored"]
+        self.open_image()
+        if self._fingerprint != saved["fingerprint"]:
+            raise ValueError("Memory image %s has changed since it was "
+                             "saved!" % self._filename)
+
+
+# Open the memory image in the given file, or an empty one if no file is
+# given.
+def open_image(filename=None):
+    if filename is None: return SparseImage()
+    return MappedImage(filename)
+
+
+# A load or store in the load/store queue. The address is known once the
+# instruction starts executing, along with the data of a store; the value
+# of a load is the one it read. A load is done once it has read, a store
+# once it has written its result.
+class MemoryAccess:
+    __slots__ = ("instr_index", "is_store", "address", "value", "done")
+
+    def __init__(self, instr_index, is_store):
+        self.instr_index = instr_index
+        self.is_store    = is_store
+        self.address     = None
+        self.value       = None
+        self.done        = False
+
+
+# The data memory of a simulation: a memory image behind a load/store queue
+# holding the loads and stores that have been issued and not yet left it,
+# in program order. The stores in the queue that have started are also
+# indexed by address for forwarding.
+class DataMemory:
+    def __init__(self, image=None):
+        if image is None: image = SparseImage()
+        self._image       = image
+        self._queue       = deque()
+        self._accesses    = {}
+        self._by_address  = {}
+        self._unstarted   = set()
+
+    @property
+    def image(self):
+        return self._image
+
+    def __len__(self):
+        return len(self._queue)
+
+    # Called when a load or store issues, in program order.
+    def issue(self, instr):
+        is_store = instr.operation == "SD"
+        access   = MemoryAccess(instr.instr_index, is_store)
+        self._queue.append(access)
+        self._accesses[instr.instr_index] = access
+        if is_store: self._unstarted.add(instr.instr_index)
+
+    # A load can start once every older store has started, so that its
+    # address is known. Anything else can always start.
+    def can_start(self, instr):
+        if instr.operation != "LD" or not self._unstarted:
+            return True
+        return min(self._unstarted) > instr.instr_index
+
+    # Called when a load or store from the given station starts executing:
+    # a store takes its address and the data in its register, a load takes
+    # its address and reads its value.
+    def start(self, instr, station, reg_file):
+        access = self._accesses.get(instr.instr_index)
+        if access is None:
+            return
+        access.address = effective_address(station.vj, station.vk)
+        if access.is_store:
+            access.value = reg_file.values[station.dest]
+            self._unstarted.discard(access.instr_index)
+            stores = self._by_address.get(access.address)
+            if stores is None: self._by_address[access.address] = [access]
+            else:              stores.append(access)
+            return
+
+        access.value = self.read(access.address, access.instr_index)
+        access.done  = True
+        self.drain()
+
+    # The value a load at the given address reads: that of the youngest
+    # store older than it to the same address still in the queue, if any,
+    # or the image's.
+    def read(self, address, instr_index):
+        forward = None
+        for store in self._by_address.get(address, ()):
+            if (store.instr_index < instr_index and
+                (forward is None or store.instr_index > forward.instr_index)):
+                forward = store
+        if forward is not None:
+            return forward.value
+        return self._image.read(address)
+
+    # Called when a load or store writes its result, with the value it
+    # would write without a data memory. Returns the value that is written
+    # to its register: the value read by a load, or the given one.
+    def write_result(self, instr, value):
+        access = self._accesses.get(instr.instr_index)
+        if access is None:
+            return value
+        if access.is_store:
+            access.done = True
+            self.drain()
+            return value
+        del self._accesses[instr.instr_index]
+        return access.value
+
+    # Take the accesses that are done off the head of the queue, writing
+    # stores to the image. A load is still looked up by its write_result
+    # after it has left the queue.
+    def drain(self):
+        queue = self._queue
+        while queue and queue[0].done:
+            access = queue.popleft()
+            if not access.is_store:
+                continue
+            del self._accesses[access.instr_index]
+            self._image.write(access.address, access.value)
+            stores = self._by_address[access.address]
+            stores.remove(access)
+            if not stores: del self._by_address[access.address]
+
+    # Apply a load or store in program order, without timing (see
+    # functional.py), given the values of its operands. Returns the value
+    # of its register afterwards, which is given for a store.
+    def execute(self, instr, vj, vk, value):
+        address = effective_address(vj, vk)
+        if instr.operation == "SD":
+            self._image.write(address, value)
+            return value
+        return self._image.read(address)
+
+
+# Write the words that were stored to the image, as "address value" lines
+# in increasing order of address.
+def write_stored_words(image, fp):
+    for address in sorted(image.stored):
+        fp.write("%d %r\n" % (address, image.stored[address]))
@@ -0,0 +1,78 @@
+#!/usr/env/python
+# This module executes instructions in functional-only mode: each
+# instruction is applied directly to the register file in program order,
+# without reservation stations, functional units, the CDB or any notion of
+# time. The value an instruction writes is computed by execute_station_op,
+# the same operation semantics the Write-Result block uses, from a scratch
+# Station filled in as if every operand were available at issue. With a
+# data memory (see data_memory.py), loads and stores read and write its
+# image in program order. The final register file can be used as an oracle
+# for the one left by the timing model, with one known difference: the
+# timing model gives a reader the value of the oldest write in flight to a
+# register (the first of its tags, see register_file.py), so a register
+# read while two or more writes to it are in flight, e.g. "DIVD F2 R0 R1",
+# "ADDD F2 R0 R1", "ADDD F4 F2 R1", gets the value of the older write where
+# this mode gives it the latest.
+
+
+import register_file as rf
+import reservation_stations as rs
+
+
+# Apply the architectural effect of the given instruction to the register
+# file through execute_station_op, and to the data memory if one is given.
+# The given scratch Station is filled in with the instruction's operation
+# and operand values the way populate_rs would when every operand is
+# available.
+def execute_instruction(instr, reg_file, station, memory=None):
+    values = reg_file.values
+    station.operation = instr.operation
+    station.dest      = instr.dest_id
+    if instr.operand1_id is None: station.vj = instr.operand1
+    else:                         station.vj = values[instr.operand1_id]
+    if instr.operand2_id is None: station.vk = instr.operand2
+    else:                         station.vk = values[instr.operand2_id]
+    value = rs.execute_station_op(station, reg_file)
+    if memory is not None and (instr.operation == "LD" or
+                               instr.operation == "SD"):
+        value = memory.execute(instr, station.vj, station.vk, value)
+    values[instr.dest_id] = value
+
+
+# Take up to num_instrs instructions from the stream (all of them if not
+# given), applying each to the register file. Returns the number of
+# instructions taken.
+def fast_forward(instr_source, reg_file, num_instrs=None, station=None,
+                 memory=None):
+    if station is None: station = rs.Station()
+    advance   = instr_source.advance
+    num_taken = 0
+    while num_instrs is None or num_taken < num_instrs:
+        instr = advance()
+        if instr is None: break
+        execute_instruction(instr, reg_file, station, memory)
+        num_taken += 1
+    return num_taken
+
+
+# Execute every instruction of the stream on the given register file (a
+# new one holding the default values if none is given) and data memory, if
+# given, and return the register file.
+def run_instructions(instr_source, reg_file=None, memory=None):
+    if reg_file is None: reg_file = rf.create_register_file()
+    fast_forward(instr_source, reg_file, memory=memory)
+    return reg_file
+
+
+# Compare the values of a register file against the expected ones, e.g.
+# those of the functional-only mode. Returns a list of (register name,
+# value, expected value) for every register that differs. Registers that
+# are NaN in both match.
+def compare_registers(reg_file, expected):
+    expected_values = dict(rf.register_values(expected))
+    mismatches      = []
+    for name, value in rf.register_values(reg_file):
+        exp = expected_values[name]
+        if value != exp and not (value != value and exp != exp):
+            mismatches.append((name, value, exp))
+    return mismatches
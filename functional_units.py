@@ -4,6 +4,7 @@
 # and store/load buffers. Both are treated as functional units.
 # The arithmetic functional unit can only hold one instruction, 
 # and the number of 'slots' in the buffer is set to 3 by default.
+# Several (or pipelined) arithmetic units are grouped in a pool.
 # No functions are implemented in this file, only methods that
 # correspond to the FunctionalUnit and LoadStoreBuffer object classes.
 # Some functions use the same name for the different classes - this
@@ -18,6 +19,18 @@ import time
 
 NUM_LOAD_SLOTS  = 3 # Default for load buffer
 NUM_STORE_SLOTS = 3 # Default for store buffer
+NUM_ARITH_UNITS = 1 # Default number of add and mult units
+INITIATION_INTERVAL = 0 # Default add/mult initiation interval, 0: unpipelined
+
+
+# Return the positions of the bits set in the given bitmap, lowest first.
+def set_bits(mask):
+    bits = []
+    while mask:
+        low = mask & -mask
+        bits.append(low.bit_length() - 1)
+        mask ^= low
+    return bits
 
 
 # Only one instruction can be stored inside of a FunctionalUnit object. 
@@ -82,6 +95,11 @@ class FunctionalUnit:
         self.instr_start_time    = None
         self.rs_station_idx      = None
 
+    # The unit holds a single instruction, so it is emptied whichever 
+    # station the instruction came from.
+    def empty_station(self, stat_idx):
+        self.empty_unit()
+
     def is_occupied(self):
         if self.current_instruction is None: return False
         else: return True
@@ -106,8 +124,14 @@ class FunctionalUnit:
 # There are methods that have the same name as methods for a FunctionalUnit,
 # however their implementations are different due to the presence of a 
 # buffer slots list. Appropriate comments are given for each method.
-# Checking whether or not an instruction is complete uses the same 
-# arithmetic as seen before. 
+# Which slots are empty is kept in a bitmap (bit i set when slot i is
+# empty) along with the number of occupied slots, so finding an empty slot
+# or the occupied ones does not look at every slot. Each slot also records
+# the clock cycle its instruction finishes executing in, i.e. the cycle at
+# which the time elapsed since the start equals the instruction's latency.
+# An instruction goes into the lowest empty slot, and the slot it went into
+# is recorded by the station it came from, so that it is the slot emptied
+# when that station writes its result.
 class LoadStoreUnit():
     def __init__(self,fu_type,num_slots):
         self._fu_type      = fu_type
@@ -115,8 +139,11 @@ class LoadStoreUnit():
         self._buffer_slots = []
         for i in range(num_slots):
             blank_slot = {"Instruction":None, "Start Time":None,
-                          "Station Index": None}
+                          "Station Index": None, "Finish Time": None}
             self._buffer_slots.append(blank_slot)
+        self._empty_mask    = (1 << num_slots) - 1
+        self._num_occupied  = 0
+        self._station_slots = {}
 
     @property
     def buffer_slots(self):
@@ -130,6 +157,10 @@ class LoadStoreUnit():
     def num_slots(self):
         return self._num_slots
 
+    @property
+    def num_occupied(self):
+        return self._num_occupied
+
     def slot_is_empty(self, slot):
         if (slot["Instruction"] is None and slot["Start Time"] is None and
             slot["Station Index"] is None):
@@ -137,80 +168,195 @@ class LoadStoreUnit():
         else: 
             return False
     
+    # The lowest-numbered empty slot, or None if every slot is occupied.
     def find_empty_slot_idx(self):
-        for i in range(self.num_slots):
-            slot = self.buffer_slots[i]
-            if self.slot_is_empty(slot): return i 
-        return None
+        empty = self._empty_mask
+        if not empty: return None
+        return (empty & -empty).bit_length() - 1
+
+    # Store the instruction started at the given clock cycle from the given
+    # station in the slot at the given index.
+    def fill_slot(self, idx, instr, clock_cycle, stat_idx):
+        slot = self._buffer_slots[idx]
+        if self._station_slots.get(slot["Station Index"]) == idx:
+            del self._station_slots[slot["Station Index"]]
+        self._station_slots[stat_idx] = idx
+        slot["Instruction"]   = instr
+        slot["Start Time"]    = clock_cycle
+        slot["Station Index"] = stat_idx
+        slot["Finish Time"]   = clock_cycle + instr.latency - 1
+        bit = 1 << idx
+        if self._empty_mask & bit:
+            self._empty_mask ^= bit
+            self._num_occupied += 1
+
+    def clear_slot(self, idx):
+        slot = self._buffer_slots[idx]
+        if self._station_slots.get(slot["Station Index"]) == idx:
+            del self._station_slots[slot["Station Index"]]
+        slot["Instruction"]   = None
+        slot["Start Time"]    = None
+        slot["Station Index"] = None
+        slot["Finish Time"]   = None
+        bit = 1 << idx
+        if not (self._empty_mask & bit):
+            self._empty_mask |= bit
+            self._num_occupied -= 1
 
     # Find the next available slot and store the instruction there
     # at the current clock cycle. 
     def load_unit(self,instr,clock_cycle,stat_idx):
         idx = self.find_empty_slot_idx()
         if not(idx is None):
-            self.buffer_slots[idx]["Instruction"]   = instr
-            self.buffer_slots[idx]["Start Time"]    = clock_cycle
-            self.buffer_slots[idx]["Station Index"] = stat_idx
-
-    # Given the slot index, first check it is range, and then empty 
-    # the instruction at that slot.
-    def empty_slot(self, stat_idx):
-        if (stat_idx <= 0):
+            self.fill_slot(idx, instr, clock_cycle, stat_idx)
+
+    # Given the index of a slot, first check it is in range, and then empty
+    # the instruction in that slot.
+    def empty_slot(self, idx):
+        if not 0 <= idx < self._num_slots:
             raise ValueError("Index %d is out of range for Buffer Unit!" %
-                             (stat_idx))
-            return None
-        elif (stat_idx > self.num_slots):
-            idx = stat_idx - self.num_slots
-        else:
-            idx = stat_idx
-            
-        self.buffer_slots[idx-1]["Instruction"]   = None
-        self.buffer_slots[idx-1]["Start Time"]    = None
-        self.buffer_slots[idx-1]["Station Index"] = None
-
-    # Empty all slots in the entire load/store buffer unit.
-    def empty_unit(self,buffer_idx=None):
-        if buffer_idx is None:
-            print("Empty the entire buffer")
-            for slot in self.buffer_slots:
-                self.empty_slot(slot)
+                             (idx))
+        self.clear_slot(idx)
+
+    # Empty the slot holding the instruction that came from the given
+    # station, if any.
+    def empty_station(self, stat_idx):
+        idx = self._station_slots.get(stat_idx)
+        if idx is not None:
+            self.clear_slot(idx)
+
+    # Empty all slots in the entire load/store buffer unit, or the slot of
+    # the instruction from the given station.
+    def empty_unit(self,stat_idx=None):
+        if stat_idx is None:
+            for idx in range(self._num_slots):
+                self.clear_slot(idx)
         else:
-            self.empty_slot(buffer_idx)
+            self.empty_station(stat_idx)
 
-    # Find a slot that is not empty. If such a slot is 
-    # found return True. Otherwise return False.
+    # If at least 1 slot is not empty, return True. Otherwise False.
     def is_occupied(self):
-        for slot in self.buffer_slots:
-            if not(self.slot_is_empty(slot)): return True
-        return False
+        return self._num_occupied > 0
 
     # If at least 1 slot is empty, return True. Otherwise False.
     def is_available(self):
-        if any(self.slot_is_empty(slot) for slot in self.buffer_slots): 
-            return True
-        else:
-            return False
+        return self._empty_mask != 0
 
     # Find all the slots that are not empty and return a list
-    # of their indices.
+    # of their indices, in increasing order.
     def find_occupied_slots(self):
-        occupied_slots = []
-        for i in range(self.num_slots):
-            if not(self.slot_is_empty(self.buffer_slots[i])):
-                occupied_slots.append(i)
-        return occupied_slots
+        return set_bits(~self._empty_mask & ((1 << self._num_slots) - 1))
 
     # Clock starts from 1, not 0
-    # First find the corresponding slot and determine if the 
-    # instruction housed within that slot is finished executing.
+    # The instruction housed within the slot is finished executing in the
+    # cycle recorded when it was stored.
     def is_instr_complete(self,slot,curr_time):
-        curr_slot = None
-        instr = slot["Instruction"]
-        for i in range(self.num_slots):
-            if self.buffer_slots[i]["Instruction"] == instr:
-                curr_slot = self.buffer_slots[i]
-        exec_dur = curr_time - curr_slot["Start Time"] + 1
-        if instr.latency == exec_dur: return True
+        return slot["Finish Time"] == curr_time
+
+
+# A FunctionalUnitPool stands in for a FunctionalUnit when a class of
+# functional unit has several instances and/or is pipelined. Each instance
+# takes one instruction at a time unless an initiation interval is given,
+# in which case it accepts a new instruction every initiation_interval 
+# cycles while earlier ones are still in flight. The instructions in flight
+# are kept as slots, like those of a LoadStoreUnit, which also record the 
+# instance executing them, so the simulator's loop handles a pool the same
+# way it handles a buffer. An instruction leaves the pool when the station
+# it came from writes its result.
+# Whether a pipelined instance can accept an instruction depends on the 
+# current clock cycle, which the simulator sets every cycle.
+class FunctionalUnitPool():
+    def __init__(self,fu_type,num_units,initiation_interval=None):
+        if num_units < 1:
+            raise ValueError("A functional unit pool needs at least 1 unit!")
+        if initiation_interval is not None and initiation_interval < 1:
+            raise ValueError("Initiation interval must be at least 1 cycle!")
+        self._fu_type             = fu_type
+        self._num_units           = num_units
+        self._initiation_interval = initiation_interval
+        self._buffer_slots        = []
+        self._clock_cycle         = 0
+
+    @property
+    def fu_type(self):
+        return self._fu_type
+
+    @property
+    def num_units(self):
+        return self._num_units
+
+    @property
+    def initiation_interval(self):
+        return self._initiation_interval
+
+    @property
+    def pipelined(self):
+        return self._initiation_interval is not None
+
+    @property
+    def buffer_slots(self):
+        return self._buffer_slots
+
+    @property
+    def num_slots(self):
+        return len(self._buffer_slots)
+
+    @property
+    def clock_cycle(self):
+        return self._clock_cycle
+
+    @clock_cycle.setter
+    def clock_cycle(self,clock_cycle):
+        self._clock_cycle = clock_cycle
+
+    # An instance is free if it holds no instruction or, when pipelined,
+    # if its last instruction started at least one initiation interval ago.
+    def is_unit_free(self, unit):
+        for slot in self._buffer_slots:
+            if slot["Unit"] != unit: continue
+            if not self.pipelined: return False
+            if (self._clock_cycle - slot["Start Time"] < 
+                self._initiation_interval):
+                return False
+        return True
+
+    def find_free_unit(self):
+        for unit in range(self._num_units):
+            if self.is_unit_free(unit): return unit
+        return None
+
+    # Start the instruction on the lowest-numbered free instance.
+    def load_unit(self,instr,clock_cycle,stat_idx):
+        unit = self.find_free_unit()
+        if not(unit is None):
+            self._buffer_slots.append({"Instruction": instr,
+                                       "Start Time": clock_cycle,
+                                       "Station Index": stat_idx,
+                                       "Unit": unit})
+
+    # Remove the instruction that came from the given station.
+    def empty_station(self, stat_idx):
+        for i in range(len(self._buffer_slots)):
+            if self._buffer_slots[i]["Station Index"] == stat_idx:
+                del self._buffer_slots[i]
+                return
+
+    def empty_unit(self,idx=None):
+        if idx is None: self._buffer_slots = []
+        else:           self.empty_station(idx)
+
+    def is_occupied(self):
+        return len(self._buffer_slots) > 0
+
+    def is_available(self):
+        return self.find_free_unit() is not None
+
+    def find_occupied_slots(self):
+        return list(range(len(self._buffer_slots)))
+
+    def is_instr_complete(self,slot,curr_time):
+        exec_dur = curr_time - slot["Start Time"] + 1
+        if slot["Instruction"].latency == exec_dur: return True
         else: return False
 
 
@@ -220,3 +366,33 @@ load_fu  = LoadStoreUnit("load", NUM_LOAD_SLOTS)
 store_fu = LoadStoreUnit("store", NUM_STORE_SLOTS)
 add_fu   = FunctionalUnit("add")
 mult_fu  = FunctionalUnit("mult")
+
+
+# Create the add or mult functional unit: a single FunctionalUnit, as the
+# simulator was written with, or a FunctionalUnitPool if there are several 
+# instances or they are pipelined (an initiation interval of 0 means not
+# pipelined).
+def create_arith_unit(fu_type, num_units=NUM_ARITH_UNITS,
+                      initiation_interval=INITIATION_INTERVAL):
+    if num_units == 1 and not initiation_interval:
+        return FunctionalUnit(fu_type)
+    return FunctionalUnitPool(fu_type, num_units, initiation_interval or None)
+
+
+# Replace the functional units with empty ones, giving the load and store
+# buffers the given number of slots and the add and mult units the given
+# number of instances and initiation intervals (each reset to its default
+# if not given).
+def configure_units(num_load_slots=NUM_LOAD_SLOTS,
+                    num_store_slots=NUM_STORE_SLOTS,
+                    num_add_units=NUM_ARITH_UNITS,
+                    num_mult_units=NUM_ARITH_UNITS,
+                    add_interval=INITIATION_INTERVAL,
+                    mult_interval=INITIATION_INTERVAL):
+    global load_fu, store_fu, add_fu, mult_fu
+    if num_load_slots < 1 or num_store_slots < 1:
+        raise ValueError("Load/store buffers need at least 1 slot!")
+    load_fu  = LoadStoreUnit("load", num_load_slots)
+    store_fu = LoadStoreUnit("store", num_store_slots)
+    add_fu   = create_arith_unit("add", num_add_units, add_interval)
+    mult_fu  = create_arith_unit("mult", num_mult_units, mult_interval)
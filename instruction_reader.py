@@ -7,6 +7,12 @@
 
 import sys
 import os
+import register_file as rf
+from collections import deque
+
+
+DEFAULT_INPUT_FILE = "instruction_input.txt"
+DEFAULT_LOOKAHEAD  = 1 # Decoded instructions buffered by an InstructionStream
 
 
 # Helper function to check if strings are integers
@@ -18,11 +24,55 @@ def is_int(value):
         return False
 
 
+# Default latency (in clock cycles) of each kind of instruction. The
+# latencies used for new instructions can be changed with set_latencies.
+LOAD_LATENCY  = 3
+STORE_LATENCY = 3
+ADD_LATENCY   = 2
+MULT_LATENCY  = 10
+DIV_LATENCY   = 40
+
+latencies = {"load": LOAD_LATENCY, "store": STORE_LATENCY, "add": ADD_LATENCY,
+             "mult": MULT_LATENCY, "div": DIV_LATENCY}
+
+# Number of instructions the simulator may issue, in program order, in a
+# single clock cycle. It can be changed with set_issue_width.
+ISSUE_WIDTH = 1
+issue_width = ISSUE_WIDTH
+
+
+# Set the latencies assigned to instructions decoded from now on. Any 
+# latency that is not given is reset to its default.
+def set_latencies(load_late=LOAD_LATENCY,store_late=STORE_LATENCY,
+                  add_late=ADD_LATENCY,mult_late=MULT_LATENCY,
+                  div_late=DIV_LATENCY):
+    for late in (load_late, store_late, add_late, mult_late, div_late):
+        if late < 1: raise ValueError("Latencies must be at least 1 cycle!")
+    latencies["load"]  = load_late
+    latencies["store"] = store_late
+    latencies["add"]   = add_late
+    latencies["mult"]  = mult_late
+    latencies["div"]   = div_late
+
+
+# Set the number of instructions issued per clock cycle.
+def set_issue_width(width=ISSUE_WIDTH):
+    global issue_width
+    if width < 1: raise ValueError("Issue width must be at least 1!")
+    issue_width = width
+
+
 # This function acts like a switch-case statement to determine the 
 # appropriate latency to assign to each instruction given the instruction's
-# op-name. 
-def latency_switcher(op,load_late=3,store_late=3,add_late=2,mult_late=10,
-                     div_late=40):
+# op-name. Latencies that are not passed in are taken from the
+# module's current latencies.
+def latency_switcher(op,load_late=None,store_late=None,add_late=None,
+                     mult_late=None,div_late=None):
+    if load_late is None:  load_late  = latencies["load"]
+    if store_late is None: store_late = latencies["store"]
+    if add_late is None:   add_late   = latencies["add"]
+    if mult_late is None:  mult_late  = latencies["mult"]
+    if div_late is None:   div_late   = latencies["div"]
     switcher = {"LD"    : load_late,
                 "SD"    : store_late,
                 "ADDD"  : add_late,
@@ -39,10 +89,19 @@ def latency_switcher(op,load_late=3,store_late=3,add_late=2,mult_late=10,
 # Immediate addressing values take the form of, for example,
 # 34+ or 34-. The range of immediate addresses is assumed to 
 # be from 0-99. A value of 0 is handled for operand1 and operand2.
+# Instructions are created for every line of a trace, so their fields are
+# kept in slots instead of a per-object dictionary.
+# The integer ids of the destination and operand registers (see 
+# register_file.py) are decoded once here so that the simulator never has
+# to look registers up by name. The id of an immediate operand is None.
 class Instruction:
+    __slots__ = ("instr_index", "operation", "_dest", "_operand1",
+                 "_operand2", "latency", "dest_id", "operand1_id",
+                 "operand2_id")
+
     def __init__(self,op,dest,operand1,operand2,idx):
-        self._instr_index = idx
-        self._operation = op
+        self.instr_index = idx
+        self.operation = op
         self._dest = dest
         if is_int(operand1[0:len(operand1)-1]):
             num = int(operand1[0:len(operand1)-1])
@@ -64,31 +123,72 @@ class Instruction:
         else:
             self._operand2  = operand2
 
-        self._latency = latency_switcher(op)
+        self.latency = latency_switcher(op)
+        self.decode_register_ids()
 
-    @property
-    def instr_index(self):
-        return self._instr_index
+    # Build an Instruction from fields that have already been decoded
+    # (e.g. from a binary trace), skipping the parsing of operand strings.
+    # Immediate operands are given as ints and registers by name.
+    @classmethod
+    def from_fields(cls,op,dest,operand1,operand2,idx):
+        instr = cls.__new__(cls)
+        instr.instr_index = idx
+        instr.operation   = op
+        instr._dest       = dest
+        instr._operand1   = operand1
+        instr._operand2   = operand2
+        instr.latency     = latency_switcher(op)
+        instr.decode_register_ids()
+        return instr
 
-    @property
-    def operation(self):
-        return self._operation
+    # Build an Instruction from register ids that have already been decoded
+    # (e.g. from a binary trace). The id of an immediate operand is None and
+    # its value is given instead. The register names are only worked out if
+    # they are asked for.
+    @classmethod
+    def from_ids(cls,op,dest_id,operand1_id,operand2_id,idx,operand1=None,
+                 operand2=None):
+        instr = cls.__new__(cls)
+        instr.instr_index = idx
+        instr.operation   = op
+        instr.dest_id     = dest_id
+        instr.operand1_id = operand1_id
+        instr.operand2_id = operand2_id
+        instr._dest       = None
+        instr._operand1   = operand1
+        instr._operand2   = operand2
+        instr.latency     = latency_switcher(op)
+        return instr
 
+    # The destination and operands by register name (or the value of an
+    # immediate operand).
     @property
     def dest(self):
+        if self._dest is None: self._dest = rf.register_name(self.dest_id)
         return self._dest
 
     @property
     def operand1(self):
+        if self._operand1 is None:
+            self._operand1 = rf.register_name(self.operand1_id)
         return self._operand1
 
     @property
     def operand2(self):
+        if self._operand2 is None:
+            self._operand2 = rf.register_name(self.operand2_id)
         return self._operand2
-    
-    @property
-    def latency(self):
-        return self._latency
+
+    def decode_register_ids(self):
+        self.dest_id = rf.register_id(self._dest)
+        if type(self._operand1) == int: 
+            self.operand1_id = None
+        else:
+            self.operand1_id = rf.register_id(self._operand1)
+        if type(self._operand2) == int: 
+            self.operand2_id = None
+        else:
+            self.operand2_id = rf.register_id(self._operand2)
         
 
 # Directly read the instructions from the text file. 
@@ -104,12 +204,113 @@ def read_text_input(filename):
     return text_list
 
 
+# Lazily decode the instructions of the text file one line at a time,
+# numbering them in program order. Blank lines are skipped. Only the
+# current line is held in memory, so the file can be arbitrarily long.
+# The first 'start' instructions are skipped without being decoded, e.g.
+# when resuming a simulation that had already issued them.
+def iter_instructions(filename=None, start=0):
+    if filename is None: filename = DEFAULT_INPUT_FILE
+    with open(filename,'r') as fp:
+        yield from iter_text_instructions(fp, start)
+
+
+# Lazily decode the instructions of the given lines of a text trace (e.g.
+# a trace received as a string rather than read from a file), in the same
+# way as iter_instructions.
+def iter_text_instructions(lines, start=0):
+    idx = 0
+    for line in lines:
+        tokens = line.split()
+        if not tokens: continue
+        if idx >= start:
+            yield Instruction(tokens[0],tokens[1],tokens[2],tokens[3],idx)
+        idx += 1
+
+
 # Using the instructions from the text file, generate a list of Instruction
 # objects that will be used in actual simulation.
 def create_instruction_list(filename=None):
-    if filename is None: filename = "instruction_input.txt"
-    lines        = read_text_input(filename)
-    instructions = [Instruction(line[0],line[1],line[2],line[3],idx) for idx, line in
-                    enumerate(lines)]
+    return list(iter_instructions(filename))
+
+
+# An InstructionStream hands out instructions in program order from any
+# iterable of Instruction objects (e.g. the iter_instructions generator).
+# At most 'lookahead' decoded instructions are buffered, so memory use does
+# not depend on the length of the trace, and taking the next instruction
+# is constant-time regardless of how many instructions remain. A stream
+# that does not start at the first instruction of the program is given the
+# number of instructions already taken before it.
+class InstructionStream:
+    def __init__(self, instructions, lookahead=DEFAULT_LOOKAHEAD,
+                 num_taken=0):
+        if lookahead < 1:
+            raise ValueError("Lookahead of an InstructionStream must be " +
+                             "at least 1!")
+        self._source    = iter(instructions)
+        self._lookahead = lookahead
+        self._buffer    = deque()
+        self._exhausted = False
+        self._num_taken = num_taken
+
+    @property
+    def lookahead(self):
+        return self._lookahead
+
+    # The lookahead can be raised (or lowered) at any time; instructions
+    # already buffered stay buffered.
+    @lookahead.setter
+    def lookahead(self, lookahead):
+        if lookahead < 1:
+            raise ValueError("Lookahead of an InstructionStream must be " +
+                             "at least 1!")
+        self._lookahead = lookahead
+
+    @property
+    def num_taken(self):
+        return self._num_taken
+
+    # Decode instructions from the source until the lookahead buffer is
+    # full or the source runs out.
+    def _fill(self):
+        while not self._exhausted and len(self._buffer) < self._lookahead:
+            try:
+                self._buffer.append(next(self._source))
+            except StopIteration:
+                self._exhausted = True
+
+    def is_empty(self):
+        if not self._buffer: self._fill()
+        return not self._buffer
+
+    # Return the instruction 'offset' positions ahead of the next one
+    # without taking it, or None if the stream does not reach that far.
+    def peek(self, offset=0):
+        if offset >= self._lookahead:
+            raise IndexError("Peeking past the lookahead of the stream!")
+        if len(self._buffer) <= offset: self._fill()
+        if len(self._buffer) <= offset: return None
+        return self._buffer[offset]
+
+    # Take the next instruction out of the stream.
+    def advance(self):
+        if not self._buffer: self._fill()
+        if not self._buffer: return None
+        self._num_taken += 1
+        return self._buffer.popleft()
+
+    # Return every instruction left in the stream as a list, without taking
+    # them: the stream goes on from the same instruction afterwards.
+    def remaining(self):
+        rest = list(self._buffer) + list(self._source)
+        self._source    = iter(rest[len(self._buffer):])
+        self._exhausted = False
+        return rest
+
 
-    return instructions
+# Open a stream over the instructions of the given text file, starting
+# after the first 'start' instructions.
+def open_instruction_stream(filename=None, lookahead=DEFAULT_LOOKAHEAD,
+                            start=0):
+    return InstructionStream(iter_instructions(filename, start), lookahead,
+                             start)
@@ -5,6 +5,79 @@
 import os
 import sys
 import time
+from array import array
+
+
+# Names of the columns kept for every instruction in the table, in the
+# order they are filled in by the simulator.
+ISSUE         = "Issue"
+EXEC_START    = "Exec Start"
+EXEC_COMPLETE = "Exec Complete"
+WRITE_RESULT  = "Write Result"
+COLUMNS       = (ISSUE, EXEC_START, EXEC_COMPLETE, WRITE_RESULT)
+
+
+# The instruction (summary) table is stored column-wise: one integer array
+# per field (Issue, Exec Start, Exec Complete, Write Result), all indexed by
+# the instruction's index within the program. Since the clock starts from 1,
+# a value of 0 means that the field has not been filled in yet. 
+# The number of entries whose Write Result has been set is kept as a running
+# count so that checking whether the table is complete does not require
+# scanning every entry. The number of instructions issued in each clock
+# cycle is kept in a dictionary from clock cycle to count, holding only the
+# cycles in which something was issued.
+class InstructionTable:
+    def __init__(self, num_entries=0):
+        self._issue         = array('l', [0]) * num_entries
+        self._exec_start    = array('l', self._issue)
+        self._exec_complete = array('l', self._issue)
+        self._write_result  = array('l', self._issue)
+        self._columns       = {ISSUE: self._issue,
+                               EXEC_START: self._exec_start,
+                               EXEC_COMPLETE: self._exec_complete,
+                               WRITE_RESULT: self._write_result}
+        self._num_completed = 0
+        self._issue_counts  = {}
+
+    def __len__(self):
+        return len(self._issue)
+
+    @property
+    def issue(self):
+        return self._issue
+
+    @property
+    def exec_start(self):
+        return self._exec_start
+
+    @property
+    def exec_complete(self):
+        return self._exec_complete
+
+    @property
+    def write_result(self):
+        return self._write_result
+
+    @property
+    def num_completed(self):
+        return self._num_completed
+
+    @num_completed.setter
+    def num_completed(self,count):
+        self._num_completed = count
+
+    @property
+    def issue_counts(self):
+        return self._issue_counts
+
+    def column(self,name):
+        return self._columns[name]
+
+    # Add a blank entry at the end of the table and return its index.
+    def append_entry(self):
+        for column in self._columns.values():
+            column.append(0)
+        return len(self._issue) - 1
 
 
 # This function requires the list of Instruction objects to be passed in.
@@ -12,71 +85,100 @@ import time
 # it generates a the instruction (summary) table in which the status
 # of all instructions is maintained.
 def create_instruction_table(instruction_list):
-    instruction_table = []
-    for instr in instruction_list: 
-        blank_entry = {"Instruction":instr, "Issue":None, "Exec Start":None,
-                       "Exec Complete":None, "Write Result":None}
-        instruction_table.append(blank_entry) 
+    return InstructionTable(len(instruction_list))
 
-    return instruction_table
 
+# Add a blank entry for the next instruction in program order to the end
+# of the table and return the entry's index. Used when instructions are
+# streamed in rather than known up front.
+def add_entry(instr_table):
+    return instr_table.append_entry()
 
-# This function is used to retrieve the instruction index
-# from the instruction (summary) table based off of contents
-# loaded inside a station of a Reservation Station. 
-# If the station's fields match that of the entry inside the 
-# table, then return the corresponding Instruction's index which
-# is indicative of its location within the program.
-def find_instr_idx(instr_table,station):
-    for entry in instr_table:
-        if (entry['Instruction'].operation == station[1] and 
-            entry['Instruction'].dest == station[3] and
-            entry['Instruction'].operand1 == station[5] and
-            entry['Instruction'].operand2 == station[7]):
-            return instr_table[entry]['Instruction'].instr_index
-    print("Instruction NOT FOUND") 
 
-    return None
+# Return the value of the given field (column) of the entry at the given
+# index, or None if that field has not been filled in yet.
+def get_entry_field(instr_table, idx, field):
+    value = instr_table.column(field)[idx]
+    if value == 0: return None
+    return value
+
+
+# Return the entry at the given index as a dictionary from field
+# name to clock cycle (None if the field has not been filled in yet).
+def get_entry(instr_table, idx):
+    return {field: get_entry_field(instr_table, idx, field) 
+            for field in COLUMNS}
 
 
 # Determine if the given entry in the instruction (summary) 
 # table is incomplete or not. 
-def entry_is_incomplete(entry):
-    if any(value is None for key,value in entry.items()): return True
-    else: return False
+def entry_is_incomplete(instr_table, idx):
+    return (instr_table.issue[idx] == 0 or 
+            instr_table.exec_start[idx] == 0 or
+            instr_table.exec_complete[idx] == 0 or 
+            instr_table.write_result[idx] == 0)
 
 
 # Determine if there is an entry within the entire
 # instruction table that is incomplete, thereby implying
-# that the instruction table is incomplete.
+# that the instruction table is incomplete. Every entry has its
+# Write Result filled in last, so the running count of written
+# entries is enough.
 def instruction_table_is_incomplete(instr_table):
-    if any(entry_is_incomplete(entry) for entry in instr_table): return True
-    else: return False
+    return instr_table.num_completed < len(instr_table)
+
+
+# Determine if the entry at the given index has started executing.
+def has_started_execution(instr_table, idx):
+    return instr_table.exec_start[idx] != 0
 
 
 # Access the entry of the instruction_table corresponding
 # to the given index and update the entry's Issue field
 # to the value of clock_cycle.
 def issue_instruction(instr_table,idx,clock_cycle):
-    instr_table[idx]['Issue'] = clock_cycle
+    instr_table.issue[idx] = clock_cycle
+
+
+# Record the number of instructions issued at the given clock cycle.
+def record_issue_count(instr_table, clock_cycle, count):
+    instr_table.issue_counts[clock_cycle] = count
+
+
+# Return the number of instructions issued at the given clock cycle.
+def get_issue_count(instr_table, clock_cycle):
+    return instr_table.issue_counts.get(clock_cycle, 0)
+
+
+# Return a dictionary from the number of instructions issued in a cycle
+# to the number of cycles (up to the given last clock cycle) in which that
+# many instructions were issued.
+def issue_count_histogram(instr_table, last_cycle):
+    hist = {0: last_cycle - len(instr_table.issue_counts)}
+    for count in instr_table.issue_counts.values():
+        hist[count] = hist.get(count, 0) + 1
+    return hist
 
 
 # Access the entry of the instruction_table corresponding
 # to the given index and update the entry's Start Exec field
 # to the value of clock_cycle.
 def start_execution(instr_table,idx,clock_cycle):
-    instr_table[idx]['Exec Start'] = clock_cycle
+    instr_table.exec_start[idx] = clock_cycle
 
 
 # Access the entry of the instruction_table corresponding
 # to the given index and update the entry's Exec Complete field
 # to the value of clock_cycle.
 def complete_execution(instr_table,idx,clock_cycle):
-    instr_table[idx]['Exec Complete'] = clock_cycle
+    instr_table.exec_complete[idx] = clock_cycle
 
 
 # Access the entry of the instruction_table corresponding
 # to the given index and update the entry's Write Result field
-# to the value of clock_cycle.
+# to the value of clock_cycle. The first time an entry's Write Result
+# is set, the count of completed entries is incremented.
 def write_result(instr_table,idx,clock_cycle):
-    instr_table[idx]['Write Result'] = clock_cycle
+    if instr_table.write_result[idx] == 0:
+        instr_table.num_completed += 1
+    instr_table.write_result[idx] = clock_cycle
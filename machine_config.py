@@ -0,0 +1,100 @@
+#!/usr/env/python
+# This module describes the shape of the simulated machine: the number of
+# stations in each reservation station, the number of slots in the load and
+# store buffers, the latency of each kind of instruction, the number of
+# instructions issued per cycle and the number of add and mult units and
+# whether they are pipelined. A MachineConfig
+# is applied to the simulator's modules with apply_config before a run.
+
+
+import os
+import sys
+import instruction_reader as ir
+import reservation_stations as rs
+import functional_units as fu
+
+
+# Every parameter of a MachineConfig along with its default value.
+DEFAULT_PARAMETERS = (("num_ld_stations",    rs.NUM_LD_STATIONS),
+                      ("num_sd_stations",    rs.NUM_SD_STATIONS),
+                      ("num_addd_stations",  rs.NUM_ADDD_STATIONS),
+                      ("num_multd_stations", rs.NUM_MULTD_STATIONS),
+                      ("num_load_slots",     fu.NUM_LOAD_SLOTS),
+                      ("num_store_slots",    fu.NUM_STORE_SLOTS),
+                      ("load_latency",       ir.LOAD_LATENCY),
+                      ("store_latency",      ir.STORE_LATENCY),
+                      ("add_latency",        ir.ADD_LATENCY),
+                      ("mult_latency",       ir.MULT_LATENCY),
+                      ("div_latency",        ir.DIV_LATENCY),
+                      ("issue_width",        ir.ISSUE_WIDTH),
+                      ("num_add_units",      fu.NUM_ARITH_UNITS),
+                      ("num_mult_units",     fu.NUM_ARITH_UNITS),
+                      ("add_initiation_interval",  fu.INITIATION_INTERVAL),
+                      ("mult_initiation_interval", fu.INITIATION_INTERVAL))
+PARAMETERS = tuple(name for name, default in DEFAULT_PARAMETERS)
+
+# Parameters that may be 0, where 0 means the add or mult units are not
+# pipelined. All others must be at least 1.
+ZERO_PARAMETERS = ("add_initiation_interval", "mult_initiation_interval")
+
+
+# A MachineConfig holds one value for each of the parameters above. Any
+# parameter that is not given keeps the default the simulator's modules 
+# were written with, so MachineConfig() describes the default machine.
+class MachineConfig:
+    def __init__(self, **params):
+        for name in params:
+            if name not in PARAMETERS:
+                raise ValueError("Unknown machine parameter: %s" % name)
+        for name, default in DEFAULT_PARAMETERS:
+            value = params.get(name, default)
+            minimum = 0 if name in ZERO_PARAMETERS else 1
+            if int(value) != value or value < minimum:
+                raise ValueError("Machine parameter %s must be an integer of "
+                                 "at least %d!" % (name, minimum))
+            setattr(self, name, int(value))
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in PARAMETERS}
+
+    @classmethod
+    def from_dict(cls, params):
+        return cls(**params)
+
+    def __eq__(self, other):
+        return (isinstance(other, MachineConfig) and 
+                self.to_dict() == other.to_dict())
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(tuple(getattr(self, name) for name in PARAMETERS))
+
+    def __repr__(self):
+        return "MachineConfig(%s)" % ", ".join("%s=%d" % (name, 
+                                                          getattr(self, name))
+                                               for name in PARAMETERS)
+
+
+# Rebuild the reservation stations and functional units and set the 
+# instruction latencies according to the given configuration. This resets
+# all of their state, so it must be done before a simulation starts.
+def apply_config(config=None):
+    if config is None: config = MachineConfig()
+    rs.configure_stations(config.num_ld_stations, config.num_sd_stations,
+                          config.num_addd_stations, config.num_multd_stations)
+    fu.configure_units(config.num_load_slots, config.num_store_slots,
+                       config.num_add_units, config.num_mult_units,
+                       config.add_initiation_interval,
+                       config.mult_initiation_interval)
+    ir.set_latencies(config.load_latency, config.store_latency,
+                     config.add_latency, config.mult_latency,
+                     config.div_latency)
+    ir.set_issue_width(config.issue_width)
+
+
+# Parse a comma-separated list of integers from the command line, e.g. the
+# values of a machine parameter to sweep over.
+def int_list(text):
+    return [int(value) for value in text.split(",")]
@@ -0,0 +1,183 @@
+#!/usr/env/python
+# Microbenchmark comparing the record types used by the simulator's inner
+# loop (Station, Tag and Instruction, which keep their fields in slots)
+# with the representations they replaced: a station as a 10-element list 
+# indexed by position with "Yes"/"No" and "Ready"/"Not Ready" strings, and
+# Tag/Instruction objects with property wrappers over an instance dict.
+# For each pair it reports the memory used per object and the time taken
+# by the field accesses done when checking whether a station is ready and
+# when a result is broadcast on the CDB.
+#   python microbenchmark.py [number of objects]
+
+
+import sys
+import timeit
+import tracemalloc
+import instruction_reader as ir
+import reservation_stations as rs
+from tag import Tag
+
+
+# The Tag as it was before its fields were moved into slots.
+class LegacyTag:
+    def __init__(self,rs_type,idx):
+        self._rs_type = rs_type
+        self._idx = idx
+    
+    @property
+    def rs_type(self):
+        return self._rs_type
+
+    @rs_type.setter
+    def rs_type(self,rs_type):
+        self._rs_type = rs_type
+
+    @property
+    def idx(self):
+        return self._idx
+
+    @idx.setter
+    def idx(self,idx):
+        self._idx = idx
+
+
+# The Instruction as it was before its fields were moved into slots.
+class LegacyInstruction:
+    def __init__(self,op,dest,operand1,operand2,idx):
+        self._instr_index = idx
+        self._operation = op
+        self._dest = dest
+        self._operand1 = operand1
+        self._operand2 = operand2
+        self._latency = ir.latency_switcher(op)
+
+    @property
+    def instr_index(self):
+        return self._instr_index
+
+    @property
+    def operation(self):
+        return self._operation
+
+    @property
+    def dest(self):
+        return self._dest
+
+    @property
+    def operand1(self):
+        return self._operand1
+
+    @property
+    def operand2(self):
+        return self._operand2
+
+    @property
+    def latency(self):
+        return self._latency
+
+
+def make_legacy_station():
+    return ["Yes", "ADDD", LegacyTag("add",7), "F2", LegacyTag("mult",10),
+            None, LegacyTag(None,0), 2, "Not Ready", None]
+
+
+def make_station():
+    station           = rs.Station()
+    station.busy      = True
+    station.operation = "ADDD"
+    station.qi_tag    = Tag("add",7)
+    station.dest      = "F2"
+    station.vj_tag    = Tag("mult",10)
+    station.vk        = 2
+    return station
+
+
+# Memory allocated per object when creating num_objects of them.
+def bytes_per_object(factory, num_objects):
+    tracemalloc.start()
+    before  = tracemalloc.take_snapshot()
+    objects = [factory() for i in range(num_objects)]
+    after   = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    size = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    del objects
+    return size / float(num_objects)
+
+
+# The field accesses of is_station_ready and of a CDB broadcast
+# (update_rs_operands followed by clear_rs_tags) on a single station.
+def legacy_station_ops(station, tag):
+    ready = (station[0] == "Yes" and station[8] == "Ready")
+    if (station[4].rs_type == tag.rs_type and station[4].idx == tag.idx):
+        station[5] = 4
+        station[4].rs_type = None
+        station[4].idx = 0
+    op1_ready = station[4].rs_type is None and station[4].idx == 0
+    op2_ready = station[6].rs_type is None and station[6].idx == 0
+    station[4].rs_type = tag.rs_type
+    station[4].idx = tag.idx
+    return ready or (op1_ready and op2_ready and station[2].idx == 7)
+
+
+def station_ops(station, tag):
+    ready = (station.busy and station.ready == rs.READY)
+    vj_tag = station.vj_tag
+    if (vj_tag.rs_type == tag.rs_type and vj_tag.idx == tag.idx):
+        station.vj = 4
+        vj_tag.rs_type = None
+        vj_tag.idx = 0
+    op1_ready = vj_tag.rs_type is None and vj_tag.idx == 0
+    op2_ready = station.vk_tag.rs_type is None and station.vk_tag.idx == 0
+    vj_tag.rs_type = tag.rs_type
+    vj_tag.idx = tag.idx
+    return ready or (op1_ready and op2_ready and station.qi_tag.idx == 7)
+
+
+# The instruction fields read when issuing and completing an instruction.
+def instruction_ops(instr):
+    return (instr.operation, instr.dest, instr.operand1, instr.operand2,
+            instr.instr_index, instr.latency)
+
+
+# Best of five timings of calling func(*args) 'number' times, in 
+# nanoseconds per call.
+def time_calls(func, args, number):
+    timer = timeit.Timer(lambda: func(*args))
+    return min(timer.repeat(5, number)) / number * 1e9
+
+
+def report(name, legacy, current, unit):
+    print("%-28s %12.1f %12.1f %10s %7.2fx" % (name, legacy, current, unit,
+                                               legacy / current))
+
+
+if __name__ == '__main__':
+    num_objects = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    number      = 200000
+
+    print("%-28s %12s %12s %10s %8s" % ("benchmark", "legacy", "slotted",
+                                        "unit", "gain"))
+    report("station memory", 
+           bytes_per_object(make_legacy_station, num_objects),
+           bytes_per_object(make_station, num_objects), "B/object")
+    report("tag memory", 
+           bytes_per_object(lambda: LegacyTag("add", 7), num_objects),
+           bytes_per_object(lambda: Tag("add", 7), num_objects), "B/object")
+    report("instruction memory",
+           bytes_per_object(lambda: LegacyInstruction("ADDD", "F2", "F4", 
+                                                      "F6", 0), num_objects),
+           bytes_per_object(lambda: ir.Instruction.from_fields("ADDD", "F2",
+                                                               "F4", "F6", 0),
+                            num_objects), "B/object")
+    report("station ready + broadcast",
+           time_calls(legacy_station_ops, 
+                      (make_legacy_station(), LegacyTag("mult", 10)), number),
+           time_calls(station_ops, (make_station(), Tag("mult", 10)), number),
+           "ns/call")
+    report("instruction field reads",
+           time_calls(instruction_ops, 
+                      (LegacyInstruction("ADDD", "F2", "F4", "F6", 0),),
+                      number),
+           time_calls(instruction_ops,
+                      (ir.Instruction.from_fields("ADDD", "F2", "F4", "F6", 0),),
+                      number), "ns/call")
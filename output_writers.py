@@ -0,0 +1,198 @@
+#!/usr/env/python
+# This module implements the output writers of the simulator. A writer is
+# handed the instruction (summary) table after every simulated clock cycle
+# (only if it asks for it with per_cycle) and the final table and register
+# file at the end of the simulation. Lines are collected in memory and 
+# written to the underlying file in batches, so formatting and I/O do not
+# dominate the run time of long simulations.
+# The available writers are:
+#   none  - writes nothing
+#   text  - the human-readable tables printed by the simulator
+#   csv   - one row per instruction (and per register at the end)
+#   jsonl - one JSON object per cycle (and one for the final state)
+
+
+import os
+import sys
+import json
+import instruction_table as it
+import register_file as rf
+
+
+DEFAULT_BUFFER_SIZE = 1 << 16 # Characters collected before writing
+
+
+# The OutputWriter is the base class of all writers. It holds the file
+# being written to and the lines not yet written. Subclasses implement
+# write_cycle and write_final in terms of write_line.
+class OutputWriter:
+    def __init__(self, fp=None, per_cycle=False,
+                 buffer_size=DEFAULT_BUFFER_SIZE):
+        if fp is None: fp = sys.stdout
+        self._fp          = fp
+        self._per_cycle   = per_cycle
+        self._buffer_size = buffer_size
+        self._lines       = []
+        self._num_chars   = 0
+
+    @property
+    def per_cycle(self):
+        return self._per_cycle
+
+    def write_line(self, line):
+        self._lines.append(line)
+        self._num_chars += len(line) + 1
+        if self._num_chars >= self._buffer_size:
+            self.flush()
+
+    def flush(self):
+        if self._lines:
+            self._lines.append("")
+            self._fp.write("\n".join(self._lines))
+            self._lines     = []
+            self._num_chars = 0
+        self._fp.flush()
+
+    def write_cycle(self, clock_cycle, instr_table):
+        pass
+
+    def write_final(self, clock_cycle, instr_table, reg_file):
+        pass
+
+    # Write the register file on its own, e.g. at the end of a run in
+    # functional-only mode, which has no clock or instruction table.
+    def write_registers(self, reg_file):
+        pass
+
+    def close(self):
+        self.flush()
+        if not (self._fp is sys.stdout or self._fp is sys.stderr):
+            self._fp.close()
+
+
+# A writer that discards everything, for runs where only the returned
+# simulation state matters.
+class NullWriter(OutputWriter):
+    def __init__(self, fp=None, per_cycle=False,
+                 buffer_size=DEFAULT_BUFFER_SIZE):
+        OutputWriter.__init__(self, fp, False, buffer_size)
+
+    def write_line(self, line):
+        pass
+
+    def close(self):
+        pass
+
+
+# Writes the instruction (summary) table in the same layout the simulator
+# has always printed, followed by the register file at the end.
+class TextWriter(OutputWriter):
+    def write_table(self, instr_table):
+        issue         = instr_table.issue
+        exec_start    = instr_table.exec_start
+        exec_complete = instr_table.exec_complete
+        write_result  = instr_table.write_result
+        for idx in range(len(instr_table)):
+            self.write_line("Instr index: %s\t\tIssue: %s\t\tExec Strt: %s\t\t"
+                            "Exec Comp: %s\t\tWrite Res: %s" % 
+                            (idx, issue[idx] or None, exec_start[idx] or None,
+                             exec_complete[idx] or None, 
+                             write_result[idx] or None))
+
+    def write_cycle(self, clock_cycle, instr_table):
+        self.write_line("\nClock Cycle: %s " % str(clock_cycle))
+        self.write_table(instr_table)
+
+    def write_final(self, clock_cycle, instr_table, reg_file):
+        self.write_line("\nFinished at Clock Cycle: %s" % str(clock_cycle))
+        self.write_cycle(clock_cycle, instr_table)
+        self.write_registers(reg_file)
+
+    def write_registers(self, reg_file):
+        for reg,value in rf.register_values(reg_file):
+            self.write_line("Register %s: %d" % (reg, value))
+
+
+# Writes comma-separated rows. Instruction rows have the kind "cycle" (the
+# table at the end of a simulated cycle) or "final"; fields that have not
+# been filled in are left empty. The register file is written at the end 
+# as rows of kind "register" holding the register name and its value (with
+# an empty clock cycle in functional-only mode).
+class CsvWriter(OutputWriter):
+    HEADER = "kind,clock_cycle,index,issue,exec_start,exec_complete," \
+             "write_result,value"
+
+    def __init__(self, fp=None, per_cycle=False,
+                 buffer_size=DEFAULT_BUFFER_SIZE):
+        OutputWriter.__init__(self, fp, per_cycle, buffer_size)
+        self.write_line(self.HEADER)
+
+    def write_table(self, kind, clock_cycle, instr_table):
+        issue         = instr_table.issue
+        exec_start    = instr_table.exec_start
+        exec_complete = instr_table.exec_complete
+        write_result  = instr_table.write_result
+        for idx in range(len(instr_table)):
+            self.write_line("%s,%d,%d,%s,%s,%s,%s," % 
+                            (kind, clock_cycle, idx, issue[idx] or "", 
+                             exec_start[idx] or "", exec_complete[idx] or "",
+                             write_result[idx] or ""))
+
+    def write_cycle(self, clock_cycle, instr_table):
+        self.write_table("cycle", clock_cycle, instr_table)
+
+    def write_final(self, clock_cycle, instr_table, reg_file):
+        self.write_table("final", clock_cycle, instr_table)
+        self.write_registers(reg_file, clock_cycle)
+
+    def write_registers(self, reg_file, clock_cycle=None):
+        if clock_cycle is None: clock_cycle = ""
+        for reg,value in rf.register_values(reg_file):
+            self.write_line("register,%s,%s,,,,,%r" % (clock_cycle, reg, 
+                                                       value))
+
+
+# Writes one JSON object per line. Every object holds the clock cycle and 
+# the table as a list of [Issue, Exec Start, Exec Complete, Write Result] 
+# entries (null for fields not filled in yet). The final object is marked 
+# with "final": true and also holds the register file; in functional-only
+# mode it only holds the register file.
+class JsonlWriter(OutputWriter):
+    def table_rows(self, instr_table):
+        columns = [instr_table.column(name) for name in it.COLUMNS]
+        return [[column[idx] or None for column in columns]
+                for idx in range(len(instr_table))]
+
+    def write_cycle(self, clock_cycle, instr_table):
+        self.write_line(json.dumps({"clock_cycle": clock_cycle,
+                                    "table": self.table_rows(instr_table)}))
+
+    def write_final(self, clock_cycle, instr_table, reg_file):
+        registers = dict(rf.register_values(reg_file))
+        self.write_line(json.dumps({"final": True, 
+                                    "clock_cycle": clock_cycle,
+                                    "table": self.table_rows(instr_table),
+                                    "registers": registers}))
+
+    def write_registers(self, reg_file):
+        self.write_line(json.dumps({"final": True, "registers":
+                                    dict(rf.register_values(reg_file))}))
+
+
+WRITERS = {"none": NullWriter,
+           "text": TextWriter,
+           "csv": CsvWriter,
+           "jsonl": JsonlWriter}
+
+
+# Create the writer with the given name, writing to the given file name
+# (standard output if None). The file is opened with a large buffer.
+def create_writer(name, filename=None, per_cycle=False,
+                  buffer_size=DEFAULT_BUFFER_SIZE):
+    if name not in WRITERS:
+        raise ValueError("Unknown output format: %s" % name)
+    if filename is None or name == "none": 
+        fp = sys.stdout
+    else:
+        fp = open(filename, "w", buffering=buffer_size)
+    return WRITERS[name](fp, per_cycle, buffer_size)
@@ -0,0 +1,137 @@
+#!/usr/env/python
+# This module provides opt-in profiling of the simulation loop. When
+# enabled, the four blocks run every clock cycle (Write-Result, Issue,
+# Start-Execution and Complete-Execution) and the helpers they lean on
+# (update_rs_operands, clear_rs_tags, is_station_ready and
+# instruction_table_is_incomplete) are replaced in their modules by timed
+# wrappers that record the number of calls and cumulative time of each.
+# Nothing is wrapped until enable is called, so a run without profiling
+# pays nothing for it. Callbacks can be attached to receive every timed
+# call as it happens.
+
+
+import sys
+import time
+import atexit
+import instruction_table as it
+import reservation_stations as rs
+
+
+# Functions of the simulator module timed as phases, and helpers timed in
+# the modules that define them (and in which the simulator looks them up).
+PHASES  = ("write_result_stage", "issue_stage", "start_execution_stage",
+           "complete_execution_stage")
+HELPERS = ((rs, "update_rs_operands"), (rs, "clear_rs_tags"),
+           (rs, "is_station_ready"), (it, "instruction_table_is_incomplete"))
+
+
+# The Profiler keeps a [calls, seconds] entry per timed function name and
+# the list of callbacks, each of which is called as callback(name, seconds)
+# after every timed call. patch replaces a module's function with a timed
+# wrapper and unpatch puts every original function back.
+class Profiler:
+    def __init__(self):
+        self._stats     = {}
+        self._callbacks = []
+        self._patched   = []
+
+    @property
+    def stats(self):
+        return self._stats
+
+    @property
+    def callbacks(self):
+        return self._callbacks
+
+    def add_callback(self, callback):
+        self._callbacks.append(callback)
+
+    def remove_callback(self, callback):
+        self._callbacks.remove(callback)
+
+    def reset(self):
+        self._stats = {}
+
+    def record(self, name, seconds):
+        entry = self._stats.get(name)
+        if entry is None:
+            entry = self._stats[name] = [0, 0.0]
+        entry[0] += 1
+        entry[1] += seconds
+        for callback in self._callbacks:
+            callback(name, seconds)
+
+    def wrap(self, name, func):
+        timer  = time.perf_counter
+        record = self.record
+        def timed(*args, **kwargs):
+            start = timer()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(name, timer() - start)
+        timed.__name__    = func.__name__
+        timed.__wrapped__ = func
+        return timed
+
+    def patch(self, module, name):
+        func = getattr(module, name)
+        setattr(module, name, self.wrap(name, func))
+        self._patched.append((module, name, func))
+
+    def unpatch(self):
+        while self._patched:
+            module, name, func = self._patched.pop()
+            setattr(module, name, func)
+
+    # Write a table of the calls and times of every timed function, the
+    # slowest first.
+    def report(self, fp=None):
+        if fp is None: fp = sys.stderr
+        fp.write("%-34s %12s %12s %12s\n" % ("Function", "Calls",
+                                              "Total (s)", "Per call (us)"))
+        for name, (calls, seconds) in sorted(self._stats.items(),
+                                             key=lambda item: -item[1][1]):
+            fp.write("%-34s %12d %12.4f %12.3f\n" %
+                     (name, calls, seconds, 1e6*seconds/calls))
+        fp.flush()
+
+
+# The active Profiler, if profiling is enabled.
+profiler = None
+
+
+# Start profiling the simulation loop of the given simulator module
+# (tomasulo_sim unless given, which must be passed explicitly when the
+# simulator runs as the main script) and return the Profiler. If
+# report_at_exit is set, the report is written to fp (standard error by
+# default) when the interpreter exits.
+def enable(sim=None, report_at_exit=False, fp=None):
+    global profiler
+    if profiler is not None:
+        return profiler
+    if sim is None:
+        import tomasulo_sim as sim
+    profiler = Profiler()
+    for name in PHASES:
+        profiler.patch(sim, name)
+    for module, name in HELPERS:
+        profiler.patch(module, name)
+    if report_at_exit:
+        atexit.register(profiler.report, fp)
+    return profiler
+
+
+# Stop profiling and restore the original functions. The Profiler that was
+# active is returned with its statistics.
+def disable():
+    global profiler
+    active = profiler
+    if active is not None:
+        active.unpatch()
+        profiler = None
+    return active
+
+
+def is_enabled():
+    return profiler is not None
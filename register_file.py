@@ -1,97 +1,200 @@
 # Author: Vivek Poovathoor
-# This module consists of functions that allow for the creation 
+# This module consists of functions that allow for the creation
 # of a register file as well interacting with it and individual registers
-# and their tags. 
+# and their tags.
 
 
 import os
 import sys
+from array import array
 from tag import Tag
 
 
 DEFAULT_REG_VALUE = 2 # Set to 2 to make arithmetic operations interesting.
+REGISTER_BANKS    = ("R", "F") # Integer and floating point registers
+REGISTER_BANK_SIZE = 32      # Registers per bank by default, [0,...,31]
 
 
-# The register file by default has 32 registers [0,...,30].
-# The keys are the register names and the values a list containing Q_i tuple
-# and actual register value. 
-# Upon intialization the Q_i tuple for the registers are left at "(None,None)".
-# Similarly, the value inside each register is 0 upon initialization.
-# Q_i values are represented as a tuple, e.g. (mult,0) or (load,2). 
+# Registers are numbered with integer ids so that operands can be decoded
+# once when an instruction is read and stored compactly (e.g. in a binary
+# trace). The banks are interleaved: the id of a register is its number
+# within the bank times the number of banks plus the index of its bank, so
+# R0, F0, R1, F1, ... are 0, 1, 2, 3, ... and the ids of a register file
+# with any number of registers per bank are contiguous.
+def register_id(reg_name):
+    try:
+        bank = REGISTER_BANKS.index(reg_name[0])
+        num  = int(reg_name[1:])
+    except (ValueError, IndexError, TypeError):
+        raise ValueError("Invalid register name: %s" % str(reg_name))
+    if num < 0 or not reg_name[1:].isdigit():
+        raise ValueError("Invalid register name: %s" % str(reg_name))
+    return num*len(REGISTER_BANKS) + bank
+
+
+# Return the name of the register with the given integer id.
+def register_name(reg_id):
+    if reg_id < 0:
+        raise ValueError("Invalid register id: %s" % str(reg_id))
+    return (REGISTER_BANKS[reg_id % len(REGISTER_BANKS)] +
+            str(reg_id // len(REGISTER_BANKS)))
+
+
+# The register file keeps every register in flat arrays indexed by register
+# id: the values in an array of doubles and the first (oldest) Q_i tag of
+# each register in a parallel array of tag ids, 0 meaning that the register
+# has no tag. Tag ids are handed out the first time a (reservation station
+# type, station index) pair is loaded into a register and map back to a
+# single shared Tag object. Registers that are the destination of more than
+# one in-flight instruction keep their younger tags, in order, in a
+# dictionary from register id to list of tag ids.
+class RegisterFile:
+    def __init__(self, bank_size=REGISTER_BANK_SIZE):
+        self._bank_size = bank_size
+        self._num_regs  = bank_size*len(REGISTER_BANKS)
+        self._values    = array('d', [DEFAULT_REG_VALUE]) * self._num_regs
+        self._tags      = array('l', [0]) * self._num_regs
+        self._more_tags = {}
+        self._tag_ids   = {}
+        self._tag_list  = [None]
+
+    @property
+    def bank_size(self):
+        return self._bank_size
+
+    @property
+    def values(self):
+        return self._values
+
+    @property
+    def tags(self):
+        return self._tags
+
+    @property
+    def more_tags(self):
+        return self._more_tags
+
+    def __len__(self):
+        return self._num_regs
+
+    # The id of the register with the given name or id.
+    def reg_id(self, reg):
+        if type(reg) == int: reg_id = reg
+        else:                reg_id = register_id(reg)
+        if reg_id >= self._num_regs:
+            raise KeyError(reg)
+        return reg_id
+
+    # The id standing for the tag of the given station.
+    def tag_id(self, rs_type, stat_idx):
+        key = (rs_type, stat_idx)
+        tag_id = self._tag_ids.get(key)
+        if tag_id is None:
+            tag_id = len(self._tag_list)
+            self._tag_ids[key] = tag_id
+            self._tag_list.append(Tag(rs_type, stat_idx))
+        return tag_id
+
+    # The Tag object with the given id. It is shared by every register
+    # holding this tag and must not be modified.
+    def tag(self, tag_id):
+        return self._tag_list[tag_id]
+
+    # The names of the registers, bank by bank: R0, R1, ..., F0, F1, ...
+    def names(self):
+        return [bank + str(num) for bank in REGISTER_BANKS
+                for num in range(self._bank_size)]
+
+    # (name, value) pairs of every register, in the order of names().
+    def items(self):
+        values = self._values
+        return [(name, values[register_id(name)]) for name in self.names()]
+
+
+# The register file by default has 32 registers [0,...,31] in each bank.
+# Every register starts with the default value and no Q_i tag.
+# Q_i values are represented as Tag objects, e.g. (mult,0) or (load,2).
 def create_register_file(max_num_regs=30):
-    reg_file = {"R"+str(k):[[],DEFAULT_REG_VALUE]
-                             for k in range(0,max_num_regs+2,1)}
-    float_point_registers = {"F"+str(k):[[],DEFAULT_REG_VALUE]
-                             for k in range(0,max_num_regs+2,1)}
-    reg_file.update(float_point_registers)
+    return RegisterFile(max_num_regs+2)
+
+
+# Return the value held by a register, given its name or id.
+def get_register_value(reg_file, reg):
+    return reg_file.values[reg_file.reg_id(reg)]
+
 
-    return reg_file
+# Return the (name, value) pairs of all registers in the register file.
+def register_values(reg_file):
+    return reg_file.items()
 
 
 # Load a value into a given register. This function could also
-# be used to reset the register to its default value. 
+# be used to reset the register to its default value.
 def load_register_value(reg_file, reg_name,value=None):
     if value is None: value = DEFAULT_REG_VALUE
-    if isinstance(reg_name,str): reg_file[reg_name][1] = value
+    if isinstance(reg_name,(str,int)):
+        reg_file.values[reg_file.reg_id(reg_name)] = value
 
 
-# Append a Tag object into a register given the register's name.
+# Append a Tag into a register given the register's name (or id).
 # A tag requires the reservation station type and station's index.
-# Checks are put in place to make sure that the Tag does not already
-# exist in the list. Otherwise, the Tag object is added to the list. 
+# If the register's first tag is already this Tag nothing is done.
+# Otherwise, the Tag is added to the end of the register's tags.
 def load_register_tag(reg_file, reg_name, rs_type, stat_idx):
-    tag_list = reg_file[reg_name][0]
-    if not(len(tag_list) == 0):
-        if (tag_list[0].rs_type == rs_type and tag_list[0].idx == stat_idx):
-            return 
-        else:
-            reg_file[reg_name][0].append(Tag(rs_type,stat_idx))
-    else:
-        reg_file[reg_name][0].append(Tag(rs_type,stat_idx))
-
-
-# Find and return the Tag object at the given register in the 
-# register file. 
+    reg_id = reg_file.reg_id(reg_name)
+    tag_id = reg_file.tag_id(rs_type, stat_idx)
+    head   = reg_file.tags[reg_id]
+    if head == 0:
+        reg_file.tags[reg_id] = tag_id
+    elif head != tag_id:
+        more_tags = reg_file.more_tags
+        if reg_id in more_tags: more_tags[reg_id].append(tag_id)
+        else:                   more_tags[reg_id] = [tag_id]
+
+
+# Find and return the Tag object at the given register in the
+# register file, or None if the register has no tag.
 def get_reg_tag(reg_file, reg_name):
-    try:
-        tag = reg_file[reg_name][0][0]
-    except IndexError:
-        return None
+    tag_id = reg_file.tags[reg_file.reg_id(reg_name)]
+    if tag_id == 0: return None
+    return reg_file.tag(tag_id)
 
-    return tag
 
-
-# Given the register list and the correct register name 
-# (key), delete the tag within the register. If no 
-# index is specified then assume that at least one tag is 
-# present within the value of the register and remove the sole tag.
+# Given the register file and the correct register name
+# (or id), delete the tag within the register. If no
+# index is specified then assume that at least one tag is
+# present within the register and remove the first tag.
 def clear_register_tag(reg_file, reg_name,tag_idx=None):
     if tag_idx is None: idx = 0
     else: idx = tag_idx
-    tag_list = reg_file[reg_name][0]
-    del tag_list[idx]
+    reg_id    = reg_file.reg_id(reg_name)
+    more_tags = reg_file.more_tags
+    if reg_file.tags[reg_id] == 0:
+        raise IndexError("Register %s has no tag to clear!" % str(reg_name))
+    if idx == 0:
+        if reg_id in more_tags:
+            reg_file.tags[reg_id] = more_tags[reg_id].pop(0)
+            if not more_tags[reg_id]: del more_tags[reg_id]
+        else:
+            reg_file.tags[reg_id] = 0
+    else:
+        if reg_id not in more_tags or idx > len(more_tags[reg_id]):
+            raise IndexError("Register %s has no tag %d!" % (str(reg_name),
+                                                              idx))
+        del more_tags[reg_id][idx-1]
+        if not more_tags[reg_id]: del more_tags[reg_id]
 
 
-# Determine if the register in the register_file is deemed available. If 
+# Determine if the register in the register_file is deemed available. If
 # no reservation station type and index are not specified, then check to see
-# if the register's Tag list is empty. If a type and index are specified, then
-# if the first Tag's attribute matches the expected type and index OR if the 
-# Tag list at the register is empty, then the register is deemed available.
+# if the register has no tag. If a type and index are specified, then
+# if the first Tag's attribute matches the expected type and index OR if the
+# register has no tag, then the register is deemed available.
 def is_register_available(reg_file, reg_name, exp_type=None, exp_idx=None):
-    try:
-        if not(exp_type is None) and not(exp_idx is None):
-            if ((reg_file[reg_name][0][0].rs_type == exp_type and 
-                reg_file[reg_name][0][0].idx == exp_idx) or 
-                (len(reg_file[reg_name][0]) == 0)):
-                return True
-            elif len(reg_file[reg_name][0]) == 0:
-                return True
-            else:
-                return False
-        else:
-            if len(reg_file[reg_name][0]) == 0:
-                return True
-            else:
-                return False
-    except IndexError:
+    tag_id = reg_file.tags[reg_file.reg_id(reg_name)]
+    if tag_id == 0:
         return True
+    if not(exp_type is None) and not(exp_idx is None):
+        tag = reg_file.tag(tag_id)
+        return tag.rs_type == exp_type and tag.idx == exp_idx
+    return False
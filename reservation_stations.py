@@ -14,19 +14,64 @@ from collections import OrderedDict as OrderedDict
 from tag import Tag
 
 
+# Readiness of a station: whether its instruction can start executing.
+NOT_READY = 0
+READY     = 1
+
+
+# A Station is a single entry of a reservation station. Its fields are:
+# busy status, op name, Qi Tag (the tag of this station), op dest (the id
+# of the destination register), Qj Tag, Vj, Qk Tag, Vk, ready status 
+# (READY or NOT_READY) and the Instruction.
+# Stations are created once per reservation station and reused, so the 
+# fields are kept in slots rather than in a per-object dictionary. A station
+# also knows its index and the reservation station it belongs to, so that
+# a broadcast reaching it through the consumer index can queue it.
+class Station:
+    __slots__ = ("busy", "operation", "qi_tag", "dest", "vj_tag", "vj",
+                 "vk_tag", "vk", "ready", "instr", "idx", "res_stat")
+
+    def __init__(self):
+        self.busy      = False
+        self.operation = None
+        self.qi_tag    = Tag(None,0)
+        self.dest      = None
+        self.vj_tag    = Tag(None,0)
+        self.vj        = None
+        self.vk_tag    = Tag(None,0)
+        self.vk        = None
+        self.ready     = NOT_READY
+        self.instr     = None
+        self.idx       = None
+        self.res_stat  = None
+
+
 # A ReservStation object contains a list of stations each of which is 
 # defined by an OrderedDict in which the key is the index of the station
-# and the value is the following list:
-# [busy status, op name, Qi Tag, op dest, Qj Tag, Vj, Qk Tag, Vk, 
-#  ready status, Instruction]
+# and the value is a Station object.
+# The ready queue holds the indices of the busy stations whose operands are
+# both available (see operands_available) and whose instruction has not
+# started executing: the only stations the Start-Execution block needs to
+# look at. A station enters it when it is populated with its operands
+# available or when the broadcast of its last missing operand clears the
+# tag, and leaves it when its instruction starts or the station is cleared.
+# Which stations are free is kept in a bitmap (bit i set when the station
+# at position i is free) along with the number of busy stations, updated by
+# occupy_station and release_station, so finding a free station or the
+# busy ones does not look at every station.
 class ReservStation:
     def __init__(self,start_idx,num_stations,rs_type):
         self._rs_type = rs_type
         self._num_stations = num_stations
-        self._stations = OrderedDict((key,["No", None, Tag(None,0), None, 
-                                           Tag(None,0), None, Tag(None,0),
-                                           None,"Not Ready", None]) for key in 
+        self._start_idx = start_idx
+        self._stations = OrderedDict((key,Station()) for key in 
                                      range(start_idx, start_idx+num_stations))
+        for stat_idx, station in self._stations.items():
+            station.idx      = stat_idx
+            station.res_stat = self
+        self._ready_queue = set()
+        self._free_mask   = (1 << num_stations) - 1
+        self._num_busy    = 0
     @property
     def rs_type(self):
         return self._rs_type
@@ -39,22 +84,45 @@ class ReservStation:
     def num_stations(self):
         return self._num_stations
 
+    @property
+    def start_idx(self):
+        return self._start_idx
+
+    @property
+    def ready_queue(self):
+        return self._ready_queue
+
+    @property
+    def num_busy(self):
+        return self._num_busy
+
+    # The lowest index of a free station, or None if all are busy.
     def find_nonoccupied_station_idx(self):
-        for station,value in self.stations.items():
-            if value[0] == "No": return station
-        return None
+        free = self._free_mask
+        if not free: return None
+        return self._start_idx + (free & -free).bit_length() - 1
 
     def is_occupied(self):
-        if any(value[0] == "Yes" for station,value in self.stations.items()):
-            return True
-        else:
-            return False
+        return self._num_busy > 0
 
     def find_occupied_station_idx(self):
-        occupied_stations = []
-        for station,value in self.stations.items():
-            if value[0] == "Yes": occupied_stations.append(station)
-        return occupied_stations
+        start_idx = self._start_idx
+        busy = ~self._free_mask & ((1 << self._num_stations) - 1)
+        return [start_idx + pos for pos in fu.set_bits(busy)]
+
+    # Mark the station with the given index as busy.
+    def occupy_station(self, stat_idx):
+        bit = 1 << (stat_idx - self._start_idx)
+        if self._free_mask & bit:
+            self._free_mask ^= bit
+            self._num_busy += 1
+
+    # Mark the station with the given index as free.
+    def release_station(self, stat_idx):
+        bit = 1 << (stat_idx - self._start_idx)
+        if not (self._free_mask & bit):
+            self._free_mask |= bit
+            self._num_busy -= 1
 
 
 # Create the individual reservation stations using the following default
@@ -76,10 +144,31 @@ add_rs   = ReservStation(ADDD_STATION_START,NUM_ADDD_STATIONS,"add")
 mult_rs  = ReservStation(MULTD_STATION_START,NUM_MULTD_STATIONS,"mult")
 
 
+# Replace the reservation stations with empty ones of the given sizes.
+# Station indices stay contiguous across the reservation stations, starting
+# with the load stations at LD_STATION_START. Any sizes not given are reset
+# to their defaults.
+def configure_stations(num_ld=NUM_LD_STATIONS, num_sd=NUM_SD_STATIONS,
+                       num_addd=NUM_ADDD_STATIONS, 
+                       num_multd=NUM_MULTD_STATIONS):
+    global load_rs, store_rs, add_rs, mult_rs
+    for num in (num_ld, num_sd, num_addd, num_multd):
+        if num < 1: 
+            raise ValueError("Reservation stations need at least 1 station!")
+    sd_start    = LD_STATION_START + num_ld
+    addd_start  = sd_start + num_sd
+    multd_start = addd_start + num_addd
+    load_rs  = ReservStation(LD_STATION_START,num_ld,"load")
+    store_rs = ReservStation(sd_start,num_sd,"store")
+    add_rs   = ReservStation(addd_start,num_addd,"add")
+    mult_rs  = ReservStation(multd_start,num_multd,"mult")
+    reset_tag_consumers()
+
+
 # Given a station, determine the corresponding
 # functional unit and return that functioal unit.
 def get_corresponding_fu(station):
-    op = station[1]
+    op = station.operation
     switcher = {"LD": fu.load_fu,
                 "SD": fu.store_fu,
                 "ADDD":fu.add_fu,
@@ -91,124 +180,189 @@ def get_corresponding_fu(station):
     return switcher.get(op,-1)
 
 
+# Determine whether neither operand of the station waits on the result of
+# another station: its Vj and Vk tags are either clear or its own tag.
+def operands_available(res_stat, stat_idx, station):
+    rs_type = res_stat.rs_type
+    vj_tag  = station.vj_tag
+    if not ((vj_tag.rs_type is None and vj_tag.idx == 0) or
+            (vj_tag.rs_type == rs_type and vj_tag.idx == stat_idx)):
+        return False
+    vk_tag  = station.vk_tag
+    return ((vk_tag.rs_type is None and vk_tag.idx == 0) or
+            (vk_tag.rs_type == rs_type and vk_tag.idx == stat_idx))
+
+
 # This function checks to see if the given station is READY
 # to be start execution.
 # The load tag here is meant to handle the case when a register is used
 # consecutively as a destination register (e.g. one load and then
-# another load to the same register):w
+# another load to the same register).
 def is_station_ready(res_stat, stat_idx, reg_file):
     station = res_stat.stations[stat_idx]
-    if (get_corresponding_fu(station) == -1):
+    func_unit = get_corresponding_fu(station)
+    if (func_unit == -1):
         raise ValueError("Invalid instruction operation!")
 
-    func_unit       = get_corresponding_fu(station)
-    vj_tag          = get_station_vj_tag(station)
-    vk_tag          = get_station_vk_tag(station)
-    operand1_ready  = ((vj_tag.rs_type is None and vj_tag.idx == 0) or
-                      (vj_tag.rs_type == res_stat.rs_type and vj_tag.idx == stat_idx))
-    operand2_ready  = ((vk_tag.rs_type is None and vk_tag.idx == 0) or
-                      (vk_tag.rs_type == res_stat.rs_type and vk_tag.idx == stat_idx))
-    dest_ready      = rf.is_register_available(reg_file,
-                                               station[3],
-                                               station[2].rs_type,
-                                               station[2].idx)
-    fu_is_available = func_unit.is_available()
-
-    if (operand1_ready and operand2_ready and dest_ready and fu_is_available):
-        rf.load_register_tag(reg_file, station[3], res_stat.rs_type, 
-                             stat_idx)
-        return True
-    else:
+    rs_type = res_stat.rs_type
+    if not operands_available(res_stat, stat_idx, station):
         return False
+    qi_tag  = station.qi_tag
+    if not rf.is_register_available(reg_file, station.dest, qi_tag.rs_type,
+                                    qi_tag.idx):
+        return False
+    if not func_unit.is_available():
+        return False
+
+    rf.load_register_tag(reg_file, station.dest, rs_type, stat_idx)
+    return True
+
+
+# Determine whether the given station is held back by a tag: an operand
+# still waiting on the result of another station or a destination register
+# whose first tag belongs to another station. These are the checks of
+# is_station_ready that come before the functional unit's availability.
+def is_waiting_on_tag(res_stat, stat_idx, reg_file):
+    station = res_stat.stations[stat_idx]
+    if not operands_available(res_stat, stat_idx, station):
+        return True
+    qi_tag  = station.qi_tag
+    return not rf.is_register_available(reg_file, station.dest, 
+                                        qi_tag.rs_type, qi_tag.idx)
 
 
 # Clear the station within the reservation station (res_stat) object
-# at the given index.
+# at the given index, taking it out of the ready queue.
 def clear_station(res_stat, stat_idx):
-    res_stat.stations[stat_idx][0] = "No"
-    res_stat.stations[stat_idx][1] = None
-    res_stat.stations[stat_idx][2].clear_tag()
-    res_stat.stations[stat_idx][3] = None
-    res_stat.stations[stat_idx][4].clear_tag()
-    res_stat.stations[stat_idx][5] = None
-    res_stat.stations[stat_idx][6].clear_tag()
-    res_stat.stations[stat_idx][7] = None
-    res_stat.stations[stat_idx][8] = "Not Ready"
-
-
-# Clear all the 
+    station           = res_stat.stations[stat_idx]
+    station.busy      = False
+    station.operation = None
+    station.qi_tag.clear_tag()
+    station.dest      = None
+    station.vj_tag.clear_tag()
+    station.vj        = None
+    station.vk_tag.clear_tag()
+    station.vk        = None
+    station.ready     = NOT_READY
+    station.instr     = None
+    res_stat.ready_queue.discard(stat_idx)
+    res_stat.release_station(stat_idx)
+
+
+# Stations waiting on the result of another station are indexed by the
+# producing station's tag, i.e. the (rs_type, idx) pair that appears in their
+# Vj/Vk tag fields. populate_rs registers a station under a tag when it
+# copies that tag from the register file, and a broadcast on the CDB only
+# visits the stations registered under the broadcasted tag instead of every
+# station of every reservation station. The entries for a tag are dropped
+# once its broadcast has cleared the waiting stations' tags.
+tag_consumers = {}
+
+
+# Register the station as waiting on the result of the station identified 
+# by the given tag.
+def register_tag_consumer(tag, station):
+    key = (tag.rs_type, tag.idx)
+    if key in tag_consumers: tag_consumers[key].append(station)
+    else:                    tag_consumers[key] = [station]
+
+
+# Drop every entry of the consumer index, e.g. before starting a new 
+# simulation.
+def reset_tag_consumers():
+    tag_consumers.clear()
+
+
+# Clear the given tag wherever it appears in a station: the Qi tag of 
+# the producing station itself and the Vj/Vk tags of the stations that 
+# were waiting on it. The waiting stations are found through the consumer 
+# index, after which their entries are removed from it. A station whose
+# last missing operand this was enters the ready queue of its reservation
+# station.
 def clear_rs_tags(rs_list, tag):
+    rs_type = tag.rs_type
+    idx     = tag.idx
     for res_stat in rs_list:
-        for stat_idx, station in res_stat.stations.items():
-            if (station[2].rs_type == tag.rs_type and 
-                station[2].idx == tag.idx):
-                station[2].clear_tag()
-            if (station[4].rs_type == tag.rs_type and 
-                station[4].idx == tag.idx):
-                station[4].clear_tag()
-            if (station[6].rs_type == tag.rs_type and 
-                station[6].idx == tag.idx):
-                station[6].clear_tag()
+        if res_stat.rs_type == rs_type:
+            station = res_stat.stations.get(idx)
+            if (station is not None and station.qi_tag.rs_type == rs_type and
+                station.qi_tag.idx == idx):
+                station.qi_tag.clear_tag()
+
+    for station in tag_consumers.pop((rs_type, idx), ()):
+        cleared = False
+        vj_tag = station.vj_tag
+        if vj_tag.rs_type == rs_type and vj_tag.idx == idx:
+            vj_tag.clear_tag()
+            cleared = True
+        vk_tag = station.vk_tag
+        if vk_tag.rs_type == rs_type and vk_tag.idx == idx:
+            vk_tag.clear_tag()
+            cleared = True
+        if cleared and station.busy:
+            res_stat = station.res_stat
+            if operands_available(res_stat, station.idx, station):
+                res_stat.ready_queue.add(station.idx)
 
 
 # This function checks to see what individual stations amongst
 # all reservation stations need their corresponding Vj and Vk
-# values to be updated. First if the tag of station corresponding
-# to Vj value 
+# values to be updated. Only the stations registered in the consumer 
+# index under the broadcasted tag are visited. If a station's Vj (Vk) tag 
+# matches, its Vj (Vk) value is set to the value now held by the 
+# destination register.
 def update_rs_operands(rs_list, reg_file, dest_reg, tag):
-    for res_stat in rs_list:
-        for stat_idx, station in res_stat.stations.items():
-            vj_tag = get_station_vj_tag(station)
-            vk_tag = get_station_vk_tag(station)
-            if (vj_tag.rs_type == tag.rs_type and 
-                vj_tag.idx == tag.idx):
-                #station[5] = reg_file[dest_reg][1]
-                set_station_vj(station, reg_file[dest_reg][1])
-            if (station[6].rs_type == tag.rs_type and 
-                station[6].idx == tag.idx):
-                #station[7] = reg_file[dest_reg][1]
-                set_station_vk(station, reg_file[dest_reg][1])
+    rs_type = tag.rs_type
+    idx     = tag.idx
+    value   = rf.get_register_value(reg_file, dest_reg)
+    for station in tag_consumers.get((rs_type, idx), ()):
+        vj_tag = station.vj_tag
+        if vj_tag.rs_type == rs_type and vj_tag.idx == idx:
+            station.vj = value
+        vk_tag = station.vk_tag
+        if vk_tag.rs_type == rs_type and vk_tag.idx == idx:
+            station.vk = value
 
 
 # Get access to a station's instruction field (column).
 def get_station_instr(station):
-    return station[9]
+    return station.instr
 
 
 # Get the instruction's index of the stations' instruction 
 # field.
 def get_station_instr_idx(station):
-    return station[9].instr_index
+    return station.instr.instr_index
 
 
 # Get the Vj tag of the station.
 def get_station_vj_tag(station):
-    return station[4]
+    return station.vj_tag
 
 
 # Get the Vj value of the station.
 def get_station_vj(station):
-    return station[5]
+    return station.vj
 
 
 # Set the Vj value to a user-specified value.
 def set_station_vj(station,value):
-    station[5] = value
+    station.vj = value
 
 
 # Get the Vk tag of the station.
 def get_station_vk_tag(station):
-    return station[6]
+    return station.vk_tag
 
 
 # Get the Vk tag of the station.
 def get_station_vk(station):
-    return station[7]
+    return station.vk
 
 
 # Set the Vj value to a user-specified value.
 def set_station_vk(station,value):
-    station[7] = value
+    station.vk = value
 
 
 # Given the station, attempt to execute the 
@@ -218,79 +372,87 @@ def set_station_vk(station,value):
 # register. If the operation is arithmetic, then return
 # the result of that actual operation. 
 def execute_station_op(station, reg_file):
-    operation = station[1]
-    dest      = station[3]
-    operand1  = station[5]
-    operand2  = station[7]
+    operation = station.operation
+    operand1  = station.vj
+    operand2  = station.vk
     
     if operation == "ADDD":    return (operand1 + operand2)
     elif operation == "SUBD":  return (operand1 - operand2)
     elif operation == "MULTD": return (1.0*(operand1*operand2))
     elif operation == "DIVD":  return (operand1/(1.0*operand2))
-    elif operation == "LD":    return reg_file[dest][1]
-    elif operation == "SD":    return reg_file[dest][1]
+    elif operation == "LD":    return rf.get_register_value(reg_file, 
+                                                            station.dest)
+    elif operation == "SD":    return rf.get_register_value(reg_file, 
+                                                            station.dest)
     else: raise ValueError("Invalid instruction operation")
 
 
+# Fill in the Vj or Vk field of a station from an instruction operand,
+# given along with its register id (None for an immediate operand).
+# If the operand is an integer value then it is used directly; if not then
+# check to see if the register/operand is available by looking at its Tag
+# list. If it is available then the field is loaded with the value at that
+# register. If it is not available then the value is left empty, the tag
+# field is assigned the Tag of the register and the station is registered
+# as a consumer of that tag. Returns the value for the field.
+def read_operand(res_stat, stat_idx, station, operand, operand_id, op_tag,
+                 reg_file):
+    if operand_id is None:
+        op_tag.clear_tag()
+        return operand
+    if rf.is_register_available(reg_file, operand_id, res_stat.rs_type, 
+                                stat_idx):
+        op_tag.clear_tag()
+        return reg_file.values[operand_id]
+    reg_tag        = rf.get_reg_tag(reg_file, operand_id)
+    op_tag.rs_type = reg_tag.rs_type
+    op_tag.idx     = reg_tag.idx
+    register_tag_consumer(op_tag, station)
+    return None
+
+
 # Assume that stat_idx is valid index of a non-busy station. 
 # The Reservation Station object and proper index is passed in 
 # order to begin filing out the columns of the station. Since the 
-# station is being populated, it is marked "Yes" to mean it's buy.
+# station is being populated, it is marked busy.
 # The corresponding instruction's operation, destination, and instruction
 # object itself is loaded into the station so that the simulator loop
 # will not need to keep a copy of the instruction list after the instruction
 # has been issued. Load the destination register with the tag of this 
 # station (giving the registr the type of RS and the index of the station).
 # Then determine if the operands of the instruction are ready and can be loaded
-# into the Vj and/or Vk fields of the station. If the operand is an integer
-# value then it can, if not then check to see if the register/operand is 
-# available by looking at its Tag list. If the operand is available then 
-# load stations Vj and/or Vk fields with the value at that register. If it 
-# is not available then leave the Vj and/or Vk fields empty and assign
-# Vj_tag and Vk_tag fields of the station to Tag of the register.
+# into the Vj and/or Vk fields of the station (see read_operand); if both
+# are available the station enters the ready queue.
 # Lastly, check to see if this station is 'Ready' (to be executed).
 def populate_rs(res_stat, stat_idx, instr, reg_file):
-    res_stat.stations[stat_idx][0]         = "Yes"
-    res_stat.stations[stat_idx][1]         = instr.operation
-    res_stat.stations[stat_idx][3]         = instr.dest
-    res_stat.stations[stat_idx][9]         = instr
-    res_stat.stations[stat_idx][2].rs_type = res_stat.rs_type
-    res_stat.stations[stat_idx][2].idx     = stat_idx
-
-    rf.load_register_tag(reg_file, instr.dest, res_stat.rs_type, stat_idx)
+    rs_type           = res_stat.rs_type
+    station           = res_stat.stations[stat_idx]
+    station.busy      = True
+    res_stat.occupy_station(stat_idx)
+    station.operation = instr.operation
+    station.dest      = instr.dest_id
+    station.instr     = instr
+    station.qi_tag.rs_type = rs_type
+    station.qi_tag.idx     = stat_idx
+
+    rf.load_register_tag(reg_file, instr.dest_id, rs_type, stat_idx)
     
-    vj_tag = get_station_vj_tag(res_stat.stations[stat_idx])
-    vj_val = get_station_vj(res_stat.stations[stat_idx])
-    vk_tag = get_station_vk_tag(res_stat.stations[stat_idx])
-    vk_val = get_station_vk(res_stat.stations[stat_idx])
-
-    if type(instr.operand1) == int:
-        vj_tag.clear_tag()
-        set_station_vj(res_stat.stations[stat_idx], instr.operand1)
-    else:
-        if rf.is_register_available(reg_file, instr.operand1, res_stat.rs_type,
-                                   stat_idx):
-            vj_tag.clear_tag()
-            set_station_vj(res_stat.stations[stat_idx],
-                           reg_file[instr.operand1][1])
-        else:
-            vj_tag.rs_type = rf.get_reg_tag(reg_file, instr.operand1).rs_type
-            vj_tag.idx = rf.get_reg_tag(reg_file, instr.operand1).idx
-    
-    if type(instr.operand2) == int:
-        vk_tag.clear_tag()
-        set_station_vk(res_stat.stations[stat_idx], instr.operand2)
-    else:
-        if rf.is_register_available(reg_file, instr.operand2, res_stat.rs_type,
-                                   stat_idx):
-            vk_tag.clear_tag()
-            set_station_vk(res_stat.stations[stat_idx], 
-                           reg_file[instr.operand2][1])
-        else:
-            vk_tag.rs_type = rf.get_reg_tag(reg_file, instr.operand2).rs_type
-            vk_tag.idx = rf.get_reg_tag(reg_file, instr.operand2).idx
+    # The operands are only looked at by name when they are immediates, so
+    # an instruction built from register ids never needs its names.
+    operand1_id = instr.operand1_id
+    operand2_id = instr.operand2_id
+    vj = read_operand(res_stat, stat_idx, station, 
+                      instr.operand1 if operand1_id is None else None,
+                      operand1_id, station.vj_tag, reg_file)
+    if vj is not None: station.vj = vj
+    vk = read_operand(res_stat, stat_idx, station,
+                      instr.operand2 if operand2_id is None else None,
+                      operand2_id, station.vk_tag, reg_file)
+    if vk is not None: station.vk = vk
+    if operands_available(res_stat, stat_idx, station):
+        res_stat.ready_queue.add(stat_idx)
     
     if is_station_ready(res_stat, stat_idx, reg_file):
-        res_stat.stations[stat_idx][2].rs_type = res_stat.rs_type
-        res_stat.stations[stat_idx][2].idx = stat_idx
-        res_stat.stations[stat_idx][8] = "Ready"
+        station.qi_tag.rs_type = rs_type
+        station.qi_tag.idx     = stat_idx
+        station.ready          = READY
@@ -0,0 +1,368 @@
+#!/usr/env/python
+# This module keeps the results of finished simulations on disk, so that a
+# trace that has already been simulated on a machine is never simulated
+# again. An entry is addressed by a hash of the decoded instructions of the
+# trace together with every parameter of the MachineConfig (see
+# machine_config.py), and holds the final instruction table, issue counts
+# and register file of the run, along with its aggregate statistics if they
+# were collected. Since the instructions are hashed after decoding, the
+# text and binary forms of a trace share their entries. The digest of a
+# trace file is itself remembered by the file's size and modification time,
+# so a hit does not need to read the trace again.
+# Entries live in files under the cache directory and are evicted, least
+# recently used first, once their total size goes over the limit. In verify
+# mode every hit is simulated again and compared with the stored result,
+# and an entry that no longer matches is replaced.
+
+
+import os
+import sys
+import zlib
+import json
+import pickle
+import hashlib
+import argparse
+import checkpoint as cp
+import instruction_reader as ir
+import instruction_table as it
+import register_file as rf
+import machine_config as mc
+import tomasulo_sim as ts
+import output_writers as ow
+
+
+CACHE_MAGIC       = b"TOMRES01"
+CACHE_VERSION     = 2 # Bump whenever a change to the simulator changes results
+COMPRESSION_LEVEL = 6 # zlib level of the pickled entries
+DEFAULT_MAX_BYTES = 256*1024*1024
+DEFAULT_CACHE_DIR = os.environ.get("TOMASULO_CACHE_DIR",
+                                   os.path.join(os.path.expanduser("~"),
+                                                ".cache", "tomasulo_sim"))
+ENTRY_SUFFIX      = ".res"
+TRACES_DIR        = "traces" # Digests of trace files by path
+
+
+# Feed the decoded fields of every given instruction to the hasher. The
+# latencies are left out since they follow from the operation and the
+# machine parameters, which are part of the key.
+def hash_instructions(hasher, instructions):
+    for instr in instructions:
+        if instr.operand1_id is None: operand1 = "#%d" % instr.operand1
+        else:                         operand1 = "r%d" % instr.operand1_id
+        if instr.operand2_id is None: operand2 = "#%d" % instr.operand2
+        else:                         operand2 = "r%d" % instr.operand2_id
+        hasher.update(("%s %d %s %s\n" % (instr.operation, instr.dest_id,
+                                          operand1, operand2)).encode())
+
+
+# Yield the instructions of the given trace file, text or binary.
+def iter_trace(filename):
+    stream = ts.open_instruction_source(filename)
+    instr = stream.advance()
+    while instr is not None:
+        yield instr
+        instr = stream.advance()
+
+
+# Hex digest of the decoded instructions of a trace file or list.
+def instructions_digest(source):
+    hasher = hashlib.sha256()
+    if cp.reads_trace_file(source): hash_instructions(hasher,
+                                                      iter_trace(source))
+    else:                           hash_instructions(hasher, source)
+    return hasher.hexdigest()
+
+
+# Compare two runs. Returns the name of the first part of the results that
+# differs, or None if they match.
+def compare_results(result, expected):
+    if result.clock_cycle != expected.clock_cycle:
+        return "clock cycle"
+    for name in it.COLUMNS:
+        if (result.instr_table.column(name) !=
+            expected.instr_table.column(name)):
+            return name
+    if result.instr_table.issue_counts != expected.instr_table.issue_counts:
+        return "issue counts"
+    # The raw bytes are compared, since a register may hold a NaN.
+    if (result.reg_file.values.tobytes() !=
+        expected.reg_file.values.tobytes()):
+        return "registers"
+    return None
+
+
+# The result of a run (see tomasulo_sim.SimulationResult), either read from
+# the cache or simulated. hit is set if it came from the cache.
+class CachedResult(ts.SimulationResult):
+    def __init__(self, clock_cycle, instr_table, reg_file, completed,
+                 stats=None, hit=False):
+        ts.SimulationResult.__init__(self, clock_cycle, instr_table,
+                                     reg_file, completed, stats)
+        self._hit = hit
+
+    @property
+    def hit(self):
+        return self._hit
+
+    # The contents of the entry stored for this result.
+    def to_entry(self, key):
+        table = self._instr_table
+        return {"key":          key,
+                "clock_cycle":  self._clock_cycle,
+                "columns":      [table.column(name) for name in it.COLUMNS],
+                "issue_counts": table.issue_counts,
+                "bank_size":    self._reg_file.bank_size,
+                "registers":    self._reg_file.values,
+                "stats":        self._stats}
+
+    @classmethod
+    def from_entry(cls, entry):
+        table = it.InstructionTable()
+        for name, values in zip(it.COLUMNS, entry["columns"]):
+            table.column(name).extend(values)
+        table.num_completed = len(table)
+        table.issue_counts.update(entry["issue_counts"])
+        reg_file = rf.RegisterFile(entry["bank_size"])
+        reg_file.values[:] = entry["registers"]
+        return cls(entry["clock_cycle"], table, reg_file, True,
+                   entry["stats"], True)
+
+    @classmethod
+    def from_result(cls, result):
+        return cls(result.clock_cycle, result.instr_table, result.reg_file,
+                   result.completed, result.stats)
+
+    @classmethod
+    def from_state(cls, state):
+        return cls.from_result(ts.SimulationResult.from_state(state))
+
+
+# The cache of results kept in the given directory (DEFAULT_CACHE_DIR if
+# none is given), holding at most about max_bytes of entries. Hits, misses
+# and, in verify mode, the hits that did not match a fresh simulation are
+# counted.
+class ResultCache:
+    def __init__(self, directory=None, max_bytes=DEFAULT_MAX_BYTES,
+                 verify=False):
+        if directory is None: directory = DEFAULT_CACHE_DIR
+        self._directory  = directory
+        self._max_bytes  = max_bytes
+        self._verify     = verify
+        self.hits        = 0
+        self.misses      = 0
+        self.mismatches  = 0
+
+    @property
+    def directory(self):
+        return self._directory
+
+    @property
+    def max_bytes(self):
+        return self._max_bytes
+
+    @property
+    def verify(self):
+        return self._verify
+
+    # Entries are spread over subdirectories named after the first two
+    # characters of their key.
+    def entry_path(self, key):
+        return os.path.join(self._directory, key[:2], key + ENTRY_SUFFIX)
+
+    # Digest of the instructions of the given trace file or list. The
+    # digest of a file is remembered along with its size and modification
+    # time and only computed again once the file changes.
+    def trace_digest(self, source):
+        if not cp.reads_trace_file(source):
+            return instructions_digest(source)
+        if source is None: source = ir.DEFAULT_INPUT_FILE
+        fingerprint = "%d %d" % cp.trace_fingerprint(source)
+        name = hashlib.sha1(os.path.abspath(source).encode()).hexdigest()
+        path = os.path.join(self._directory, TRACES_DIR, name)
+        try:
+            with open(path) as fp:
+                (stored, digest) = fp.read().rsplit(" ", 1)
+            if stored == fingerprint:
+                return digest
+        except (OSError, ValueError):
+            pass
+        digest = instructions_digest(source)
+        write_atomically(path, ("%s %s" % (fingerprint, digest)).encode())
+        return digest
+
+    # Key of the result of the given trace on the given machine (the
+    # default machine if none is given).
+    def key(self, source=None, config=None):
+        if config is None: config = mc.MachineConfig()
+        hasher = hashlib.sha256()
+        hasher.update(("tomasulo_sim result %d\n" % CACHE_VERSION).encode())
+        hasher.update((self.trace_digest(source) + "\n").encode())
+        hasher.update(json.dumps(config.to_dict(), sort_keys=True).encode())
+        return hasher.hexdigest()
+
+    # The CachedResult stored under the given key, or None. A corrupt entry
+    # is removed. Reading an entry marks it as recently used.
+    def get(self, key):
+        path = self.entry_path(key)
+        try:
+            with open(path, 'rb') as fp:
+                data = fp.read()
+        except OSError:
+            return None
+        try:
+            if not data.startswith(CACHE_MAGIC):
+                raise ValueError(path)
+            entry = pickle.loads(zlib.decompress(data[len(CACHE_MAGIC):]))
+            if entry["key"] != key:
+                raise ValueError(path)
+        except Exception:
+            remove_file(path)
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return CachedResult.from_entry(entry)
+
+    # Store a finished result under the given key, then evict entries if
+    # the cache has grown over its limit.
+    def put(self, key, result):
+        if not result.completed:
+            raise ValueError("Only finished simulations can be cached!")
+        data = pickle.dumps(result.to_entry(key), pickle.HIGHEST_PROTOCOL)
+        write_atomically(self.entry_path(key),
+                         CACHE_MAGIC + zlib.compress(data, COMPRESSION_LEVEL))
+        self.evict()
+
+    # (path, size, time of last use) of every entry.
+    def entries(self):
+        entries = []
+        if not os.path.isdir(self._directory): return entries
+        for subdir in os.scandir(self._directory):
+            if not subdir.is_dir() or subdir.name == TRACES_DIR: continue
+            for entry in os.scandir(subdir.path):
+                if not entry.name.endswith(ENTRY_SUFFIX): continue
+                try:
+                    info = entry.stat()
+                except OSError:
+                    continue
+                entries.append((entry.path, info.st_size, info.st_mtime_ns))
+        return entries
+
+    # Total size of the entries in bytes.
+    def size(self):
+        return sum(size for path, size, used in self.entries())
+
+    # Remove the least recently used entries until the total size is
+    # within the limit. Returns the number of entries removed.
+    def evict(self):
+        entries = self.entries()
+        total = sum(size for path, size, used in entries)
+        num_removed = 0
+        for path, size, used in sorted(entries, key=lambda entry: entry[2]):
+            if total <= self._max_bytes: break
+            remove_file(path)
+            total -= size
+            num_removed += 1
+        return num_removed
+
+    # Remove every entry and remembered trace digest.
+    def clear(self):
+        for path, size, used in self.entries():
+            remove_file(path)
+        traces = os.path.join(self._directory, TRACES_DIR)
+        if os.path.isdir(traces):
+            for entry in os.scandir(traces):
+                remove_file(entry.path)
+
+    # Return the CachedResult of the given trace (a file name or a list of
+    # instructions) on the given machine, simulating it only if it is not
+    # in the cache. If collect_stats is set, a stored result without
+    # statistics counts as a miss. If max_cycles is given, a stored result
+    # only counts if it finished by then. Only finished simulations are
+    # stored.
+    def run(self, source=None, config=None, max_cycles=None,
+            collect_stats=False):
+        if not cp.reads_trace_file(source): source = list(source)
+        key    = self.key(source, config)
+        result = self.get(key)
+        if (result is not None and
+            ((collect_stats and result.stats is None) or
+             (max_cycles is not None and result.clock_cycle > max_cycles))):
+            result = None
+        if result is not None and not self._verify:
+            self.hits += 1
+            return result
+
+        fresh = CachedResult.from_result(ts.simulate(source, config,
+                                                     event_driven=True,
+                                                     max_cycles=max_cycles,
+                                                     collect_stats=
+                                                     collect_stats))
+        if result is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            if compare_results(fresh, result) is None: return result
+            self.mismatches += 1
+        if fresh.completed: self.put(key, fresh)
+        return fresh
+
+
+# Write data to the given file under a temporary name and then rename it,
+# so that readers in other processes never see a partial file.
+def write_atomically(path, data):
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory): os.makedirs(directory, exist_ok=True)
+    tmp_path = "%s.%d.tmp" % (path, os.getpid())
+    with open(tmp_path, 'wb') as fp:
+        fp.write(data)
+    os.replace(tmp_path, path)
+
+
+# Remove a file that another process may have removed already.
+def remove_file(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+# Main block: print the final table and registers of the given trace from
+# the cache, simulating it on a miss, e.g.
+#   python result_cache.py trace.txt --add-latency 4 --verify
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Cached simulation of a "
+                                     "trace")
+    parser.add_argument("filename", nargs="?", default=None)
+    for name in mc.PARAMETERS:
+        parser.add_argument("--" + name.replace("_", "-"), type=int,
+                            dest=name)
+    parser.add_argument("--cache-dir", default=None)
+    parser.add_argument("--max-bytes", type=int, default=DEFAULT_MAX_BYTES,
+                        help="size limit of the cache in bytes")
+    parser.add_argument("--max-cycles", type=int, default=None)
+    parser.add_argument("--verify", action="store_true",
+                        help="simulate hits again and check them")
+    parser.add_argument("--clear", action="store_true",
+                        help="remove every entry and exit")
+    args = parser.parse_args()
+
+    cache = ResultCache(args.cache_dir, args.max_bytes, args.verify)
+    if args.clear:
+        cache.clear()
+        sys.exit(0)
+
+    config = mc.MachineConfig(**{name: getattr(args, name)
+                                 for name in mc.PARAMETERS
+                                 if getattr(args, name) is not None})
+    result = cache.run(args.filename, config, args.max_cycles)
+    writer = ow.TextWriter(sys.stdout)
+    writer.write_final(result.clock_cycle, result.instr_table,
+                       result.reg_file)
+    writer.close()
+    sys.stderr.write("%s, %d cycles\n" % ("hit" if result.hit else "miss",
+                                          result.clock_cycle))
+    if cache.mismatches:
+        sys.stderr.write("The cached result did not match the simulation!\n")
+        sys.exit(1)
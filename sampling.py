@@ -0,0 +1,270 @@
+#!/usr/env/python
+# This module estimates the number of clock cycles a long trace takes
+# without simulating all of it in detail. Most of the trace is fast-
+# forwarded: each instruction only applies its architectural effect on the
+# register file in program order, as in the functional-only mode (see
+# functional.py). Windows of the trace, either periodic or starting at
+# chosen instructions, are run through the full Tomasulo timing model from
+# the register values reached by the fast-forward. Each window is preceded
+# by a warm-up run in detail whose timing is discarded, so that the
+# reservation stations and functional units are filled as they would be
+# mid-trace. A window that does not finish on the machine is skipped: its
+# instructions are fast-forwarded and it is reported as skipped.
+# The cycles per instruction (CPI) of a window is the number of cycles
+# between the issue of its first instruction and the issue of the
+# instruction following it, divided by its number of instructions. The
+# total is extrapolated from the mean CPI plus the mean number of cycles
+# the machine takes to drain after the last issue, and its error is given
+# as a confidence interval over the CPI of the windows.
+
+
+import sys
+import copy
+import math
+import json
+import argparse
+import register_file as rf
+import reservation_stations as rs
+import functional as fn
+import machine_config as mc
+import tomasulo_sim as ts
+
+
+DEFAULT_PERIOD     = 10000 # Instructions between the starts of windows
+DEFAULT_WINDOW     = 500   # Instructions timed in detail per window
+DEFAULT_WARMUP     = 100   # Instructions run in detail before each window
+CONFIDENCE_Z       = 1.96  # z-score of the confidence interval (95%)
+MAX_CYCLES_PER_INSTRUCTION = 100 # Guard against windows that never finish
+
+
+# Run the given instructions through the timing model on the given machine,
+# starting from an empty machine whose registers hold the values of the
+# given register file. Copies of the instructions renumbered from 0 are
+# run, for the window's own instruction table. Returns the table and the
+# final clock cycle, or None if the window did not finish.
+def run_window(instructions, reg_file, config=None):
+    instructions = [copy.copy(instr) for instr in instructions]
+    for idx, instr in enumerate(instructions):
+        instr.instr_index = idx
+    mc.apply_config(config)
+    state = ts.SimulatorState(instructions)
+    state.reg_file.values[:] = reg_file.values
+    ts.advance_simulation(state, max_cycles=MAX_CYCLES_PER_INSTRUCTION *
+                          (len(instructions) + 1))
+    if not state.is_finished():
+        return None
+    return state.instr_table, state.clock_cycle
+
+
+# The SamplingResult holds the windows timed in detail, each a dictionary
+# with the index of its first instruction (in the trace), its number of
+# instructions, the cycles they took to issue, their CPI and the cycles
+# the machine took to drain after its last issue, along with the total
+# number of instructions, the final register file of the fast-forward and
+# the index of the first instruction of every window that was skipped
+# because it did not finish.
+class SamplingResult:
+    def __init__(self, num_instrs, windows, reg_file, skipped=None):
+        self._num_instrs = num_instrs
+        self._windows    = windows
+        self._reg_file   = reg_file
+        self._skipped    = [] if skipped is None else skipped
+
+    @property
+    def num_instructions(self):
+        return self._num_instrs
+
+    @property
+    def windows(self):
+        return self._windows
+
+    @property
+    def reg_file(self):
+        return self._reg_file
+
+    @property
+    def skipped(self):
+        return self._skipped
+
+    @property
+    def num_detailed(self):
+        return sum(window["num_instructions"] for window in self._windows)
+
+    # Mean CPI of the windows, or None if there are none.
+    @property
+    def cpi(self):
+        if not self._windows: return None
+        return (sum(window["cpi"] for window in self._windows) /
+                len(self._windows))
+
+    # Estimated total number of clock cycles: the first instruction issues
+    # in cycle 1, every later one takes the mean CPI and the machine then
+    # drains for the mean drain of the windows.
+    @property
+    def estimated_cycles(self):
+        if not self._windows or self._num_instrs == 0: return None
+        drain = (sum(window["drain"] for window in self._windows) /
+                 float(len(self._windows)))
+        return 1 + self.cpi*(self._num_instrs - 1) + drain
+
+    # Half-width of the confidence interval of the estimated total, from
+    # the standard error of the mean CPI with a finite population
+    # correction for the part of the trace that was timed. None if fewer
+    # than two windows were timed.
+    @property
+    def error(self):
+        num_windows = len(self._windows)
+        if num_windows < 2: return None
+        cpi = self.cpi
+        variance = (sum((window["cpi"] - cpi)**2 for window in self._windows)
+                    / (num_windows - 1))
+        fraction = min(1.0, self.num_detailed/float(self._num_instrs))
+        std_error = math.sqrt(variance/num_windows*(1.0 - fraction))
+        return CONFIDENCE_Z*std_error*(self._num_instrs - 1)
+
+    def to_dict(self):
+        return {"num_instructions":  self._num_instrs,
+                "num_detailed":      self.num_detailed,
+                "cpi":               self.cpi,
+                "estimated_cycles":  self.estimated_cycles,
+                "error":             self.error,
+                "windows":           self._windows,
+                "skipped":           self._skipped,
+                "registers":         dict(rf.register_values(self._reg_file))}
+
+
+# Yield the index of the first instruction of every window: the given
+# starts in increasing order, or every period instructions starting half a
+# period into the trace, so that each window sits in the middle of the
+# part of the trace it stands for.
+def window_starts(period=DEFAULT_PERIOD, starts=None):
+    if starts is not None:
+        for start in sorted(set(starts)):
+            yield start
+        return
+    start = period // 2
+    while True:
+        yield start
+        start += period
+
+
+# Run the sampled simulation of the given trace on the given machine (the
+# default machine if none is given). Windows of window instructions start
+# every period instructions, or at the given instruction indices, and are
+# preceded by up to warmup instructions run in detail. Windows that would
+# overlap the previous one are skipped and the last window is cut short at
+# the end of the trace. Windows that do not finish on the machine are
+# fast-forwarded instead and listed as skipped. Returns a SamplingResult.
+def run_sampled(filename=None, config=None, period=DEFAULT_PERIOD,
+                window=DEFAULT_WINDOW, warmup=DEFAULT_WARMUP, starts=None):
+    if window < 1: raise ValueError("Windows need at least 1 instruction!")
+    if starts is None and period < window:
+        raise ValueError("The period cannot be shorter than the window!")
+    mc.apply_config(config)
+    instr_source = ts.open_instruction_source(filename)
+    reg_file     = rf.create_register_file()
+    station      = rs.Station()
+    windows      = []
+    skipped      = []
+    position     = 0
+
+    for start in window_starts(period, starts):
+        if start < position: continue
+        begin = max(position, start - warmup)
+        position += fn.fast_forward(instr_source, reg_file,
+                                    begin - position, station)
+        if position < begin: break
+
+        # The instruction following the window is run as well, since the
+        # window ends when it issues.
+        instructions = []
+        while len(instructions) < start - begin + window + 1:
+            instr = instr_source.advance()
+            if instr is None: break
+            instructions.append(instr)
+        num_warmup = start - begin
+        num_timed  = len(instructions) - num_warmup - 1
+        if num_timed < 1:
+            for instr in instructions:
+                fn.execute_instruction(instr, reg_file, station)
+            position += len(instructions)
+            break
+
+        result = run_window(instructions, reg_file, config)
+        if result is None:
+            skipped.append(start)
+        else:
+            (instr_table, clock_cycle) = result
+            last   = num_warmup + num_timed
+            cycles = instr_table.issue[last] - instr_table.issue[num_warmup]
+            windows.append({"start": start,
+                            "num_instructions": num_timed,
+                            "cycles": cycles,
+                            "cpi": cycles/float(num_timed),
+                            "drain": clock_cycle - instr_table.issue[last]})
+        for instr in instructions:
+            fn.execute_instruction(instr, reg_file, station)
+        position += len(instructions)
+
+    position += fn.fast_forward(instr_source, reg_file, None, station)
+    mc.apply_config(config)
+    return SamplingResult(position, windows, reg_file, skipped)
+
+
+# Print the windows and the estimate.
+def print_result(result, fp=sys.stdout):
+    fp.write("%10s %10s %10s %8s %8s\n" % ("Start", "Instrs", "Cycles",
+                                           "CPI", "Drain"))
+    for window in result.windows:
+        fp.write("%10d %10d %10d %8.3f %8d\n" %
+                 (window["start"], window["num_instructions"],
+                  window["cycles"], window["cpi"], window["drain"]))
+    fp.write("Instructions: %d (%d timed in detail)\n" %
+             (result.num_instructions, result.num_detailed))
+    if result.skipped:
+        fp.write("Skipped windows (did not finish): %s\n" %
+                 ", ".join("%d" % start for start in result.skipped))
+    estimate = result.estimated_cycles
+    if estimate is None:
+        fp.write("No window was timed, no estimate.\n")
+    elif result.error is None:
+        fp.write("Estimated cycles: %.0f (error unknown)\n" % estimate)
+    else:
+        fp.write("Estimated cycles: %.0f +/- %.0f (%.1f%%)\n" %
+                 (estimate, result.error, 100.0*result.error/estimate))
+
+
+# Main block: estimate the cycles of the given trace on the machine given by
+# one option per machine parameter, e.g.
+#   python sampling.py trace.txt --period 20000 --window 1000 --add-latency 4
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Sampled simulation of a "
+                                     "trace")
+    parser.add_argument("filename", nargs="?", default=None)
+    parser.add_argument("--period", type=int, default=DEFAULT_PERIOD,
+                        help="instructions between the starts of windows")
+    parser.add_argument("--window", type=int, default=DEFAULT_WINDOW,
+                        help="instructions timed in detail per window")
+    parser.add_argument("--warmup", type=int, default=DEFAULT_WARMUP,
+                        help="instructions run in detail before each window")
+    parser.add_argument("--starts", type=mc.int_list, default=None,
+                        help="comma-separated first instructions of the "
+                        "windows (instead of periodic windows)")
+    parser.add_argument("--json", action="store_true",
+                        help="write the result as JSON")
+    for name in mc.PARAMETERS:
+        parser.add_argument("--" + name.replace("_", "-"), type=int,
+                            dest=name)
+    args = parser.parse_args()
+
+    config = mc.MachineConfig(**{name: getattr(args, name)
+                                 for name in mc.PARAMETERS
+                                 if getattr(args, name) is not None})
+    result = run_sampled(args.filename, config, period=args.period,
+                         window=args.window, warmup=args.warmup,
+                         starts=args.starts)
+    if args.json:
+        json.dump(result.to_dict(), sys.stdout)
+        sys.stdout.write("\n")
+    else:
+        print_result(result)
@@ -0,0 +1,592 @@
+#!/usr/env/python
+# This module runs the simulator as a long-lived local service, so that
+# many clients can share one machine without starting an interpreter for
+# every trace. Clients connect to a Unix socket (or a TCP port) and
+# exchange newline-delimited JSON messages with the service. A job is
+# submitted with e.g.
+#   {"op": "run", "id": "j1", "trace": "LD F6 34+ R2\n...",
+#    "config": {"add_latency": 4}, "per_cycle": true}
+# where the trace is given either as text ("trace") or as the name of a
+# file the service can read ("filename"), and "config" holds the
+# parameters of a MachineConfig (see machine_config.py) that differ from
+# the default machine. "format" (the name of an output writer, see
+# output_writers.py, "text" by default), "per_cycle", "event_driven",
+# "max_cycles" and "stats" mean what the options of tomasulo_sim.py do.
+# With "result" set, the done message holds the whole result of the job
+# (see tomasulo_sim.SimulationResult.to_dict), e.g. for a client that does
+# not want to parse the output, which can then be turned off with the
+# "none" format.
+# The service answers with messages holding the id of the job and an
+# "event":
+#   accepted  - the job was admitted and waits for a worker
+#   started   - a worker started running the job
+#   output    - the next chunk of the output of the job ("data")
+#   done      - the job stopped; holds its final clock cycle, whether it
+#               completed and its aggregate statistics (see sim_stats.py),
+#               or its whole result
+#   cancelled - the job was cancelled
+#   error     - the request was invalid or the job failed ("message")
+#   rejected  - the service already holds as many jobs as it admits
+# {"op": "cancel", "id": "j1"} cancels a job and {"op": "status"} reports
+# the number of jobs running and waiting for a worker. Closing the
+# connection cancels the jobs submitted on it.
+# Only clients on the Unix socket may name a file: on a TCP port, which
+# listens on the loopback interface unless another host is given, jobs
+# must send their trace as text.
+# Jobs run in a pool of worker processes that import the simulator and
+# run a small trace when they start, before any job is accepted. Workers
+# send the output and the outcome of their jobs back through one queue,
+# read by a thread of the service that hands them to the event loop, so
+# output is streamed as it is written. A running job checks whether it has
+# been cancelled every CANCEL_CHECK_CYCLES clock cycles and whenever it
+# sends output. If a worker dies, the pool is broken: the jobs it held end
+# with an error and a new pool of workers is started.
+
+
+import os
+import sys
+import json
+import signal
+import socket
+import asyncio
+import argparse
+import tempfile
+import threading
+import multiprocessing
+import instruction_reader as ir
+import binary_trace as bt
+import machine_config as mc
+import output_writers as ow
+import tomasulo_sim as ts
+from multiprocessing.managers import SyncManager
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+
+DEFAULT_SOCKET      = os.environ.get("TOMASULO_SOCKET",
+                                     os.path.join(tempfile.gettempdir(),
+                                                  "tomasulo_sim.sock"))
+DEFAULT_HOST        = "127.0.0.1"
+DEFAULT_MAX_QUEUED  = 64      # Jobs waiting for a worker before rejecting
+DEFAULT_CHUNK_SIZE  = 1 << 12 # Characters of output sent at once
+CANCEL_CHECK_CYCLES = 1000    # Clock cycles between checks for cancellation
+MAX_REQUEST_SIZE    = 1 << 26 # Longest request line accepted (64 MB)
+FINAL_EVENTS        = ("done", "cancelled", "error", "rejected")
+
+# Trace run by every worker when it starts.
+WARMUP_TRACE = ("LD F6 34+ R2", "SD F2 0 R3", "MULTD F0 F2 F4",
+                "SUBD F8 F6 F2", "DIVD F10 F0 F6", "ADDD F6 F8 F2")
+
+
+# State of a worker process: the queue of the messages it sends back and
+# the keys of the jobs that have been cancelled, shared with the service.
+_events    = None
+_cancelled = None
+
+
+class JobCancelled(Exception):
+    pass
+
+
+# Leave interrupts (Ctrl-C) to the service, which shuts the processes it
+# started down itself.
+def ignore_interrupts():
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+# Set up a worker process of the pool.
+def init_worker(events, cancelled):
+    global _events, _cancelled
+    ignore_interrupts()
+    _events    = events
+    _cancelled = cancelled
+    ts.simulate(ir.iter_text_instructions(WARMUP_TRACE))
+
+
+# Do nothing, to wait for a worker of the pool to be started.
+def ping_worker():
+    return os.getpid()
+
+
+def check_cancelled(key):
+    if key in _cancelled: raise JobCancelled()
+
+
+# The file an output writer of a job writes to in a worker. What is written
+# is sent to the service as output of the job.
+class OutputStream:
+    def __init__(self, key):
+        self._key = key
+
+    def write(self, text):
+        check_cancelled(self._key)
+        if text: _events.put((self._key, "output", text))
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+# Run the job with the given key in a worker and send its outcome back.
+def run_job(key, job):
+    try:
+        check_cancelled(key)
+        _events.put((key, "started", None))
+        result = simulate_job(key, job)
+    except JobCancelled:
+        _events.put((key, "cancelled", None))
+    except Exception as exc:
+        _events.put((key, "error", "%s: %s" % (type(exc).__name__, exc)))
+    else:
+        _events.put((key, "done", result))
+
+
+# Simulate a job, sending its output back as it is written. A trace given
+# as text is decoded lazily, once the machine is set up, for the latencies
+# of its instructions. Returns the final clock cycle, whether the simulation
+# completed and its aggregate statistics, if they were collected, or the
+# whole result (see tomasulo_sim.SimulationResult) if the job asked for it.
+def simulate_job(key, job):
+    config = mc.MachineConfig.from_dict(job["config"])
+    source = job["filename"]
+    if job["trace"] is not None:
+        source = ir.iter_text_instructions(job["trace"].splitlines())
+    writer = ow.WRITERS[job["format"]](OutputStream(key), job["per_cycle"],
+                                       DEFAULT_CHUNK_SIZE)
+    next_check = [CANCEL_CHECK_CYCLES]
+    def on_cycle(state):
+        if writer.per_cycle:
+            writer.write_cycle(state.clock_cycle, state.instr_table)
+        if state.clock_cycle >= next_check[0]:
+            check_cancelled(key)
+            next_check[0] = state.clock_cycle + CANCEL_CHECK_CYCLES
+
+    result = ts.simulate(source, config, event_driven=job["event_driven"],
+                         max_cycles=job["max_cycles"],
+                         collect_stats=job["stats"], on_cycle=on_cycle)
+    writer.write_final(result.clock_cycle, result.instr_table,
+                       result.reg_file)
+    writer.flush()
+    if job["result"]:
+        return result.to_dict()
+    return {"clock_cycle": result.clock_cycle,
+            "completed": result.completed,
+            "stats": result.stats}
+
+
+# Check a "run" request and return the job handed to a worker, with every
+# field filled in. Raises a ValueError if the request is invalid, or if it
+# names a file and allow_files is not set.
+def parse_job(request, allow_files=True):
+    job = {"trace":        request.get("trace"),
+           "filename":     request.get("filename"),
+           "config":       request.get("config") or {},
+           "format":       request.get("format", "text"),
+           "per_cycle":    bool(request.get("per_cycle", False)),
+           "event_driven": bool(request.get("event_driven", False)),
+           "max_cycles":   request.get("max_cycles"),
+           "stats":        bool(request.get("stats", False)),
+           "result":       bool(request.get("result", False))}
+    if (job["trace"] is None) == (job["filename"] is None):
+        raise ValueError("A job needs either a trace or a filename!")
+    if job["filename"] is not None and not allow_files:
+        raise ValueError("Jobs sent over TCP must give their trace as "
+                         "text!")
+    for field in ("trace", "filename"):
+        if job[field] is not None and not isinstance(job[field], str):
+            raise ValueError("The %s of a job must be a string!" % field)
+    if job["format"] not in ow.WRITERS:
+        raise ValueError("Unknown output format: %s" % job["format"])
+    if not isinstance(job["config"], dict):
+        raise ValueError("The config of a job must be an object!")
+    try:
+        mc.MachineConfig.from_dict(job["config"])
+    except TypeError as exc:
+        raise ValueError("Invalid machine configuration: %s" % exc)
+    max_cycles = job["max_cycles"]
+    if max_cycles is not None and (not isinstance(max_cycles, int) or
+                                   max_cycles < 0):
+        raise ValueError("max_cycles must be a non-negative integer!")
+    return job
+
+
+# A job of the service. The key is unique to the service, while the id is
+# the one given by the client, unique to its connection.
+class Job:
+    def __init__(self, key, job_id, connection):
+        self.key        = key
+        self.job_id     = job_id
+        self.connection = connection
+        self.future     = None
+        self.pool       = None
+        self.started    = False
+        self.cancelling = False
+
+
+# A client connected to the service. Messages are queued and written in
+# order by send_messages, so that a slow client does not hold up the
+# event loop. Only local clients, on the Unix socket, may name files.
+class Connection:
+    def __init__(self, writer, local=True):
+        self._writer   = writer
+        self._outgoing = asyncio.Queue()
+        self.local     = local
+        self.jobs      = {}
+
+    def send(self, message):
+        self._outgoing.put_nowait(message)
+
+    def close(self):
+        self._outgoing.put_nowait(None)
+
+    async def send_messages(self):
+        while True:
+            message = await self._outgoing.get()
+            if message is None: break
+            try:
+                self._writer.write((json.dumps(message) + "\n").encode())
+                await self._writer.drain()
+            except ConnectionError:
+                break
+        self._writer.close()
+
+
+# The service, running jobs in a pool of num_workers processes (one per core
+# unless given). At most max_queued jobs wait for a worker; further jobs
+# are rejected until some finish.
+class SimulationService:
+    def __init__(self, num_workers=None, max_queued=DEFAULT_MAX_QUEUED):
+        if num_workers is None: num_workers = os.cpu_count() or 1
+        self._num_workers = num_workers
+        self._max_queued  = max_queued
+        self._jobs        = {}
+        self._next_key    = 0
+        self._loop        = None
+        self._context     = None
+        self._manager     = None
+        self._events      = None
+        self._cancelled   = None
+        self._pool        = None
+        self._receiver    = None
+
+    @property
+    def num_workers(self):
+        return self._num_workers
+
+    @property
+    def max_queued(self):
+        return self._max_queued
+
+    @property
+    def num_running(self):
+        return sum(1 for job in self._jobs.values() if job.started)
+
+    @property
+    def num_queued(self):
+        return len(self._jobs) - self.num_running
+
+    # Start the workers, waiting until they are ready, and the thread that
+    # receives their messages. Workers are spawned rather than forked, since
+    # the service runs threads.
+    def start(self, loop):
+        self._context   = multiprocessing.get_context("spawn")
+        self._loop      = loop
+        self._manager   = SyncManager(ctx=self._context)
+        self._manager.start(ignore_interrupts)
+        self._events    = self._manager.Queue()
+        self._cancelled = self._manager.dict()
+        self._pool      = self.start_pool()
+        self._receiver = threading.Thread(target=self.receive_events,
+                                          daemon=True)
+        self._receiver.start()
+
+    # Start a pool of workers and wait until they are ready.
+    def start_pool(self):
+        pool  = ProcessPoolExecutor(self._num_workers, self._context,
+                                    init_worker,
+                                    (self._events, self._cancelled))
+        pings = [pool.submit(ping_worker) for _ in range(self._num_workers)]
+        for ping in pings: ping.result()
+        return pool
+
+    # Replace a pool that broke because one of its workers died. The jobs
+    # it held fail and are reported by job_ended.
+    def restart_pool(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        self._pool = self.start_pool()
+
+    def close(self):
+        if self._pool is None: return
+        self._events.put(None)
+        self._receiver.join()
+        self._pool.shutdown(cancel_futures=True)
+        self._manager.shutdown()
+        self._pool = None
+
+    # Run in a thread: hand every message of the workers to the event loop.
+    def receive_events(self):
+        while True:
+            event = self._events.get()
+            if event is None: break
+            self._loop.call_soon_threadsafe(self.handle_event, *event)
+
+    # A job that was dropped before it started may still reach a worker,
+    # which sees that it was cancelled; its flag is removed once it ends.
+    def handle_event(self, key, kind, data):
+        job = self._jobs.get(key)
+        if job is None:
+            if kind in FINAL_EVENTS: self._cancelled.pop(key, None)
+            return
+        if kind == "output":
+            job.connection.send({"id": job.job_id, "event": "output",
+                                 "data": data})
+        elif kind == "started":
+            job.started = True
+            job.connection.send({"id": job.job_id, "event": "started"})
+        else:
+            self.finish(job, kind, data)
+
+    # Called when the future of a job is done. A job that ran sends its
+    # outcome itself, so only jobs that were cancelled before they started
+    # or whose worker died are finished here. The pool is restarted when
+    # the first job of a broken pool ends.
+    def job_ended(self, key, future):
+        job = self._jobs.get(key)
+        if job is None: return
+        if future.cancelled():
+            self.finish(job, "cancelled")
+        elif future.exception() is not None:
+            exc = future.exception()
+            self.finish(job, "error", "%s: %s" % (type(exc).__name__, exc))
+            if isinstance(exc, BrokenProcessPool) and job.pool is self._pool:
+                self.restart_pool()
+
+    def finish(self, job, kind, data=None):
+        del self._jobs[job.key]
+        del job.connection.jobs[job.job_id]
+        if job.cancelling: self._cancelled.pop(job.key, None)
+        message = {"id": job.job_id, "event": kind}
+        if kind == "done":    message.update(data)
+        elif kind == "error": message["message"] = data
+        job.connection.send(message)
+
+    def status(self):
+        return {"event": "status", "workers": self._num_workers,
+                "running": self.num_running, "queued": self.num_queued,
+                "max_queued": self._max_queued}
+
+    def submit(self, connection, request):
+        job_id = request.get("id")
+        if job_id is None or job_id in connection.jobs:
+            connection.send({"id": job_id, "event": "error", "message":
+                             "A job needs an id not used by another job!"})
+            return
+        try:
+            job_args = parse_job(request, connection.local)
+        except ValueError as exc:
+            connection.send({"id": job_id, "event": "error",
+                             "message": str(exc)})
+            return
+        if len(self._jobs) >= self._num_workers + self._max_queued:
+            connection.send({"id": job_id, "event": "rejected"})
+            return
+
+        key = self._next_key
+        self._next_key += 1
+        job = Job(key, job_id, connection)
+        try:
+            job.future = self._pool.submit(run_job, key, job_args)
+        except BrokenProcessPool as exc:
+            connection.send({"id": job_id, "event": "error", "message":
+                             "%s: %s" % (type(exc).__name__, exc)})
+            self.restart_pool()
+            return
+        job.pool = self._pool
+        self._jobs[key] = connection.jobs[job_id] = job
+        connection.send({"id": job_id, "event": "accepted"})
+        job.future.add_done_callback(
+            lambda future: self._loop.call_soon_threadsafe(self.job_ended,
+                                                           key, future))
+
+    # Cancel a job: one still waiting for a worker is dropped, a running one
+    # is told to stop. The pool moves the next jobs to its call queue before
+    # a worker is free, after which their futures cannot be cancelled, so
+    # such a job is dropped and also told to stop, which its worker sees
+    # before running it.
+    def cancel(self, job):
+        if job.future.cancel():
+            self.finish(job, "cancelled")
+        elif not job.started:
+            self._cancelled[job.key] = True
+            self.finish(job, "cancelled")
+        elif not job.cancelling:
+            job.cancelling = True
+            self._cancelled[job.key] = True
+
+    def handle_request(self, connection, line):
+        try:
+            request = json.loads(line)
+        except ValueError:
+            request = None
+        if not isinstance(request, dict):
+            connection.send({"event": "error",
+                             "message": "Invalid JSON request!"})
+            return
+        op = request.get("op")
+        if op == "run":
+            self.submit(connection, request)
+        elif op == "cancel":
+            job = connection.jobs.get(request.get("id"))
+            if job is None:
+                connection.send({"id": request.get("id"), "event": "error",
+                                 "message": "No such job!"})
+            else:
+                self.cancel(job)
+        elif op == "status":
+            connection.send(self.status())
+        else:
+            connection.send({"event": "error",
+                             "message": "Unknown op: %s" % (op,)})
+
+    async def handle_client(self, reader, writer, local=True):
+        connection = Connection(writer, local)
+        sender = asyncio.ensure_future(connection.send_messages())
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    connection.send({"event": "error",
+                                     "message": "Request too long!"})
+                    break
+                except ConnectionError:
+                    break
+                if not line: break
+                self.handle_request(connection, line)
+        finally:
+            for job in list(connection.jobs.values()): self.cancel(job)
+            connection.close()
+            await sender
+
+    # Serve clients on the given Unix socket, or on the given TCP port of
+    # the given host if a port is given, until interrupted.
+    async def serve(self, path=DEFAULT_SOCKET, host=DEFAULT_HOST, port=None):
+        self.start(asyncio.get_running_loop())
+        try:
+            if port is not None:
+                async def handle_tcp_client(reader, writer):
+                    await self.handle_client(reader, writer, local=False)
+                server = await asyncio.start_server(handle_tcp_client, host,
+                                                    port,
+                                                    limit=MAX_REQUEST_SIZE)
+            else:
+                if os.path.exists(path): os.remove(path)
+                server = await asyncio.start_unix_server(
+                    self.handle_client, path, limit=MAX_REQUEST_SIZE)
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.close()
+            if port is None and os.path.exists(path): os.remove(path)
+
+
+# Connect to the service on the given Unix socket, or on the given TCP
+# port of the given host if a port is given.
+def connect(path=DEFAULT_SOCKET, host=DEFAULT_HOST, port=None):
+    if port is not None:
+        return socket.create_connection((host, port))
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(path)
+    return sock
+
+
+# Submit a "run" request to the service and yield the messages it sends
+# back about the job, up to the one telling how it ended. Closing the
+# generator early closes the connection, which cancels the job.
+def submit_job(request, path=DEFAULT_SOCKET, host=DEFAULT_HOST, port=None):
+    request = dict(request, op="run")
+    request.setdefault("id", 0)
+    with connect(path, host, port) as sock:
+        sock.sendall((json.dumps(request) + "\n").encode())
+        with sock.makefile("rb") as fp:
+            for line in fp:
+                message = json.loads(line)
+                yield message
+                if message.get("event") in FINAL_EVENTS: break
+
+
+# Main block: either run the service, e.g.
+#   python service.py serve --workers 8
+# or run a trace on it, writing its output to standard output as
+# tomasulo_sim.py would, e.g.
+#   python service.py run trace.txt --per-cycle --add-latency 4
+# The trace file is read by the service, which runs on the same machine,
+# or sent to it as text over a TCP port.
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Tomasulo simulation "
+                                     "service")
+    parser.add_argument("command", choices=("serve", "run"))
+    parser.add_argument("filename", nargs="?", default=None)
+    parser.add_argument("--socket", default=DEFAULT_SOCKET,
+                        help="Unix socket of the service")
+    parser.add_argument("--host", default=DEFAULT_HOST,
+                        help="host of the TCP port (default: %(default)s)")
+    parser.add_argument("--port", type=int, default=None,
+                        help="TCP port of the service (instead of a Unix "
+                        "socket)")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--max-queued", type=int,
+                        default=DEFAULT_MAX_QUEUED,
+                        help="jobs waiting for a worker before new ones "
+                        "are rejected")
+    parser.add_argument("--format", choices=sorted(ow.WRITERS),
+                        default="text", help="output format")
+    parser.add_argument("--per-cycle", action="store_true")
+    parser.add_argument("--event-driven", action="store_true")
+    parser.add_argument("--max-cycles", type=int, default=None)
+    parser.add_argument("--stats", action="store_true",
+                        help="report the aggregate statistics as JSON on "
+                        "standard error")
+    for name in mc.PARAMETERS:
+        parser.add_argument("--" + name.replace("_", "-"), type=int,
+                            dest=name)
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        service = SimulationService(args.workers, args.max_queued)
+        try:
+            asyncio.run(service.serve(args.socket, args.host, args.port))
+        except KeyboardInterrupt:
+            pass
+        sys.exit(0)
+
+    if args.filename is None: parser.error("run needs a trace file")
+    if args.port is None:
+        request = {"filename": os.path.abspath(args.filename)}
+    elif bt.is_binary_trace(args.filename):
+        parser.error("binary traces cannot be sent over TCP")
+    else:
+        with open(args.filename) as fp:
+            request = {"trace": fp.read()}
+    request.update({"config": {name: getattr(args, name)
+                               for name in mc.PARAMETERS
+                               if getattr(args, name) is not None},
+                    "format": args.format, "per_cycle": args.per_cycle,
+                    "event_driven": args.event_driven,
+                    "max_cycles": args.max_cycles, "stats": args.stats})
+    for message in submit_job(request, args.socket, args.host, args.port):
+        event = message["event"]
+        if event == "output":
+            sys.stdout.write(message["data"])
+        elif event == "done":
+            sys.stdout.flush()
+            if message["stats"] is not None:
+                json.dump(message["stats"], sys.stderr)
+                sys.stderr.write("\n")
+        elif event in FINAL_EVENTS:
+            sys.stderr.write("Job %s%s\n" % (event, ": " + message["message"]
+                                              if "message" in message
+                                              else ""))
+            sys.exit(1)
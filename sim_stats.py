@@ -0,0 +1,219 @@
+#!/usr/env/python
+# This module collects microarchitectural statistics during a simulation:
+# cycles an instruction could not issue because its reservation station
+# was full, cycles a busy station sat Not Ready waiting on a tag, cycles a
+# station that could go waited for a busy functional unit, cycles an
+# instruction that completed waited for the CDB, occupancy histograms of
+# the reservation stations and load/store buffers and the number of cycles
+# with more than one instruction contending for the CDB.
+# The blocks of tomasulo_sim.py report events to a SimulationStats object
+# kept in the SimulatorState. The events of the current cycle are kept so
+# that cycles skipped by the event-driven mode, which are identical to the
+# last simulated one, can be counted as well.
+
+
+import sys
+
+
+# Per-instruction counters, in the order they are kept for every
+# instruction.
+ISSUE_STALL = 0 # Cycles stalled at issue because the station was full
+NOT_READY   = 1 # Cycles in a station waiting on an operand/register tag
+FU_WAIT     = 2 # Cycles in a station waiting on a busy functional unit
+CDB_WAIT    = 3 # Cycles waiting for the CDB after completing execution
+COLUMNS     = ("issue_stall", "not_ready", "fu_wait", "cdb_wait")
+
+
+# The SimulationStats object holds the aggregate counters, keyed by
+# reservation station or functional unit type, the occupancy histograms
+# (number of busy stations/slots -> cycles) and a list of counters per
+# instruction index. Counters are bumped in place; a list entry is only
+# created for instructions that stalled or waited.
+class SimulationStats:
+    def __init__(self):
+        self._num_cycles     = 0
+        self._issue_stalls   = {}
+        self._width_limited  = {}
+        self._not_ready      = {}
+        self._fu_waits       = {}
+        self._cdb_waits      = {}
+        self._cdb_contention = {}
+        self._occupancy      = {}
+        self._occupancy_units = []
+        self._unit_pos       = {}
+        self._counts         = []
+        self._per_instr      = {}
+        self._cycle_events   = []
+
+    @property
+    def num_cycles(self):
+        return self._num_cycles
+
+    @property
+    def issue_stalls(self):
+        return self._issue_stalls
+
+    @property
+    def not_ready(self):
+        return self._not_ready
+
+    @property
+    def fu_waits(self):
+        return self._fu_waits
+
+    @property
+    def cdb_waits(self):
+        return self._cdb_waits
+
+    @property
+    def cdb_contention(self):
+        return self._cdb_contention
+
+    @property
+    def rs_occupancy(self):
+        return self._histograms("rs")
+
+    @property
+    def lsu_occupancy(self):
+        return self._histograms("lsu")
+
+    @property
+    def per_instr(self):
+        return self._per_instr
+
+    def _add(self, counter, key, instr_idx, column, times):
+        counter[key] = counter.get(key, 0) + times
+        if instr_idx is not None:
+            entry = self._per_instr.get(instr_idx)
+            if entry is None:
+                entry = self._per_instr[instr_idx] = [0]*len(COLUMNS)
+            entry[column] += times
+
+    def _record(self, counter, key, instr_idx=None, column=None):
+        self._add(counter, key, instr_idx, column, 1)
+        self._cycle_events.append((counter, key, instr_idx, column))
+
+    # Called at the start of every simulated cycle.
+    def begin_cycle(self):
+        self._num_cycles  += 1
+        self._cycle_events = []
+
+    # Count the last simulated cycle again for each of the given number of
+    # skipped cycles.
+    def repeat_cycle(self, times):
+        if times <= 0: return
+        self._num_cycles += times
+        for counter, key, instr_idx, column in self._cycle_events:
+            self._add(counter, key, instr_idx, column, times)
+
+    def issue_stall(self, rs_type, instr_idx):
+        self._record(self._issue_stalls, rs_type, instr_idx, ISSUE_STALL)
+
+    # Called when the issue width was used up while instructions were still
+    # waiting to issue.
+    def issue_width_limit(self):
+        self._record(self._width_limited, "cycles")
+
+    def station_not_ready(self, rs_type, instr_idx):
+        self._record(self._not_ready, rs_type, instr_idx, NOT_READY)
+
+    def fu_wait(self, fu_type, instr_idx):
+        self._record(self._fu_waits, fu_type, instr_idx, FU_WAIT)
+
+    # Called by the Write-Result block with the instructions that wait for
+    # the CDB while another one broadcasts.
+    def cdb_wait(self, instrs):
+        if not instrs: return
+        self._record(self._cdb_contention, "cycles")
+        for instr in instrs:
+            self._record(self._cdb_waits, "total", instr.instr_index,
+                         CDB_WAIT)
+
+    # The number of busy stations of each reservation station and occupied
+    # slots of each load/store buffer is kept up to date by the blocks that
+    # change them, which recount the unit they touched, and recorded once
+    # per cycle by sample_occupancy. The counts of a cycle are kept
+    # together as one key, which is split into one histogram per unit when
+    # the histograms are read.
+    def count_stations(self, res_stat):
+        self._set_count(("rs", res_stat.rs_type), res_stat.num_busy)
+
+    def count_slots(self, func_unit):
+        if func_unit.fu_type != "load" and func_unit.fu_type != "store":
+            return
+        self._set_count(("lsu", func_unit.fu_type), func_unit.num_occupied)
+
+    def _set_count(self, unit, count):
+        pos = self._unit_pos.get(unit)
+        if pos is None:
+            pos = self._unit_pos[unit] = len(self._occupancy_units)
+            self._occupancy_units.append(unit)
+            self._counts.append(0)
+        self._counts[pos] = count
+
+    def sample_occupancy(self):
+        self._record(self._occupancy, tuple(self._counts))
+
+    # Split the sampled occupancy into a histogram per unit of the given
+    # kind ("rs" or "lsu").
+    def _histograms(self, kind):
+        hists = {}
+        for pos, (unit_kind, unit) in enumerate(self._occupancy_units):
+            if unit_kind != kind: continue
+            hist = hists[unit] = {}
+            for counts, cycles in self._occupancy.items():
+                count = counts[pos] if pos < len(counts) else 0
+                hist[count] = hist.get(count, 0) + cycles
+        return {unit: dict(sorted(hist.items())) 
+                for unit, hist in hists.items()}
+
+    # The counters of the given instruction as a dictionary.
+    def instruction_stats(self, instr_idx):
+        entry = self._per_instr.get(instr_idx, [0]*len(COLUMNS))
+        return dict(zip(COLUMNS, entry))
+
+    # The aggregate counters as a dictionary, e.g. for a JSON report. The
+    # keys of the histograms are the number of busy stations/slots.
+    def aggregate(self):
+        return {"cycles":         self._num_cycles,
+                "issue_stalls":   dict(self._issue_stalls),
+                "issue_width_limited": self._width_limited.get("cycles", 0),
+                "not_ready":      dict(self._not_ready),
+                "fu_waits":       dict(self._fu_waits),
+                "cdb_waits":      self._cdb_waits.get("total", 0),
+                "cdb_contention": self._cdb_contention.get("cycles", 0),
+                "rs_occupancy":   self.rs_occupancy,
+                "lsu_occupancy":  self.lsu_occupancy}
+
+    # Average number of busy stations/slots per cycle from a histogram.
+    @staticmethod
+    def mean_occupancy(hist):
+        cycles = sum(hist.values())
+        if cycles == 0: return 0.0
+        return sum(num*count for num, count in hist.items())/float(cycles)
+
+    # Write the per-instruction counters of the given number of
+    # instructions followed by the aggregate counters.
+    def report(self, num_instrs, fp=None):
+        if fp is None: fp = sys.stdout
+        fp.write("Instruction Stats (cycles):\n")
+        fp.write("%6s %12s %12s %12s %12s\n" % (("Instr",) + COLUMNS))
+        for idx in range(num_instrs):
+            entry = self._per_instr.get(idx, [0]*len(COLUMNS))
+            fp.write("%6d %12d %12d %12d %12d\n" % ((idx,) + tuple(entry)))
+
+        stats = self.aggregate()
+        fp.write("Aggregate Stats over %d cycles:\n" % stats["cycles"])
+        for name in ("issue_stalls", "not_ready", "fu_waits"):
+            fp.write("  %-15s %s\n" % (name, ", ".join(
+                "%s %d" % item for item in sorted(stats[name].items()))))
+        fp.write("  %-15s %d\n" % ("width_limited",
+                                   stats["issue_width_limited"]))
+        fp.write("  %-15s %d\n" % ("cdb_waits", stats["cdb_waits"]))
+        fp.write("  %-15s %d\n" % ("cdb_contention", stats["cdb_contention"]))
+        for name in ("rs_occupancy", "lsu_occupancy"):
+            for unit, hist in sorted(stats[name].items()):
+                fp.write("  %-15s %-6s mean %.2f  %s\n" %
+                         (name, unit, self.mean_occupancy(hist),
+                          " ".join("%d:%d" % item for item in hist.items())))
+        fp.flush()
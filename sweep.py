@@ -0,0 +1,127 @@
+#!/usr/env/python
+# This module runs a sweep over machine configurations for one trace.
+# A grid gives a list of values for some of the parameters of a
+# MachineConfig (see machine_config.py); every combination of those values
+# is simulated in its own worker process, spread across all cores, and the
+# total cycles and per-instruction timings of every point are collected
+# into one report.
+
+
+import os
+import sys
+import json
+import argparse
+import itertools
+import instruction_table as it
+import machine_config as mc
+import tomasulo_sim as ts
+import result_cache as rc
+from concurrent.futures import ProcessPoolExecutor
+
+
+# Expand a grid, i.e. a dictionary from parameter name to a list of values,
+# into the list of MachineConfig objects for every combination of values.
+# Parameters missing from the grid keep their defaults.
+def expand_grid(grid):
+    for name in grid:
+        if name not in mc.PARAMETERS:
+            raise ValueError("Unknown machine parameter: %s" % name)
+    names = [name for name in mc.PARAMETERS if name in grid]
+    values = [list(grid[name]) for name in names]
+    return [mc.MachineConfig(**dict(zip(names, point))) 
+            for point in itertools.product(*values)]
+
+
+# Run one point of the sweep. This is executed inside a worker process, so
+# the machine is rebuilt from the configuration before each run. Returns a
+# dictionary with the configuration, the total number of clock cycles and 
+# the (Issue, Exec Start, Exec Complete, Write Result) timings of every 
+# instruction, along with the aggregate statistics of the run (see 
+# sim_stats.py) and a histogram of the number of instructions issued per
+# cycle. If the simulation did not finish (e.g. it hit max_cycles), 
+# "completed" is False. If a cache directory is given, the result is taken
+# from the result cache there (see result_cache.py) when it holds it.
+def run_sweep_point(args):
+    (filename, config_dict, max_cycles, cache_dir) = args
+    config = mc.MachineConfig.from_dict(config_dict)
+    if cache_dir is not None:
+        result = rc.ResultCache(cache_dir).run(filename, config, max_cycles,
+                                               collect_stats=True)
+    else:
+        result = ts.simulate(filename, config, event_driven=True,
+                             max_cycles=max_cycles, collect_stats=True)
+    table  = result.instr_table
+    return {"config": config_dict,
+            "completed": result.completed,
+            "total_cycles": result.clock_cycle,
+            "stats": result.stats,
+            "issue_counts": it.issue_count_histogram(table, 
+                                                     result.clock_cycle),
+            "timings": [[table.issue[idx], table.exec_start[idx],
+                         table.exec_complete[idx], table.write_result[idx]]
+                        for idx in range(len(table))]}
+
+
+# Simulate the trace in the given file on every configuration, using a pool
+# of worker processes (one per core unless num_workers is given). Results
+# are returned in the same order as the configurations. Points are handed
+# out to the workers in chunks to keep the overhead of large sweeps low.
+# Points already in the result cache of the given directory are not
+# simulated again.
+def run_sweep(filename, configs, num_workers=None, max_cycles=None,
+              cache_dir=None):
+    if num_workers is None: num_workers = os.cpu_count() or 1
+    tasks = [(filename, config.to_dict(), max_cycles, cache_dir)
+             for config in configs]
+    if num_workers == 1:
+        return [run_sweep_point(task) for task in tasks]
+
+    chunksize = max(1, len(tasks) // (4*num_workers))
+    with ProcessPoolExecutor(max_workers=num_workers) as pool:
+        return list(pool.map(run_sweep_point, tasks, chunksize=chunksize))
+
+
+# Write the report of a sweep as JSON. The timing columns are listed once
+# under "columns" rather than repeated for every instruction.
+def write_report(results, filename, fp):
+    report = {"trace": filename,
+              "columns": list(it.COLUMNS),
+              "points": results}
+    json.dump(report, fp)
+    fp.write("\n")
+
+
+# Main block: sweep the given trace over the grid built from a JSON grid
+# file and/or one option per machine parameter, e.g.
+#   python sweep.py trace.txt --num-addd-stations 1,2,4 --add-latency 2,4
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Sweep machine "
+                                     "configurations for one trace")
+    parser.add_argument("filename")
+    parser.add_argument("--grid", help="JSON file mapping parameter names "
+                        "to lists of values")
+    for name in mc.PARAMETERS:
+        parser.add_argument("--" + name.replace("_", "-"), type=mc.int_list,
+                            dest=name, help="comma-separated values")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--max-cycles", type=int, default=None)
+    parser.add_argument("--cache-dir", default=None,
+                        help="directory of the result cache to use")
+    parser.add_argument("--output", default=None, 
+                        help="report file (default: stdout)")
+    args = parser.parse_args()
+
+    grid = {}
+    if args.grid is not None:
+        with open(args.grid) as fp:
+            grid.update(json.load(fp))
+    for name in mc.PARAMETERS:
+        if getattr(args, name) is not None: grid[name] = getattr(args, name)
+
+    results = run_sweep(args.filename, expand_grid(grid), args.workers,
+                        args.max_cycles, args.cache_dir)
+    if args.output is None:
+        write_report(results, args.filename, sys.stdout)
+    else:
+        with open(args.output, "w") as fp:
+            write_report(results, args.filename, fp)
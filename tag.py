@@ -11,27 +11,14 @@ import time
 # This object is used to store the type of reservation station and 
 # the index of the specific station within the reseration station.
 # This tag object is used by the reservation_station.py and 
-# register_file.py modules.
+# register_file.py modules. Tags are created for every station and
+# register write, so their two fields are kept in slots.
 class Tag:
-    def __init__(self,rs_type,idx):
-        self._rs_type = rs_type
-        self._idx = idx
-    
-    @property
-    def rs_type(self):
-        return self._rs_type
-
-    @rs_type.setter
-    def rs_type(self,rs_type):
-        self._rs_type = rs_type
+    __slots__ = ("rs_type", "idx")
 
-    @property
-    def idx(self):
-        return self._idx
-
-    @idx.setter
-    def idx(self,idx):
-        self._idx = idx
+    def __init__(self,rs_type,idx):
+        self.rs_type = rs_type
+        self.idx = idx
 
     def clear_tag(self):
         self.rs_type = None
@@ -0,0 +1,39 @@
+#!/usr/env/python
+# These tests check that the instructions decoded from a binary trace (see
+# binary_trace.py) are the ones of the text trace it was converted from,
+# and that decoding them goes straight to register ids, leaving the
+# register names to be worked out only if they are asked for.
+# Run with
+#   python -m pytest -q
+
+
+import os
+import binary_trace as bt
+import instruction_reader as ir
+
+
+HERE  = os.path.dirname(os.path.abspath(__file__))
+TRACE = os.path.join(HERE, "instruction_input.txt")
+
+
+def fields(instr):
+    return (instr.instr_index, instr.operation, instr.dest_id,
+            instr.operand1_id, instr.operand2_id, instr.latency,
+            instr.dest, instr.operand1, instr.operand2)
+
+
+def test_binary_matches_text(tmp_path):
+    binary = str(tmp_path / "trace.trc")
+    bt.convert_text_trace(TRACE, binary)
+    assert ([fields(instr) for instr in bt.iter_binary_instructions(binary)]
+            == [fields(instr) for instr in ir.iter_instructions(TRACE)])
+
+
+def test_register_names_are_lazy():
+    instr = ir.Instruction.from_ids("LD", 13, None, 6, 0, operand1=34)
+    assert instr._dest is None and instr._operand2 is None
+    assert (instr.dest_id, instr.operand1_id, instr.operand2_id) == \
+           (13, None, 6)
+    assert (instr.dest, instr.operand1, instr.operand2) == ("F6", 34, "R3")
+    assert bt.encode_instruction(instr) == \
+           bt.encode_instruction(ir.Instruction("LD", "F6", "34+", "R3", 0))
@@ -0,0 +1,157 @@
+#!/usr/env/python
+# These tests check the data memory (see data_memory.py): store-to-load
+# forwarding and the wait of a load for every older store in the
+# load/store queue, the value of words that were never stored to, and the
+# values loaded and the timing of short traces run with a data memory,
+# stepped and event-driven, against the functional-only mode (see
+# functional.py).
+# Run with
+#   python -m pytest -q
+
+
+import os
+import struct
+import pytest
+import data_memory as dm
+import functional as fn
+import instruction_reader as ir
+import instruction_table as it
+import reservation_stations as rs
+import register_file as rf
+import tomasulo_sim as ts
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+HAZARD_TRACES = ("raw_hazard.txt", "war_hazard.txt", "waw_hazard.txt",
+                 "instruction_input.txt")
+
+# The load of F4 reads word 2 (0 + R3) once the store to it has started
+# and before it has written its result, so it is forwarded the stored F2.
+FORWARD_TRACE = ("ADDD F2 R0 R1", "SD F2 0+ R3", "LD F4 0+ R3")
+FORWARD_TABLE = ((1, 1, 2, 3), (2, 4, 6, 7), (3, 5, 7, 8))
+
+# The first load and the last read words that are never stored to; the
+# one in between reads word 7 after the store to it.
+MIXED_TRACE = ("LD F4 5+ R3", "ADDD F2 R0 R1", "SD F2 5+ R3", "LD F6 5+ R3",
+               "LD F8 6+ R3")
+MIXED_TABLE = ((1, 1, 3, 4), (2, 2, 3, 5), (3, 6, 8, 9), (4, 7, 9, 10),
+               (5, 7, 9, 11))
+MAX_CYCLES  = 10000
+
+
+def write_lines(filename, lines):
+    with open(filename, "w") as fp:
+        fp.write("\n".join(lines) + "\n")
+    return filename
+
+
+def instruction(line, idx):
+    tokens = line.split()
+    return ir.Instruction(tokens[0], tokens[1], tokens[2], tokens[3], idx)
+
+
+# A station holding the operands of the given load or store.
+def station(instr, vj, vk):
+    stat = rs.Station()
+    stat.operation = instr.operation
+    stat.dest      = instr.dest_id
+    stat.vj        = vj
+    stat.vk        = vk
+    return stat
+
+
+def table(state):
+    return tuple(tuple(state.instr_table.column(name)[idx]
+                       for name in it.COLUMNS)
+                 for idx in range(len(state.instr_table)))
+
+
+def test_store_forwards_to_load():
+    memory   = dm.DataMemory()
+    reg_file = rf.create_register_file()
+    store    = instruction("SD F2 0+ R3", 0)
+    load     = instruction("LD F4 0+ R3", 1)
+    rf.load_register_value(reg_file, "F2", 4.0)
+    memory.issue(store)
+    memory.issue(load)
+    memory.start(store, station(store, 0, 2.0), reg_file)
+    memory.start(load, station(load, 0, 2.0), reg_file)
+    assert memory.image.read(2) == dm.DEFAULT_MEMORY_VALUE
+    assert memory.write_result(load, None) == 4.0
+    assert memory.write_result(store, 4.0) == 4.0
+    assert memory.image.read(2) == 4.0
+    assert len(memory) == 0
+
+
+def test_load_waits_for_older_stores():
+    memory   = dm.DataMemory()
+    reg_file = rf.create_register_file()
+    older    = instruction("LD F4 0+ R3", 0)
+    store    = instruction("SD F2 0+ R3", 1)
+    other    = instruction("SD F3 1+ R3", 2)
+    load     = instruction("LD F5 1+ R3", 3)
+    for instr in (older, store, other, load):
+        memory.issue(instr)
+    assert memory.can_start(older)
+    assert not memory.can_start(load)
+    memory.start(store, station(store, 0, 2.0), reg_file)
+    assert not memory.can_start(load)
+    memory.start(other, station(other, 1, 2.0), reg_file)
+    assert memory.can_start(load)
+
+
+def test_unwritten_words_hold_default_value(tmp_path):
+    assert dm.DEFAULT_MEMORY_VALUE == rf.DEFAULT_REG_VALUE == 2.0
+    assert dm.open_image().read(12345) == 2.0
+    filename = str(tmp_path / "image.bin")
+    with open(filename, "wb") as fp:
+        fp.write(struct.pack("<3d", 5.0, 6.0, 7.0))
+    image = dm.open_image(filename)
+    assert [image.read(address) for address in range(4)] == \
+           [5.0, 6.0, 7.0, 2.0]
+
+
+@pytest.mark.parametrize("event_driven", (False, True))
+@pytest.mark.parametrize("trace, expected_table, loaded",
+                         ((FORWARD_TRACE, FORWARD_TABLE, {"F4": 4.0}),
+                          (MIXED_TRACE, MIXED_TABLE,
+                           {"F4": 2.0, "F6": 4.0, "F8": 2.0})))
+def test_trace_loads(tmp_path, event_driven, trace, expected_table, loaded):
+    filename = write_lines(str(tmp_path / "trace.txt"), trace)
+    memory   = dm.DataMemory()
+    state    = ts.run_simulation(filename, None, event_driven, MAX_CYCLES,
+                                 memory=memory)
+    assert state.is_finished()
+    assert table(state) == expected_table
+    values = dict(state.reg_file.items())
+    assert {name: values[name] for name in loaded} == loaded
+
+    expected_memory = dm.DataMemory()
+    expected = fn.run_instructions(ts.open_instruction_source(filename),
+                                   memory=expected_memory)
+    assert fn.compare_registers(state.reg_file, expected) == []
+    assert memory.image.stored == expected_memory.image.stored
+
+
+# Without a data memory the load of FORWARD_TRACE does not wait for the
+# store and starts at cycle 3.
+def test_load_starts_after_store_only_with_memory(tmp_path):
+    filename = write_lines(str(tmp_path / "trace.txt"), FORWARD_TRACE)
+    state    = ts.run_simulation(filename, max_cycles=MAX_CYCLES)
+    assert state.instr_table.column(it.EXEC_START)[2] == 3
+    assert state.clock_cycle == 7
+
+
+# The sample traces divide by loaded values, which used to be 0.0.
+@pytest.mark.parametrize("event_driven", (False, True))
+def test_hazard_traces_match_functional(event_driven):
+    for name in HAZARD_TRACES:
+        filename = os.path.join(HERE, name)
+        memory   = dm.DataMemory()
+        state    = ts.run_simulation(filename, None, event_driven,
+                                     MAX_CYCLES, memory=memory)
+        assert state.is_finished(), name
+        expected_memory = dm.DataMemory()
+        expected = ts.run_functional(filename, expected_memory)
+        assert fn.compare_registers(state.reg_file, expected) == [], name
+        assert memory.image.stored == expected_memory.image.stored, name
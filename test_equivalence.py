@@ -0,0 +1,175 @@
+#!/usr/env/python
+# These tests check that the ways of running a trace that claim to give
+# exactly the result of the cycle-stepped simulator do: event-driven runs,
+# batch simulation (see batch_sim.py), runs resumed from a checkpoint (see
+# checkpoint.py) and memoized timing (see timing_cache.py). Each compares
+# the final clock cycle, the instruction table and the register file on
+# the hazard traces of the repository, on synthetic traces (see
+# benchmark_suite.py), plain and mixed, on a looping synthetic trace whose
+# windows repeat, so that memoized timing replays them, and on a trace
+# that used to leak load buffer slots. They run on the default machine, on
+# a smaller one and on one issuing two instructions per cycle to pools of
+# pipelined units (see machine_config.py).
+# Run with
+#   python -m pytest -q
+
+
+import os
+import pytest
+import instruction_table as it
+import machine_config as mc
+import checkpoint as cp
+import profiling as prof
+import reservation_stations as rs
+import timing_cache as tc
+import tomasulo_sim as ts
+import benchmark_suite as bench
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+HAZARD_TRACES = ("raw_hazard.txt", "war_hazard.txt", "waw_hazard.txt",
+                 "instruction_input.txt")
+
+# The first load waits for R2 while the later ones start at once and take
+# the lowest free buffer slot. Writing their result used to free the slot
+# of station position - 1 instead of the one they used, so the buffer
+# leaked its slots and the run never finished.
+LEAK_TRACE = ("MULTD R2 R0 R4", "LD F1 0+ R2", "LD F2 0+ R3", "LD F3 0+ R3",
+              "LD F4 0+ R3", "LD F5 0+ R3")
+
+SYNTHETIC_SEEDS = (1, 2, 3)
+SYNTHETIC_SIZE  = 300
+LOOP_BODY_SIZE  = 24
+LOOP_COUNT      = 25
+MAX_CYCLES      = 100000
+
+CONFIGS = (mc.MachineConfig(),
+           mc.MachineConfig(num_ld_stations=2, num_load_slots=1,
+                            num_addd_stations=2),
+           mc.MachineConfig(num_ld_stations=2, num_load_slots=1,
+                            num_addd_stations=2, issue_width=2,
+                            num_add_units=2, add_initiation_interval=1,
+                            mult_initiation_interval=2))
+
+
+@pytest.fixture(scope="module")
+def traces(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("traces")
+    filenames = [os.path.join(HERE, name) for name in HAZARD_TRACES]
+    leak_filename = str(directory / "leak.txt")
+    with open(leak_filename, "w") as fp:
+        fp.write("\n".join(LEAK_TRACE) + "\n")
+    filenames.append(leak_filename)
+    for seed in SYNTHETIC_SEEDS:
+        filename = str(directory / ("synthetic_%d.txt" % seed))
+        bench.write_trace(filename, SYNTHETIC_SIZE, seed)
+        filenames.append(filename)
+        filename = str(directory / ("mixed_%d.txt" % seed))
+        bench.write_trace(filename, SYNTHETIC_SIZE, seed, mixed=True)
+        filenames.append(filename)
+    loop_filename = str(directory / "loop.txt")
+    with open(loop_filename, "w") as fp:
+        body = list(bench.generate_trace(LOOP_BODY_SIZE))
+        fp.write("\n".join(body*LOOP_COUNT) + "\n")
+    filenames.append(loop_filename)
+    return filenames
+
+
+def run(filename, config=None, event_driven=False):
+    return ts.run_simulation(filename, config, event_driven, MAX_CYCLES)
+
+
+# The outcome of a run as comparable values. Register values are compared
+# by their repr, so that NaN matches NaN.
+def outcome(clock_cycle, completed, instr_table, registers):
+    return (clock_cycle, completed,
+            [list(instr_table.column(name)) for name in it.COLUMNS],
+            [(name, repr(value)) for name, value in registers])
+
+
+def state_outcome(state):
+    return outcome(state.clock_cycle, state.is_finished(), state.instr_table,
+                   state.reg_file.items())
+
+
+def test_leak_trace_finishes(traces):
+    state = run(traces[len(HAZARD_TRACES)])
+    assert state.is_finished()
+    assert state.clock_cycle == 15
+
+
+@pytest.mark.parametrize("config", CONFIGS)
+def test_event_driven_matches_stepped(traces, config):
+    for filename in traces:
+        expected = state_outcome(run(filename, config))
+        result   = run(filename, config, event_driven=True)
+        assert state_outcome(result) == expected, filename
+
+
+@pytest.mark.parametrize("config", CONFIGS)
+def test_batch_matches_stepped(traces, config):
+    bs = pytest.importorskip("batch_sim")
+    try:
+        bs.check_config(config)
+    except ValueError as exc:
+        pytest.skip(str(exc))
+    results = bs.run_batch(traces, config, MAX_CYCLES)
+    for filename, result in zip(traces, results):
+        assert result.error is None, filename
+        assert not result.fallback, filename
+        expected = state_outcome(run(filename, config))
+        assert outcome(result.clock_cycle, result.completed,
+                       result.instr_table, result.registers) == expected, \
+               filename
+
+
+@pytest.mark.parametrize("config", CONFIGS)
+@pytest.mark.parametrize("event_driven", (False, True))
+def test_resumed_checkpoint_matches_uninterrupted(traces, tmp_path, config,
+                                                  event_driven):
+    checkpoint = str(tmp_path / "state.ckpt")
+    for filename in traces:
+        expected = state_outcome(run(filename, config, event_driven))
+        for stop in (1, expected[0] // 2):
+            state = ts.run_simulation(filename, config, event_driven, stop)
+            cp.save_checkpoint(state, checkpoint)
+            state = ts.advance_simulation(cp.load_checkpoint(checkpoint),
+                                          max_cycles=MAX_CYCLES)
+            assert state_outcome(state) == expected, (filename, stop)
+
+
+@pytest.mark.parametrize("config", CONFIGS)
+@pytest.mark.parametrize("window", (1, 3, 8))
+def test_memoized_matches_stepped(traces, config, window):
+    cache = tc.TimingCache()
+    for filename in traces:
+        expected = state_outcome(run(filename, config))
+        mc.apply_config(config)
+        state = tc.advance_memoized(ts.SimulatorState(filename), cache,
+                                    window, MAX_CYCLES, ts)
+        assert state_outcome(state) == expected, filename
+        assert tc.verify_memoized(filename, config, window, MAX_CYCLES,
+                                  event_driven=True, cache=cache) == [], \
+               filename
+    assert cache.hits > 0
+
+
+# Memoized timing records values through the state rather than by
+# replacing functions of reservation_stations.py, so it can run while the
+# profiler has them replaced, and leaves them alone.
+def test_memoized_under_profiler_matches_stepped(traces):
+    names     = ("read_operand", "execute_station_op", "update_rs_operands",
+                 "clear_station")
+    originals = [getattr(rs, name) for name in names]
+    filename  = traces[-1]
+    expected  = state_outcome(run(filename))
+    mc.apply_config()
+    profiler = prof.enable(ts)
+    try:
+        state = tc.advance_memoized(ts.SimulatorState(filename),
+                                    tc.TimingCache(), 8, MAX_CYCLES, ts)
+    finally:
+        prof.disable()
+    assert state_outcome(state) == expected
+    assert profiler.stats["update_rs_operands"][0] > 0
+    assert [getattr(rs, name) for name in names] == originals
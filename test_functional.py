@@ -0,0 +1,93 @@
+#!/usr/env/python
+# These tests check the functional-only mode (see functional.py) as an
+# oracle for the timing model: the register file left by a run, stepped or
+# event-driven, matches the one of the functional-only mode on the hazard
+# traces of the repository, on a synthetic trace (see benchmark_suite.py)
+# and on a trace whose registers end up NaN. They also pin the one known
+# difference between the two, a register read while more than one write to
+# it is in flight.
+# Run with
+#   python -m pytest -q
+
+
+import os
+import pytest
+import functional as fn
+import tomasulo_sim as ts
+import benchmark_suite as bench
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+HAZARD_TRACES = ("raw_hazard.txt", "war_hazard.txt", "waw_hazard.txt",
+                 "instruction_input.txt")
+
+# Squaring 2.0 ten times, each time into the next register, overflows to
+# inf in F10, and inf - inf is NaN.
+NAN_TRACE = (["MULTD F1 R0 R0"] +
+             ["MULTD F%d F%d F%d" % (num + 1, num, num)
+              for num in range(1, 10)] +
+             ["SUBD F11 F10 F10"])
+
+# F4 reads F2 while both writes to it are in flight, so the timing model
+# gives it the value of the DIVD (1.0) where the functional-only mode gives
+# it that of the ADDD (4.0).
+OLDEST_WRITER_TRACE = ("DIVD F2 R0 R1", "ADDD F2 R0 R1", "ADDD F4 F2 R1")
+
+SYNTHETIC_SEED = 1
+SYNTHETIC_SIZE = 700
+MAX_CYCLES     = 100000
+
+
+def write_lines(filename, lines):
+    with open(filename, "w") as fp:
+        fp.write("\n".join(lines) + "\n")
+    return filename
+
+
+@pytest.fixture(scope="module")
+def traces(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("traces")
+    filenames = [os.path.join(HERE, name) for name in HAZARD_TRACES]
+    filename  = str(directory / "synthetic.txt")
+    bench.write_trace(filename, SYNTHETIC_SIZE, SYNTHETIC_SEED)
+    filenames.append(filename)
+    filenames.append(write_lines(str(directory / "nan.txt"), NAN_TRACE))
+    return filenames
+
+
+@pytest.mark.parametrize("event_driven", (False, True))
+def test_timing_matches_functional(traces, event_driven):
+    for filename in traces:
+        state = ts.run_simulation(filename, None, event_driven, MAX_CYCLES)
+        assert state.is_finished(), filename
+        assert fn.compare_registers(state.reg_file,
+                                    ts.run_functional(filename)) == [], \
+               filename
+
+
+def test_nan_registers_match(traces):
+    reg_file = ts.run_functional(traces[-1])
+    values   = dict(reg_file.items())
+    assert values["F11"] != values["F11"]
+    assert fn.compare_registers(reg_file, ts.run_functional(traces[-1])) == []
+
+
+def test_oldest_writer_difference(tmp_path):
+    filename = write_lines(str(tmp_path / "oldest.txt"), OLDEST_WRITER_TRACE)
+    state    = ts.run_simulation(filename, max_cycles=MAX_CYCLES)
+    assert fn.compare_registers(state.reg_file,
+                                ts.run_functional(filename)) == \
+           [("F4", 3.0, 6.0)]
+
+
+# The same difference on the first 700 instructions of the default
+# synthetic trace. The simulator as first written (before the instruction
+# table, register file and stations were restructured) leaves R25 with the
+# same value.
+def test_oldest_writer_difference_on_synthetic_trace(tmp_path):
+    filename = str(tmp_path / "synthetic.txt")
+    bench.write_trace(filename, SYNTHETIC_SIZE)
+    state = ts.run_simulation(filename, max_cycles=MAX_CYCLES)
+    assert fn.compare_registers(state.reg_file,
+                                ts.run_functional(filename)) == \
+           [("R25", -924445.0, -28.0)]
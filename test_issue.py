@@ -0,0 +1,49 @@
+#!/usr/env/python
+# These tests check the Issue block (see issue_stage in tomasulo_sim.py) at
+# issue widths 1, 2 and 4 on instruction_input.txt: the number of
+# instructions issued in each cycle, and the issue stalls and width-limited
+# cycles counted by the statistics (see sim_stats.py), on the default
+# machine and on one with a single add station, where the ADDD waits for
+# the station of the SUBD. Stepped and event-driven runs are checked alike.
+# Run with
+#   python -m pytest -q
+
+
+import os
+import pytest
+import machine_config as mc
+import tomasulo_sim as ts
+
+
+HERE  = os.path.dirname(os.path.abspath(__file__))
+TRACE = os.path.join(HERE, "instruction_input.txt")
+
+# (issue width, stations of the add unit, issue counts by cycle, issue
+# stalls, width-limited cycles)
+EXPECTED = ((1, None, {1: 1, 2: 1, 3: 1, 4: 1, 5: 1, 6: 1}, {}, 5),
+            (2, None, {1: 2, 2: 2, 3: 2}, {}, 2),
+            (4, None, {1: 4, 2: 2}, {}, 1),
+            (1, 1, {1: 1, 2: 1, 3: 1, 4: 1, 5: 1, 8: 1}, {"add": 2}, 5),
+            (2, 1, {1: 2, 2: 2, 3: 1, 8: 1}, {"add": 5}, 2),
+            (4, 1, {1: 4, 2: 1, 8: 1}, {"add": 6}, 1))
+
+
+@pytest.mark.parametrize("event_driven", (False, True))
+@pytest.mark.parametrize("width, num_addd_stations, issue_counts, stalls, "
+                         "width_limited", EXPECTED)
+def test_issue_counts_and_stalls(event_driven, width, num_addd_stations,
+                                 issue_counts, stalls, width_limited):
+    params = {"issue_width": width}
+    if num_addd_stations is not None:
+        params["num_addd_stations"] = num_addd_stations
+    state = ts.run_simulation(TRACE, mc.MachineConfig(**params), event_driven,
+                              collect_stats=True)
+    assert state.is_finished()
+    assert state.clock_cycle == 57
+    assert state.instr_table.issue_counts == issue_counts
+    aggregate = state.stats.aggregate()
+    assert aggregate["issue_stalls"] == stalls
+    assert aggregate["issue_width_limited"] == width_limited
+    assert sum(state.stats.instruction_stats(idx)["issue_stall"]
+               for idx in range(len(state.instr_table))) == \
+           sum(stalls.values())
@@ -0,0 +1,99 @@
+#!/usr/env/python
+# These tests check the on-disk cache of results (see result_cache.py):
+# hits and misses, the key of an entry, the sharing of entries between the
+# text and binary forms of a trace, eviction, corrupt entries and verify
+# mode. Every test uses a cache directory of its own.
+# Run with
+#   python -m pytest -q
+
+
+import os
+import pytest
+import binary_trace as bt
+import machine_config as mc
+import result_cache as rc
+import tomasulo_sim as ts
+
+
+HERE  = os.path.dirname(os.path.abspath(__file__))
+TRACE = os.path.join(HERE, "instruction_input.txt")
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return rc.ResultCache(str(tmp_path / "cache"))
+
+
+def test_miss_then_hit(cache):
+    result = cache.run(TRACE)
+    assert not result.hit
+    assert (cache.hits, cache.misses) == (0, 1)
+    cached = cache.run(TRACE)
+    assert cached.hit
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert rc.compare_results(cached, result) is None
+    assert rc.compare_results(cached, ts.simulate(TRACE)) is None
+
+
+def test_key_covers_every_parameter(cache):
+    default = cache.key(TRACE)
+    assert cache.key(TRACE, mc.MachineConfig()) == default
+    keys = set([default])
+    for name, value in mc.DEFAULT_PARAMETERS:
+        key = cache.key(TRACE, mc.MachineConfig(**{name: value + 1}))
+        assert key not in keys, name
+        keys.add(key)
+
+
+def test_text_and_binary_trace_share_entry(cache, tmp_path):
+    binary = str(tmp_path / "instruction_input.bin")
+    bt.convert_text_trace(TRACE, binary)
+    assert cache.key(binary) == cache.key(TRACE)
+    cache.run(TRACE)
+    assert cache.run(binary).hit
+    assert len(cache.entries()) == 1
+
+
+def test_eviction_under_max_bytes(cache):
+    configs = [mc.MachineConfig(add_latency=latency)
+               for latency in (2, 3, 4)]
+    for time, config in enumerate(configs):
+        cache.run(TRACE, config)
+        path = cache.entry_path(cache.key(TRACE, config))
+        os.utime(path, ns=(time, time))
+    sizes = sorted(size for path, size, used in cache.entries())
+    small = rc.ResultCache(cache.directory, sizes[-1] + sizes[-2])
+    assert small.evict() == 1
+    assert not os.path.exists(small.entry_path(small.key(TRACE, configs[0])))
+    assert small.run(TRACE, configs[2]).hit
+    assert small.size() <= small.max_bytes
+
+
+def test_truncated_entry_is_dropped(cache):
+    cache.run(TRACE)
+    path = cache.entry_path(cache.key(TRACE))
+    with open(path, 'rb') as fp:
+        data = fp.read()
+    with open(path, 'wb') as fp:
+        fp.write(data[:len(data)//2])
+    assert cache.get(cache.key(TRACE)) is None
+    assert not os.path.exists(path)
+    assert not cache.run(TRACE).hit
+    assert cache.run(TRACE).hit
+
+
+def test_verify_replaces_mismatch(cache):
+    key    = cache.key(TRACE)
+    result = rc.CachedResult.from_result(ts.simulate(TRACE))
+    wrong  = rc.CachedResult.from_result(ts.simulate(TRACE))
+    wrong.reg_file.values[0] += 1
+    cache.put(key, wrong)
+
+    verify = rc.ResultCache(cache.directory, verify=True)
+    fresh  = verify.run(TRACE)
+    assert not fresh.hit
+    assert (verify.hits, verify.misses, verify.mismatches) == (1, 0, 1)
+    assert rc.compare_results(fresh, result) is None
+    assert rc.compare_results(cache.get(key), result) is None
+    assert verify.run(TRACE).hit
+    assert verify.mismatches == 1
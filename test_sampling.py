@@ -0,0 +1,75 @@
+#!/usr/env/python
+# These tests check the sampled simulation (see sampling.py) on a synthetic
+# trace (see benchmark_suite.py): the estimated number of cycles is within
+# the reported error of the exact one, the final register file is the one
+# of the functional-only mode, windows that do not finish are skipped and
+# bad window sizes are refused.
+# Run with
+#   python -m pytest -q
+
+
+import pytest
+import functional as fn
+import machine_config as mc
+import sampling as sm
+import tomasulo_sim as ts
+import benchmark_suite as bench
+
+
+SYNTHETIC_SEED = 1
+SYNTHETIC_SIZE = 6000
+PERIOD         = 500
+WINDOW         = 100
+WARMUP         = 50
+
+# Every DIVD takes longer than the window is given to finish, so the
+# window starting at the tenth instruction is skipped.
+SLOW_TRACE  = ["ADDD F%d R0 R1" % num for num in range(10)] + \
+              ["DIVD F%d R0 R1" % num for num in range(10, 20)]
+SLOW_CONFIG = mc.MachineConfig(div_latency=10*sm.MAX_CYCLES_PER_INSTRUCTION)
+
+
+@pytest.fixture(scope="module")
+def trace(tmp_path_factory):
+    filename = str(tmp_path_factory.mktemp("traces") / "synthetic.txt")
+    bench.write_trace(filename, SYNTHETIC_SIZE, SYNTHETIC_SEED)
+    return filename
+
+
+@pytest.mark.parametrize("period, window", ((PERIOD, WINDOW),
+                                            (2*PERIOD, 2*WINDOW)))
+def test_estimate_within_error(trace, period, window):
+    result = sm.run_sampled(trace, period=period, window=window,
+                            warmup=WARMUP)
+    exact  = ts.simulate(trace, event_driven=True)
+    assert result.num_instructions == SYNTHETIC_SIZE
+    assert len(result.windows) == SYNTHETIC_SIZE // period
+    assert result.skipped == []
+    assert result.error is not None
+    assert abs(result.estimated_cycles - exact.clock_cycle) <= result.error
+
+
+def test_registers_match_functional(trace):
+    result = sm.run_sampled(trace, period=PERIOD, window=WINDOW,
+                            warmup=WARMUP)
+    assert fn.compare_registers(result.reg_file,
+                                ts.run_functional(trace)) == []
+
+
+def test_unfinished_window_is_skipped(tmp_path):
+    filename = str(tmp_path / "slow.txt")
+    with open(filename, "w") as fp:
+        fp.write("\n".join(SLOW_TRACE) + "\n")
+    result = sm.run_sampled(filename, SLOW_CONFIG, window=5, warmup=0,
+                            starts=[0, 10])
+    assert result.skipped == [10]
+    assert [window["start"] for window in result.windows] == [0]
+    assert result.num_instructions == len(SLOW_TRACE)
+    assert fn.compare_registers(result.reg_file,
+                                ts.run_functional(filename)) == []
+
+
+@pytest.mark.parametrize("period, window", ((PERIOD, 0), (WINDOW - 1, WINDOW)))
+def test_bad_window_refused(trace, period, window):
+    with pytest.raises(ValueError):
+        sm.run_sampled(trace, period=period, window=window)
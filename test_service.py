@@ -0,0 +1,136 @@
+#!/usr/env/python
+# These tests run the simulation service (see service.py) in this process,
+# on a Unix socket in a temporary directory, with one worker that admits
+# one more job waiting for it. A client submits jobs, has a job run to the
+# end, cancels a job waiting for the worker and one running on it, has a
+# job rejected past the admission limit, and has the pool of workers
+# restarted after its worker is killed.
+# Run with
+#   python -m pytest -q
+
+
+import os
+import json
+import time
+import signal
+import asyncio
+import threading
+import pytest
+import service as sv
+import benchmark_suite as bench
+
+
+HERE        = os.path.dirname(os.path.abspath(__file__))
+TRACE       = os.path.join(HERE, "instruction_input.txt")
+LONG_TRACE  = "\n".join(bench.generate_trace(100000)) + "\n"
+START_LIMIT = 60 # Seconds to wait for the service to start
+
+
+@pytest.fixture
+def service(tmp_path):
+    path    = str(tmp_path / "service.sock")
+    service = sv.SimulationService(num_workers=1, max_queued=1)
+    loop    = asyncio.new_event_loop()
+    task    = loop.create_task(service.serve(path))
+    def run():
+        asyncio.set_event_loop(loop)
+        try:
+            loop.run_until_complete(task)
+        except asyncio.CancelledError:
+            pass
+        pending = asyncio.all_tasks(loop)
+        for other in pending: other.cancel()
+        loop.run_until_complete(asyncio.gather(*pending,
+                                               return_exceptions=True))
+    thread = threading.Thread(target=run)
+    thread.start()
+    deadline = time.time() + START_LIMIT
+    while not os.path.exists(path):
+        assert thread.is_alive() and time.time() < deadline
+        time.sleep(0.05)
+    yield service, path
+    loop.call_soon_threadsafe(task.cancel)
+    thread.join()
+    loop.close()
+
+
+# A connection to the service that sends requests and reads the messages
+# sent back, in order.
+class Client:
+    def __init__(self, path):
+        self._sock = sv.connect(path)
+        self._fp   = self._sock.makefile("rb")
+
+    def send(self, **request):
+        self._sock.sendall((json.dumps(request) + "\n").encode())
+
+    def receive(self):
+        return json.loads(self._fp.readline())
+
+    # Read messages up to the given event of the given job, returning the
+    # messages about that job, the last one included.
+    def wait_for(self, job_id, event):
+        messages = []
+        while True:
+            message = self.receive()
+            if message.get("id") != job_id: continue
+            messages.append(message)
+            if message["event"] == event: return messages
+            assert message["event"] not in sv.FINAL_EVENTS, message
+
+    def close(self):
+        self._fp.close()
+        self._sock.close()
+
+
+@pytest.fixture
+def client(service):
+    client = Client(service[1])
+    yield client
+    client.close()
+
+
+def test_job_runs(client):
+    client.send(op="run", id="j1", filename=TRACE, stats=True)
+    messages = client.wait_for("j1", "done")
+    events   = [message["event"] for message in messages]
+    assert events[:2] == ["accepted", "started"]
+    assert "output" in events
+    assert messages[-1]["clock_cycle"] == 57
+    assert messages[-1]["completed"]
+    assert messages[-1]["stats"]["cycles"] == 57
+
+
+def test_cancel_and_admission_limit(service, client):
+    client.send(op="run", id="long", trace=LONG_TRACE, format="none")
+    client.wait_for("long", "started")
+    client.send(op="run", id="queued", filename=TRACE)
+    client.wait_for("queued", "accepted")
+    client.send(op="run", id="over", filename=TRACE)
+    client.wait_for("over", "rejected")
+    client.send(op="status")
+    assert client.receive() == {"event": "status", "workers": 1,
+                                "running": 1, "queued": 1, "max_queued": 1}
+
+    client.send(op="cancel", id="queued")
+    client.wait_for("queued", "cancelled")
+    client.send(op="cancel", id="long")
+    client.wait_for("long", "cancelled")
+    client.send(op="status")
+    status = client.receive()
+    assert (status["running"], status["queued"]) == (0, 0)
+    client.send(op="run", id="after", filename=TRACE)
+    assert client.wait_for("after", "done")[-1]["clock_cycle"] == 57
+
+
+# Killing the worker breaks the pool: the job it was running fails and a
+# new pool runs the next job.
+def test_broken_pool_is_restarted(service, client):
+    client.send(op="run", id="long", trace=LONG_TRACE, format="none")
+    client.wait_for("long", "started")
+    for pid in list(service[0]._pool._processes):
+        os.kill(pid, signal.SIGKILL)
+    message = client.wait_for("long", "error")[-1]
+    assert message["message"].startswith("BrokenProcessPool")
+    client.send(op="run", id="after", filename=TRACE)
+    assert client.wait_for("after", "done")[-1]["clock_cycle"] == 57
@@ -0,0 +1,554 @@
+#!/usr/env/python
+# This module memoizes the timing of windows of instructions. Traces that
+# come from loops hand the simulator the same instructions over and over,
+# and once the loop has settled the machine reaches each window in the
+# same state. The simulation is split into windows of a fixed number of
+# issued instructions. At the start of a window the machine state is
+# encoded relative to the clock and to the index of the window's first
+# instruction: the busy stations and their tags, the functional units and
+# load/store buffers, the CDB queue, the tags of the registers, the
+# consumer index and the event queue. Together with the fields of the
+# window's instructions this encoding is the key into a TimingCache.
+# On a miss the window is simulated cycle by cycle, and the cache records
+# four things:
+#   - the number of cycles the window took;
+#   - the clock cycles it filled into the instruction table;
+#   - the machine state at the end of the window;
+#   - the value program, the order in which values moved between
+#     registers and stations.
+# On a hit those are replayed instead.
+# The value program is needed because the timing of the machine never
+# depends on the values computed, but the values depend on the timing.
+# Replaying a window gives exactly the same instruction table and register
+# file as simulating it.
+# The value program is recorded by a ValueRecorder, which the blocks of
+# the simulator report every value they move to while a window is
+# simulated.
+
+
+import instruction_reader as ir
+import instruction_table as it
+import register_file as rf
+import functional as fn
+import reservation_stations as rs
+import functional_units as fu
+import machine_config as mc
+from collections import OrderedDict
+
+
+DEFAULT_WINDOW      = 32   # Instructions issued per memoized window
+DEFAULT_MAX_ENTRIES = 4096 # Windows kept by a TimingCache
+
+# Operations of a value program, each a tuple starting with one of these.
+READ    = 0 # (READ, station, field, register): operand read at issue
+IMM     = 1 # (IMM, station, field, instruction): immediate operand
+WRITE   = 2 # (WRITE, station, operation, register): result written
+FORWARD = 3 # (FORWARD, register, ((station, field), ...)): broadcast
+CLEAR   = 4 # (CLEAR, station): station cleared after its write
+
+
+# A TimingCache maps the key of a window to its WindowTiming. At most
+# max_entries windows are kept; the least recently used one is dropped to
+# make room for a new one.
+class TimingCache:
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        if max_entries < 1:
+            raise ValueError("A timing cache needs room for at least 1 "
+                             "window!")
+        self._entries     = OrderedDict()
+        self._max_entries = max_entries
+        self._hits        = 0
+        self._misses      = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def max_entries(self):
+        return self._max_entries
+
+    @property
+    def hits(self):
+        return self._hits
+
+    @property
+    def misses(self):
+        return self._misses
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            self._misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self._hits += 1
+        return entry
+
+    def put(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+
+# The recorded timing of one window. Cycles are relative to the clock at
+# the start of the window and instructions to the index of its first
+# instruction. table_deltas holds (instruction, column, cycle) for every
+# field of the instruction table filled in during the window and
+# issue_counts holds (cycle, count) for every cycle that issued something.
+class WindowTiming:
+    __slots__ = ("num_cycles", "num_issued", "end_state", "table_deltas",
+                 "issue_counts", "value_program")
+
+    def __init__(self, num_cycles, num_issued, end_state, table_deltas,
+                 issue_counts, value_program):
+        self.num_cycles    = num_cycles
+        self.num_issued    = num_issued
+        self.end_state     = end_state
+        self.table_deltas  = table_deltas
+        self.issue_counts  = issue_counts
+        self.value_program = value_program
+
+
+# The parts of the machine that are not visible in its state: the issue
+# width and the shape of the functional units.
+def machine_signature(state):
+    units = []
+    for func_unit in state.fu_list:
+        if isinstance(func_unit, fu.FunctionalUnitPool):
+            units.append((func_unit.num_units, func_unit.initiation_interval))
+        elif isinstance(func_unit, fu.LoadStoreUnit):
+            units.append(func_unit.num_slots)
+        else:
+            units.append(None)
+    return (ir.issue_width, tuple(units))
+
+
+# The fields of an instruction the timing depends on.
+def instruction_fields(instr):
+    return (instr.operation, instr.dest_id, instr.operand1_id,
+            instr.operand2_id, instr.latency)
+
+
+# Encode the control state of the machine relative to the current clock
+# cycle and the given instruction index: everything but the values held by
+# the registers and stations, and of the instruction table only which
+# instructions have started executing. station_ids maps the id() of every
+# station to its index.
+def encode_state(state, base_idx, station_ids):
+    clock      = state.clock_cycle
+    exec_start = state.instr_table.exec_start
+    stations   = []
+    for res_stat in state.rs_list:
+        for station in res_stat.stations.values():
+            if not station.busy:
+                stations.append(None)
+                continue
+            instr = station.instr
+            stations.append((station.operation, station.qi_tag.rs_type,
+                             station.qi_tag.idx, station.dest,
+                             station.vj_tag.rs_type, station.vj_tag.idx,
+                             station.vk_tag.rs_type, station.vk_tag.idx,
+                             station.ready, instr.instr_index - base_idx))
+
+    units = []
+    for func_unit in state.fu_list:
+        if isinstance(func_unit, fu.FunctionalUnit):
+            instr = func_unit.current_instruction
+            if instr is None:
+                units.append(None)
+            else:
+                units.append((instr.instr_index - base_idx,
+                              func_unit.instr_start_time - clock))
+            continue
+        slots = []
+        for slot in func_unit.buffer_slots:
+            instr = slot["Instruction"]
+            if instr is None:
+                slots.append(None)
+            else:
+                slots.append((instr.instr_index - base_idx,
+                              slot["Start Time"] - clock,
+                              slot["Station Index"], slot.get("Unit")))
+        units.append(tuple(slots))
+
+    broadcast = tuple((state.fu_list.index(func_unit),
+                       instr.instr_index - base_idx)
+                      for (func_unit, instr) in state.broadcast_instr)
+
+    reg_file  = state.reg_file
+    more_tags = reg_file.more_tags
+    tags      = []
+    for reg_id, tag_id in enumerate(reg_file.tags):
+        if tag_id == 0: continue
+        tag_ids = [tag_id] + more_tags.get(reg_id, [])
+        tags.append((reg_id, tuple((reg_file.tag(tag_id).rs_type,
+                                    reg_file.tag(tag_id).idx)
+                                   for tag_id in tag_ids)))
+
+    consumers = tuple(sorted((key, tuple(station_ids[id(station)]
+                                         for station in waiting))
+                             for key, waiting in rs.tag_consumers.items()))
+
+    events = None
+    if state.event_queue is not None:
+        events = tuple(sorted(event - clock for event in state.event_queue
+                              if event > clock))
+
+    # The instructions still in the machine, which may have left their
+    # stations already, and whether they have started executing.
+    instrs = tuple(sorted((rel,) + instruction_fields(instr) + 
+                          (exec_start[instr.instr_index] != 0,) for rel, instr
+                          in in_flight_instructions(state, base_idx).items()))
+
+    return (tuple(stations), tuple(units), broadcast, tuple(tags), consumers,
+            events, instrs)
+
+
+# Put the machine in the control state given by encode_state, relative to
+# the given clock cycle and instruction index. instrs_by_rel maps relative
+# instruction indices to Instructions and stations maps station indices to
+# stations. The values held by busy stations are left alone. The ready
+# queues follow from the stations and which instructions have started.
+def restore_state(state, encoded, base_idx, clock, instrs_by_rel, stations):
+    (station_entries, units, broadcast, tags, consumers, events,
+     instrs) = encoded
+    started = set(entry[0] for entry in instrs if entry[-1])
+    entries = iter(station_entries)
+    for res_stat in state.rs_list:
+        res_stat.ready_queue.clear()
+        for stat_idx, station in res_stat.stations.items():
+            entry = next(entries)
+            if entry is None:
+                if station.busy: rs.clear_station(res_stat, stat_idx)
+                continue
+            station.busy           = True
+            res_stat.occupy_station(stat_idx)
+            station.operation      = entry[0]
+            station.qi_tag.rs_type = entry[1]
+            station.qi_tag.idx     = entry[2]
+            station.dest           = entry[3]
+            station.vj_tag.rs_type = entry[4]
+            station.vj_tag.idx     = entry[5]
+            station.vk_tag.rs_type = entry[6]
+            station.vk_tag.idx     = entry[7]
+            station.ready          = entry[8]
+            station.instr          = instrs_by_rel[entry[9]]
+            if (entry[9] not in started and
+                rs.operands_available(res_stat, stat_idx, station)):
+                res_stat.ready_queue.add(stat_idx)
+
+    for func_unit, entry in zip(state.fu_list, units):
+        if isinstance(func_unit, fu.FunctionalUnit):
+            if entry is None:
+                func_unit.empty_unit()
+            else:
+                func_unit.current_instruction = instrs_by_rel[entry[0]]
+                func_unit.instr_start_time    = clock + entry[1]
+        elif isinstance(func_unit, fu.LoadStoreUnit):
+            for slot_idx, slot_entry in enumerate(entry):
+                if slot_entry is None:
+                    func_unit.clear_slot(slot_idx)
+                else:
+                    func_unit.fill_slot(slot_idx,
+                                        instrs_by_rel[slot_entry[0]],
+                                        clock + slot_entry[1], slot_entry[2])
+        else:
+            func_unit.buffer_slots[:] = [
+                {"Instruction": instrs_by_rel[slot_entry[0]],
+                 "Start Time": clock + slot_entry[1],
+                 "Station Index": slot_entry[2],
+                 "Unit": slot_entry[3]} for slot_entry in entry]
+            func_unit.clock_cycle = clock
+
+    state.broadcast_instr[:] = [(state.fu_list[unit], instrs_by_rel[rel])
+                                for (unit, rel) in broadcast]
+
+    reg_file = state.reg_file
+    for reg_id in range(len(reg_file.tags)):
+        reg_file.tags[reg_id] = 0
+    reg_file.more_tags.clear()
+    for reg_id, tag_keys in tags:
+        tag_ids = [reg_file.tag_id(rs_type, idx) for rs_type, idx in tag_keys]
+        reg_file.tags[reg_id] = tag_ids[0]
+        if len(tag_ids) > 1: reg_file.more_tags[reg_id] = tag_ids[1:]
+
+    rs.reset_tag_consumers()
+    for key, waiting in consumers:
+        rs.tag_consumers[key] = [stations[stat_idx] for stat_idx in waiting]
+
+    if events is not None:
+        state.event_queue[:] = [clock + event for event in events]
+    state.clock_cycle = clock
+
+
+# Records the value program of a window. It is set as the recorder of the
+# state while the window is simulated, and the blocks of the simulator
+# report every value they move to it.
+class ValueRecorder:
+    def __init__(self, base_idx, station_ids):
+        self._base_idx    = base_idx
+        self._station_ids = station_ids
+        self._program     = []
+
+    @property
+    def program(self):
+        return self._program
+
+    # Called once the given station has been filled in at issue. An operand
+    # whose tag was cleared was read from its register, or is immediate.
+    def read_operands(self, stat_idx, station):
+        instr = station.instr
+        for field, operand_id, tag in (("vj", instr.operand1_id,
+                                        station.vj_tag),
+                                       ("vk", instr.operand2_id,
+                                        station.vk_tag)):
+            if operand_id is None:
+                self._program.append((IMM, stat_idx, field,
+                                      instr.instr_index - self._base_idx))
+            elif tag.rs_type is None:
+                self._program.append((READ, stat_idx, field, operand_id))
+
+    # Called before the result of the given station is computed.
+    def write_result(self, station):
+        self._program.append((WRITE, self._station_ids[id(station)],
+                              station.operation, station.dest))
+
+    # Called before the value of the given register is forwarded to the
+    # stations waiting on the given tag.
+    def forward(self, reg_file, dest_reg, tag):
+        station_ids = self._station_ids
+        targets     = []
+        for station in rs.tag_consumers.get((tag.rs_type, tag.idx), ()):
+            if (station.vj_tag.rs_type == tag.rs_type and
+                station.vj_tag.idx == tag.idx):
+                targets.append((station_ids[id(station)], "vj"))
+            if (station.vk_tag.rs_type == tag.rs_type and
+                station.vk_tag.idx == tag.idx):
+                targets.append((station_ids[id(station)], "vk"))
+        self._program.append((FORWARD, reg_file.reg_id(dest_reg),
+                              tuple(targets)))
+
+    # Called before the given station is cleared after its write.
+    def clear_station(self, stat_idx):
+        self._program.append((CLEAR, stat_idx))
+
+
+# Replay a value program on the register file and the stations.
+def run_value_program(program, reg_file, stations, instrs_by_rel):
+    values  = reg_file.values
+    scratch = rs.Station()
+    for op in program:
+        kind = op[0]
+        if kind == READ:
+            setattr(stations[op[1]], op[2], values[op[3]])
+        elif kind == IMM:
+            instr = instrs_by_rel[op[3]]
+            if op[2] == "vj": stations[op[1]].vj = instr.operand1
+            else:             stations[op[1]].vk = instr.operand2
+        elif kind == WRITE:
+            station = stations[op[1]]
+            scratch.operation = op[2]
+            scratch.vj        = station.vj
+            scratch.vk        = station.vk
+            scratch.dest      = op[3]
+            rf.load_register_value(reg_file, op[3],
+                                   rs.execute_station_op(scratch, reg_file))
+        elif kind == FORWARD:
+            value = values[op[1]]
+            for stat_idx, field in op[2]:
+                setattr(stations[stat_idx], field, value)
+        else:
+            station    = stations[op[1]]
+            station.vj = None
+            station.vk = None
+
+
+# The Instructions still in the machine (held by a busy station, a
+# functional unit or the CDB queue), by index relative to the given
+# instruction index.
+def in_flight_instructions(state, base_idx):
+    instrs = []
+    for res_stat in state.rs_list:
+        for station in res_stat.stations.values():
+            if station.busy: instrs.append(station.instr)
+    for func_unit in state.fu_list:
+        if isinstance(func_unit, fu.FunctionalUnit):
+            instrs.append(func_unit.current_instruction)
+        else:
+            instrs.extend(slot["Instruction"]
+                          for slot in func_unit.buffer_slots)
+    instrs.extend(instr for (func_unit, instr) in state.broadcast_instr)
+    return {instr.instr_index - base_idx: instr for instr in instrs
+            if instr is not None}
+
+
+# Simulate the window starting at the given instruction index until the
+# given number of instructions have issued, recording its WindowTiming.
+# Returns None if the simulation halted or reached max_cycles first.
+def record_window(state, sim, base_idx, window, max_cycles, station_ids):
+    instr_table = state.instr_table
+    start_clock = state.clock_cycle
+    low_idx     = min([base_idx] + [idx + base_idx for idx in
+                                    in_flight_instructions(state, base_idx)])
+    columns     = [instr_table.column(name) for name in it.COLUMNS]
+    before      = [[column[idx] for column in columns]
+                   for idx in range(low_idx, base_idx)]
+    issue_counts = []
+
+    recorder = ValueRecorder(base_idx, station_ids)
+    state.recorder = recorder
+    try:
+        while len(instr_table) < base_idx + window:
+            if max_cycles is not None and state.clock_cycle >= max_cycles:
+                return None
+            active = sim.simulate_cycle(state)
+            if state.halted:
+                return None
+            count = it.get_issue_count(instr_table, state.clock_cycle)
+            if count: issue_counts.append((state.clock_cycle - start_clock,
+                                           count))
+            if (state.event_queue is not None and not active and
+                not state.broadcast_instr):
+                sim.skip_idle_cycles(state)
+    finally:
+        state.recorder = None
+
+    table_deltas = []
+    for idx in range(low_idx, len(instr_table)):
+        for col, column in enumerate(columns):
+            old = before[idx - low_idx][col] if idx < base_idx else 0
+            if column[idx] != old:
+                table_deltas.append((idx - base_idx, col,
+                                     column[idx] - start_clock))
+    return WindowTiming(state.clock_cycle - start_clock,
+                        len(instr_table) - base_idx,
+                        encode_state(state, base_idx, station_ids),
+                        tuple(table_deltas), tuple(issue_counts),
+                        tuple(recorder.program))
+
+
+# Replay a WindowTiming on the state, whose next instructions are the
+# given ones.
+def replay_window(state, entry, base_idx, instrs, stations):
+    start_clock   = state.clock_cycle
+    instr_table   = state.instr_table
+    instrs_by_rel = in_flight_instructions(state, base_idx)
+    for rel in range(entry.num_issued):
+        instrs_by_rel[rel] = instrs[rel]
+
+    run_value_program(entry.value_program, state.reg_file, stations,
+                      instrs_by_rel)
+    for i in range(entry.num_issued):
+        it.add_entry(instr_table)
+        state.instr_source.advance()
+    write_col = it.COLUMNS.index(it.WRITE_RESULT)
+    for rel, col, cycle in entry.table_deltas:
+        if col == write_col:
+            it.write_result(instr_table, base_idx + rel, start_clock + cycle)
+        else:
+            instr_table.column(it.COLUMNS[col])[base_idx + rel] = \
+                start_clock + cycle
+    for cycle, count in entry.issue_counts:
+        it.record_issue_count(instr_table, start_clock + cycle, count)
+    restore_state(state, entry.end_state, base_idx,
+                  start_clock + entry.num_cycles, instrs_by_rel, stations)
+
+
+# Run the simulation held in the given state to the end, like
+# advance_simulation of the given simulator module (tomasulo_sim unless
+# given), taking the timing of every window of window instructions from
+# the cache when the machine has been in the same state before. The last
+# instructions of the trace, too few for a full window, are simulated
+# normally. Statistics and per-cycle callbacks are not supported, since the
+# cycles of a replayed window are never simulated.
+def advance_memoized(state, cache=None, window=DEFAULT_WINDOW,
+                     max_cycles=None, sim=None):
+    if sim is None:
+        import tomasulo_sim as sim
+    if state.stats is not None:
+        raise ValueError("Memoized timing cannot collect statistics!")
+    if window < 1:
+        raise ValueError("Windows need at least 1 instruction!")
+    if cache is None: cache = TimingCache()
+
+    # Every instruction that can issue in the last cycle of a window is part
+    # of the key.
+    num_lookahead = window + ir.issue_width - 1
+    instr_source  = state.instr_source
+    if instr_source.lookahead < num_lookahead:
+        instr_source.lookahead = num_lookahead
+    stations    = {}
+    station_ids = {}
+    for res_stat in state.rs_list:
+        for stat_idx, station in res_stat.stations.items():
+            stations[stat_idx]      = station
+            station_ids[id(station)] = stat_idx
+    signature = machine_signature(state)
+
+    while not state.halted:
+        if instr_source.peek(num_lookahead - 1) is None:
+            break
+        base_idx = len(state.instr_table)
+        instrs   = [instr_source.peek(k) for k in range(num_lookahead)]
+        key      = (signature, encode_state(state, base_idx, station_ids),
+                    tuple(instruction_fields(instr) for instr in instrs))
+        entry    = cache.get(key)
+        if entry is not None and (max_cycles is None or
+                                  state.clock_cycle + entry.num_cycles <=
+                                  max_cycles):
+            replay_window(state, entry, base_idx, instrs, stations)
+            continue
+        entry = record_window(state, sim, base_idx, window, max_cycles,
+                              station_ids)
+        if entry is None:
+            return state
+        cache.put(key, entry)
+
+    if not state.halted:
+        sim.advance_simulation(state, max_cycles=max_cycles)
+    return state
+
+
+# Compare the final state of a memoized run against that of a run of
+# advance_simulation. Returns a list of (what, value, expected value) for
+# the final clock cycle, every instruction table entry and every register
+# that differs. Registers that are NaN in both runs match.
+def compare_runs(state, expected):
+    mismatches = []
+    if state.clock_cycle != expected.clock_cycle:
+        mismatches.append(("clock cycle", state.clock_cycle,
+                           expected.clock_cycle))
+    if len(state.instr_table) != len(expected.instr_table):
+        mismatches.append(("instructions", len(state.instr_table),
+                           len(expected.instr_table)))
+    for name in it.COLUMNS:
+        column          = state.instr_table.column(name)
+        expected_column = expected.instr_table.column(name)
+        for idx, (value, exp) in enumerate(zip(column, expected_column)):
+            if value != exp:
+                mismatches.append(("%s of instruction %d" % (name, idx),
+                                   value, exp))
+    for reg, value, exp in fn.compare_registers(state.reg_file,
+                                                expected.reg_file):
+        mismatches.append(("register %s" % reg, value, exp))
+    return mismatches
+
+
+# Run the given trace on the given machine twice, once with memoized
+# timing and once with advance_simulation of the given simulator module
+# (tomasulo_sim unless given), and compare the results (see compare_runs).
+# Returns the list of mismatches, empty if the memoized run is exact.
+def verify_memoized(source=None, config=None, window=DEFAULT_WINDOW,
+                    max_cycles=None, event_driven=False, cache=None,
+                    sim=None):
+    if sim is None:
+        import tomasulo_sim as sim
+    mc.apply_config(config)
+    state = sim.SimulatorState(source, event_driven)
+    advance_memoized(state, cache, window, max_cycles, sim)
+    expected = sim.run_simulation(source, config, event_driven, max_cycles)
+    return compare_runs(state, expected)
@@ -6,12 +6,23 @@
 
 
 import sys
+import heapq
+import itertools
+import argparse
 import instruction_reader as ir
 import instruction_table as it
 import register_file as rf
 import reservation_stations as rs
 import functional_units as fu
-from collections import OrderedDict
+import binary_trace as bt
+import machine_config as mc
+import checkpoint as cp
+import functional as fn
+import data_memory as dm
+import timing_cache as tc
+import output_writers as ow
+import profiling
+import sim_stats as ss
 from operator import itemgetter
 from functional_units import FunctionalUnit
 from functional_units import LoadStoreUnit
@@ -31,19 +42,6 @@ def get_corresponding_rs_fu(rs_type, rs_list, fu_list):
     return switcher.get(rs_type,(None,None))
 
 
-# Print the results of the instruction (summary) table at 
-# the given clock cycle.
-def summarize_results(clock_cycle, instr_table):
-    print("\nClock Cycle: %s " % str(clock_cycle))
-    for idx,entry in enumerate(instr_table):
-        instr_out = ("Instr index: %s\t\t" % str(idx))
-        issue_out = ("Issue: %s\t\t" % str(entry["Issue"]))
-        start_out = ("Exec Strt: %s\t\t" % str(entry["Exec Start"]))
-        compl_out = ("Exec Comp: %s\t\t" % str(entry["Exec Complete"]))
-        write_out = ("Write Res: %s" % str(entry["Write Result"]))
-        print(instr_out + issue_out + start_out + compl_out + write_out)
-
-
 # Given that more than one instruction is ready to be 
 # broadcasted to the CDB, this function first gathers all
 # station indices using a list of tuples. Within each tuple
@@ -55,7 +53,7 @@ def summarize_results(clock_cycle, instr_table):
 # index is found. The instruction at that index (smallest_rs_idx)
 # is returned. 
 def resolve_contention(broadcast_instr, reg_file):
-    stat_indices = [(rf.get_reg_tag(reg_file, write_res[1].dest).idx,
+    stat_indices = [(rf.get_reg_tag(reg_file, write_res[1].dest_id).idx,
                      broadcast_instr.index(write_res)) for write_res in
                     broadcast_instr]
     sorted(stat_indices, key = itemgetter(0))
@@ -63,169 +61,742 @@ def resolve_contention(broadcast_instr, reg_file):
     return broadcast_instr[smallest_rs_idx]
 
 
-# This function runs the actual simulation. All necessary
-# implementations of hardware are kept as local variables. 
-# The current instruction is initialized to the first one in instruction
-# list so as to keep program order. The while loop starts and continues
-# while instructions exist in the instruction list or while the 
-# instruction summary table is still incomplete.
-# First any instructions that need to be written to the CDB (broadcasted)
+# Open a stream over the instructions of the given file, which can either
+# be a text trace or a binary trace written by binary_trace.py. A list (or
+# any other iterable) of already decoded Instructions is also accepted.
+# The stream starts after the first 'start' instructions of the source.
+def open_instruction_source(filename=None, start=0):
+    if filename is not None and not isinstance(filename, str):
+        return ir.InstructionStream(itertools.islice(filename, start, None),
+                                    num_taken=start)
+    if filename is not None and bt.is_binary_trace(filename):
+        return ir.InstructionStream(bt.iter_binary_instructions(filename, 
+                                                                start),
+                                    num_taken=start)
+    return ir.open_instruction_stream(filename, start=start)
+
+
+# The SimulatorState object gathers everything the simulation loop needs
+# from one clock cycle to the next: the reservation stations and functional
+# units, the register file, the stream of instructions still waiting to be
+# issued, the instruction (summary) table and the instructions waiting to
+# broadcast on the CDB. Instructions are decoded lazily from the stream and
+# get their entry in the instruction table when they are issued. When
+# event_driven is set, an event queue (heap) of the clock cycles at which
+# functional units will complete their instructions is kept so that idle
+# cycles can be skipped. When collect_stats is set, the blocks report stalls,
+# waits and occupancy to a SimulationStats object (see sim_stats.py).
+# The source the instructions are read from is kept so that a checkpoint
+# of the state (see checkpoint.py) can reopen it. If a DataMemory (see
+# data_memory.py) is given, loads and stores read and write it; otherwise
+# memory is not modelled. While a recorder is set (see timing_cache.py),
+# the blocks report every value they move between the registers and the
+# stations to it.
+class SimulatorState:
+    def __init__(self, filename=None, event_driven=False, 
+                 collect_stats=False, memory=None):
+        self.rs_list         = [rs.load_rs, rs.store_rs, rs.add_rs,
+                                rs.mult_rs]
+        self.fu_list         = [fu.load_fu, fu.store_fu, fu.add_fu,
+                                fu.mult_fu]
+        self.pipelined_units = [func_unit for func_unit in self.fu_list
+                                if isinstance(func_unit, 
+                                              fu.FunctionalUnitPool) and
+                                func_unit.pipelined]
+        self.reg_file        = rf.create_register_file()
+        self.source          = filename
+        self.instr_source    = open_instruction_source(filename)
+        self.instr_table     = it.InstructionTable()
+        self.clock_cycle     = 0
+        self.broadcast_instr = []
+        self.halted          = False
+        self.event_queue     = [] if event_driven else None
+        self.stats           = None
+        self.memory          = memory
+        self.recorder        = None
+        rs.reset_tag_consumers()
+        if collect_stats:
+            self.stats = ss.SimulationStats()
+            for res_stat in self.rs_list: self.stats.count_stations(res_stat)
+            for func_unit in self.fu_list: self.stats.count_slots(func_unit)
+
+    # True while there are instructions left to issue or issued
+    # instructions that have not written their results.
+    def is_incomplete(self):
+        return (not self.instr_source.is_empty() or
+                it.instruction_table_is_incomplete(self.instr_table))
+
+    def is_finished(self):
+        return not self.is_incomplete()
+
+
+# Write-Result/Broadcast Block
+# Any instructions that need to be written to the CDB (broadcasted)
 # are handled first. If more than one instruction needs to be broadcasted,
 # the highest-priority instruction is found. After the appropriate 
 # value is determined, that value is loaded to the destination register of the
 # instruction, and then all dependent tags in all reservation stations are
-# updated after broadcasting.
-# Any instructions that are ready to be issued are removed from the instruction
-# list and are correspondingly marked as issued in the summary table.
-# Next all 'busy' stations amongst the reservation stations are gathered and
-# determiend whether they can be executed. Lowest-index order is maintained
-# through the use of an OrderedDict. 
-# Then any functional unit that is occupied is checked to see if it can be
+# updated after broadcasting. Returns True if an instruction was broadcasted.
+def write_result_stage(state):
+    broadcast_instr = state.broadcast_instr
+    if not broadcast_instr:
+        return False
+
+    reg_file = state.reg_file
+    if len(broadcast_instr) > 1:
+        write_res = resolve_contention(broadcast_instr, reg_file)
+        if state.stats is not None:
+            state.stats.cdb_wait([instr for (func_unit, instr) in 
+                                  broadcast_instr[1:]])
+    else:
+        write_res = broadcast_instr[0]
+
+    write_res          = broadcast_instr[0]
+    entry_idx          = write_res[1].instr_index
+    dest_reg           = write_res[1].dest_id
+    try:
+        rs_type        = rf.get_reg_tag(reg_file, dest_reg).rs_type
+        stat_idx       = rf.get_reg_tag(reg_file, dest_reg).idx
+    except AttributeError:
+        print("Found a No Tag at Destination Register!")
+        state.halted = True
+        return False
+    (curr_rs, curr_fu) = get_corresponding_rs_fu(rs_type, state.rs_list,
+                                                 state.fu_list)
+    curr_fu.empty_station(stat_idx)
+
+    station  = curr_rs.stations[stat_idx]
+    recorder = state.recorder
+    it.write_result(state.instr_table, entry_idx, state.clock_cycle)
+    if recorder is not None:
+        recorder.write_result(station)
+    value = rs.execute_station_op(station, reg_file)
+    if state.memory is not None:
+        value = state.memory.write_result(write_res[1], value)
+    rf.load_register_value(reg_file, dest_reg, value)
+    if recorder is not None:
+        recorder.forward(reg_file, dest_reg, 
+                         rf.get_reg_tag(reg_file, dest_reg))
+    rs.update_rs_operands(state.rs_list, reg_file, dest_reg, 
+                          rf.get_reg_tag(reg_file, dest_reg))
+    rs.clear_rs_tags(state.rs_list, rf.get_reg_tag(reg_file, dest_reg))
+    rf.clear_register_tag(reg_file, dest_reg)
+    if recorder is not None:
+        recorder.clear_station(stat_idx)
+    rs.clear_station(curr_rs, stat_idx)
+    broadcast_instr.remove(write_res)
+    if state.stats is not None:
+        state.stats.count_stations(curr_rs)
+        state.stats.count_slots(curr_fu)
+    return True
+
+
+# Issue-Instruction Block
+# Instructions are taken from the instruction stream in program order and
+# marked as issued in the summary table for as long as a station of the 
+# matching reservation station is free, up to the issue width (one by 
+# default) per clock cycle. The number issued is recorded in the table.
+# Returns True if any instruction was issued.
+def issue_stage(state):
+    instr_source = state.instr_source
+    stats        = state.stats
+    num_issued   = 0
+    while num_issued < ir.issue_width:
+        curr_instr = instr_source.peek()
+        if curr_instr is None:
+            break
+
+        op = curr_instr.operation
+        if (op == "ADDD" or op == "SUBD"):    curr_rs = rs.add_rs
+        elif (op == "MULTD" or op == "DIVD"): curr_rs = rs.mult_rs
+        elif op == "LD":                      curr_rs = rs.load_rs
+        else:                                 curr_rs = rs.store_rs
+
+        rs_idx = curr_rs.find_nonoccupied_station_idx()
+        if rs_idx is None:
+            if stats is not None:
+                stats.issue_stall(curr_rs.rs_type, curr_instr.instr_index)
+            break
+
+        entry_idx = it.add_entry(state.instr_table)
+        it.issue_instruction(state.instr_table, entry_idx, state.clock_cycle)
+        rs.populate_rs(curr_rs, rs_idx, curr_instr, state.reg_file)
+        if state.recorder is not None:
+            state.recorder.read_operands(rs_idx, curr_rs.stations[rs_idx])
+        if state.memory is not None and (op == "LD" or op == "SD"):
+            state.memory.issue(curr_instr)
+        instr_source.advance()
+        num_issued += 1
+        if stats is not None:
+            stats.count_stations(curr_rs)
+    else:
+        if stats is not None and instr_source.peek() is not None:
+            stats.issue_width_limit()
+
+    if num_issued == 0:
+        return False
+    it.record_issue_count(state.instr_table, state.clock_cycle, num_issued)
+    return True
+
+
+# Start-Execution Block
+# Only the stations in the ready queue of each reservation station (see 
+# reservation_stations.py) are looked at: busy stations whose operands are 
+# available and whose instruction has not started. Each reservation station
+# feeds a single class of functional unit, so going through the queues in
+# the order of rs_list and each queue by station index visits the stations
+# in the same lowest-index order as going through every busy station.
+# A station that is not READY yet is checked for readiness and becomes
+# READY; one that is READY starts executing if its functional unit is
+# available, leaving the queue. With a data memory, a load also waits until
+# every older store has started (see data_memory.py), which is counted as
+# the station not being ready. When the event queue is kept, the clock
+# cycle at which a newly started instruction completes is pushed onto it, as
+# is the cycle at which a pipelined unit can take its next instruction.
+# When statistics are collected, the busy stations still waiting on an
+# operand are counted as not ready.
+# Returns True if any station became ready or started executing.
+def start_execution_stage(state):
+    instr_table = state.instr_table
+    clock_cycle = state.clock_cycle
+    stats       = state.stats
+    memory      = state.memory
+    active      = False
+
+    for res_stat in state.rs_list:
+        ready_queue = res_stat.ready_queue
+        stations    = res_stat.stations
+        if stats is not None:
+            for stat_idx in res_stat.find_occupied_station_idx():
+                instr_idx = stations[stat_idx].instr.instr_index
+                if (stat_idx not in ready_queue and
+                    not it.has_started_execution(instr_table, instr_idx)):
+                    stats.station_not_ready(res_stat.rs_type, instr_idx)
+        if not ready_queue:
+            continue
+
+        for stat_idx in sorted(ready_queue):
+            station = stations[stat_idx]
+
+            if station.ready == rs.READY:
+                exec_instr     = station.instr
+                exec_instr_idx = exec_instr.instr_index
+                func_unit      = rs.get_corresponding_fu(station)
+
+                if memory is not None and not memory.can_start(exec_instr):
+                    if stats is not None:
+                        stats.station_not_ready(res_stat.rs_type,
+                                                exec_instr_idx)
+                elif func_unit.is_available():
+                    it.start_execution(instr_table,exec_instr_idx, 
+                                       clock_cycle)
+                    func_unit.load_unit(exec_instr, clock_cycle, stat_idx)
+                    ready_queue.discard(stat_idx)
+                    if memory is not None:
+                        memory.start(exec_instr, station, state.reg_file)
+                    if stats is not None:
+                        stats.count_slots(func_unit)
+                    if state.event_queue is not None:
+                        heapq.heappush(state.event_queue,
+                                       clock_cycle + exec_instr.latency - 1)
+                        if func_unit in state.pipelined_units:
+                            heapq.heappush(state.event_queue, clock_cycle + 
+                                           func_unit.initiation_interval)
+                    active = True
+                elif stats is not None:
+                    stats.fu_wait(func_unit.fu_type, exec_instr_idx)
+            elif rs.is_station_ready(res_stat, stat_idx, state.reg_file):
+                station.ready = rs.READY
+                active = True
+            elif stats is not None:
+                if rs.is_waiting_on_tag(res_stat, stat_idx, state.reg_file):
+                    stats.station_not_ready(res_stat.rs_type, 
+                                            station.instr.instr_index)
+                else:
+                    stats.fu_wait(rs.get_corresponding_fu(station).fu_type,
+                                  station.instr.instr_index)
+
+    return active
+
+
+# Complete-Execution Block
+# Any functional unit that is occupied is checked to see if it can be
 # released of its instruction. If that instruction is done it is added 
 # to the running list of instructions that need to broadcast their results to
-# the CDB.
-def run_tomasulo_sim(filename=None):
-    load_rs         = rs.load_rs
-    store_rs        = rs.store_rs
-    add_rs          = rs.add_rs
-    mult_rs         = rs.mult_rs
-    load_fu         = fu.load_fu
-    store_fu        = fu.store_fu
-    add_fu          = fu.add_fu
-    mult_fu         = fu.mult_fu
-    rs_list         = [load_rs, store_rs, add_rs, mult_rs]
-    fu_list         = [load_fu, store_fu, add_fu, mult_fu]
-    reg_file        = rf.create_register_file()
-    instr_list      = ir.create_instruction_list(filename)
-    instr_table     = it.create_instruction_table(instr_list)
-    clock_cycle     = 0
-    instr_idx       = 0
-    curr_instr      = instr_list[instr_idx]
-    broadcast_instr = []
-
-    while (not(len(instr_list) == 0) or 
-           it.instruction_table_is_incomplete(instr_table)):
-        try:
-            clock_cycle += 1
-            # Write-Result/Broadcast-Block
-            if broadcast_instr:
-                if len(broadcast_instr) > 1:
-                    write_res = resolve_contention(broadcast_instr, reg_file)
-                else:
-                    write_res = broadcast_instr[0]
-
-                write_res          = broadcast_instr[0]
-                entry_idx          = write_res[1].instr_index
-                instr              = write_res[1]
-                dest_reg           = write_res[1].dest
-                try:
-                    rs_type        = rf.get_reg_tag(reg_file, dest_reg).rs_type
-                    stat_idx       = rf.get_reg_tag(reg_file, dest_reg).idx
-                except AttributeError:
-                    print("Found a No Tag at Destination Register!")
-                    break
-                (curr_rs, curr_fu) = get_corresponding_rs_fu(rs_type, rs_list,
-                                                             fu_list)
-                if (curr_fu.fu_type == "add" or curr_fu.fu_type == "mult"):
-                    curr_fu.empty_unit()
-                else:
-                    curr_fu.empty_unit(stat_idx)
-    
-                station = curr_rs.stations[stat_idx]
-                it.write_result(instr_table, entry_idx, clock_cycle)
-                value = rs.execute_station_op(station, reg_file)
-                rf.load_register_value(reg_file, dest_reg, value)
-                rs.update_rs_operands(rs_list, reg_file, dest_reg, 
-                                      rf.get_reg_tag(reg_file, dest_reg))
-                rs.clear_rs_tags(rs_list, rf.get_reg_tag(reg_file, dest_reg))
-                rf.clear_register_tag(reg_file, dest_reg)
-                rs.clear_station(curr_rs, stat_idx)
-                broadcast_instr.remove(write_res)
-    
-            # Issue-Instruction Block
-            if not(len(instr_list) == 0):
-                op = curr_instr.operation
-                if (op == "ADDD" or op == "SUBD"):    curr_rs = rs.add_rs
-                elif (op == "MULTD" or op == "DIVD"): curr_rs = rs.mult_rs
-                elif op == "LD":                      curr_rs = rs.load_rs
-                else:                                 curr_rs = rs.store_rs
-    
-                if not (curr_rs.find_nonoccupied_station_idx() is None):
-                    rs_idx = curr_rs.find_nonoccupied_station_idx()
-                    it.issue_instruction(instr_table, instr_idx, clock_cycle)
-                    rs.populate_rs(curr_rs, rs_idx, curr_instr, reg_file)
-                    instr_list.remove(curr_instr)
-                    instr_idx += 1
-                    if not(len(instr_list) == 0): curr_instr = instr_list[0]
-    
-            if it.instruction_table_is_incomplete(instr_table):
-                busy_stations = OrderedDict(())
-    
-                # Start-Execution Block
-                for res_stat in rs_list:
-                    if res_stat.is_occupied():
-                        occupied_stations = res_stat.find_occupied_station_idx()
-                        for idx in occupied_stations:
-                            busy_stations[idx] = res_stat
-    
-                for stat_idx,res_stat in busy_stations.items():
-                    func_unit = rs.get_corresponding_fu(res_stat.stations[stat_idx])
-    
-                    if res_stat.stations[stat_idx][8] == "Ready":
-                        exec_instr_idx = rs.get_station_instr_idx(res_stat.stations[stat_idx])
-    
-                        if (instr_table[exec_instr_idx]['Exec Start'] is None and func_unit.is_available()):
-                            exec_instr = instr_table[exec_instr_idx]['Instruction']
-                            it.start_execution(instr_table,exec_instr_idx, clock_cycle)
-                            func_unit.load_unit(instr_table[exec_instr_idx]['Instruction'],
-                                                clock_cycle, stat_idx)
-                    else:
-                        if (rs.is_station_ready(res_stat, stat_idx, reg_file)):
-                            res_stat.stations[stat_idx][8] = "Ready"
-                        else:
-                            res_stat.stations[stat_idx][8] = "Not Ready"
-    
-                # Complete-Execution Block
-                for func_unit in fu_list:
-                    if func_unit.is_occupied():
-                        if (func_unit.fu_type == "load" or func_unit.fu_type == "store"):
-                            occupied_slots = func_unit.find_occupied_slots()
-                            for slot_idx in occupied_slots:
-                                slot = func_unit.buffer_slots[slot_idx]
-                                instr = slot["Instruction"]
-                                if func_unit.is_instr_complete(slot, clock_cycle):
-                                    compl_instr_idx = instr.instr_index
-                                    it.complete_execution(instr_table, 
-                                                          compl_instr_idx, 
-                                                          clock_cycle)
-                                    broadcast_instr.append((func_unit, instr))
-                        else:
-                            instr = func_unit.current_instruction
-                            if func_unit.is_instr_complete(instr, clock_cycle):
-                                compl_instr_idx = instr.instr_index
-                                it.complete_execution(instr_table, 
-                                                      compl_instr_idx, 
-                                                      clock_cycle)
-                                broadcast_instr.append((func_unit, instr))
-
-            summarize_results(clock_cycle, instr_table)
-        except KeyboardInterrupt:
-            print("Simulator abruptly interrrupted. Exiting...")
+# the CDB. Load/store buffers and pools of add/mult units are checked slot
+# by slot. Returns True if any instruction completed.
+def complete_execution_stage(state):
+    instr_table = state.instr_table
+    clock_cycle = state.clock_cycle
+    active      = False
+
+    for func_unit in state.fu_list:
+        if func_unit.is_occupied():
+            if not isinstance(func_unit, FunctionalUnit):
+                occupied_slots = func_unit.find_occupied_slots()
+                for slot_idx in occupied_slots:
+                    slot = func_unit.buffer_slots[slot_idx]
+                    instr = slot["Instruction"]
+                    if func_unit.is_instr_complete(slot, clock_cycle):
+                        it.complete_execution(instr_table, 
+                                              instr.instr_index, 
+                                              clock_cycle)
+                        state.broadcast_instr.append((func_unit, instr))
+                        active = True
+            else:
+                instr = func_unit.current_instruction
+                if func_unit.is_instr_complete(instr, clock_cycle):
+                    it.complete_execution(instr_table, 
+                                          instr.instr_index, 
+                                          clock_cycle)
+                    state.broadcast_instr.append((func_unit, instr))
+                    active = True
+
+    return active
+
+
+# Advance the simulation by a single clock cycle by running the four blocks
+# in order. Returns True if anything in the machine changed during the cycle.
+def simulate_cycle(state):
+    state.clock_cycle += 1
+    for func_unit in state.pipelined_units:
+        func_unit.clock_cycle = state.clock_cycle
+    if state.stats is not None:
+        state.stats.begin_cycle()
+    active = write_result_stage(state)
+    if state.halted:
+        return active
+    active = issue_stage(state) or active
+
+    if state.is_incomplete():
+        active = start_execution_stage(state) or active
+        active = complete_execution_stage(state) or active
+
+    if state.stats is not None:
+        state.stats.sample_occupancy()
+    return active
+
+
+# After a cycle in which nothing changed and nothing is waiting on the CDB,
+# every following cycle is identical until the next functional unit
+# completes, since issue, readiness and dispatch only depend on the machine
+# state and not on the clock. The clock is therefore moved to the cycle
+# just before the earliest scheduled completion. If no completion is
+# scheduled the clock is left alone and the simulation steps one cycle
+# at a time.
+def skip_idle_cycles(state):
+    event_queue = state.event_queue
+    while event_queue and event_queue[0] <= state.clock_cycle:
+        heapq.heappop(event_queue)
+    if event_queue:
+        if state.stats is not None:
+            state.stats.repeat_cycle(event_queue[0] - 1 - state.clock_cycle)
+        state.clock_cycle = event_queue[0] - 1
+
+
+# Run the simulation held in the given state until every instruction has
+# written its result. The loop continues while instructions remain in the 
+# instruction stream or while the instruction summary table is still 
+# incomplete, running the Write-Result, Issue, Start-Execution and 
+# Complete-Execution blocks each clock cycle. on_cycle, if given, is called
+# with the state after every simulated cycle. 
+# If the state keeps an event queue, cycles in which nothing can happen are
+# skipped by jumping straight to the next scheduled completion; the
+# resulting instruction table is the same as when stepping one cycle at a
+# time, only on_cycle is not called for the idle cycles.
+# If max_cycles is given, the simulation stops once the clock reaches it,
+# which guards against machine configurations that never finish. The state
+# is left as it was, so it can be advanced further later.
+def advance_simulation(state, on_cycle=None, max_cycles=None):
+    while not state.is_finished():
+        if max_cycles is not None and state.clock_cycle >= max_cycles:
+            break
+        active = simulate_cycle(state)
+        if state.halted:
             break
+        if on_cycle is not None:
+            on_cycle(state)
+        if (state.event_queue is not None and not active and 
+            not state.broadcast_instr):
+            skip_idle_cycles(state)
+
+    return state
+
+
+# Set up the machine according to the given MachineConfig (the default 
+# machine if none is given), run the instructions of the given file through
+# it without printing anything and return the final SimulatorState. If
+# collect_stats is set, the state's stats hold the run's statistics. If a
+# DataMemory is given, loads and stores use it.
+def run_simulation(filename=None, config=None, event_driven=False,
+                   max_cycles=None, collect_stats=False, memory=None):
+    mc.apply_config(config)
+    state = SimulatorState(filename, event_driven, collect_stats, memory)
+    return advance_simulation(state, max_cycles=max_cycles)
+
+
+# The SimulationResult holds the outcome of a simulation: its last clock
+# cycle, the instruction (summary) table, whose columns are integer arrays
+# (see instruction_table.py), the register file and whether every
+# instruction wrote its result. If statistics were collected, stats holds
+# their aggregate as a dictionary and sim_stats the SimulationStats of the
+# run (see sim_stats.py), when it ran in this process. The trace it ran and
+# its data memory, if any, are kept as well.
+class SimulationResult:
+    def __init__(self, clock_cycle, instr_table, reg_file, completed,
+                 stats=None, sim_stats=None, source=None, memory=None):
+        self._clock_cycle = clock_cycle
+        self._instr_table = instr_table
+        self._reg_file    = reg_file
+        self._completed   = completed
+        self._stats       = stats
+        self._sim_stats   = sim_stats
+        self._source      = source
+        self._memory      = memory
+
+    @classmethod
+    def from_state(cls, state):
+        stats = None
+        if state.stats is not None: stats = state.stats.aggregate()
+        return cls(state.clock_cycle, state.instr_table, state.reg_file,
+                   state.is_finished(), stats, state.stats, state.source,
+                   state.memory)
+
+    @property
+    def clock_cycle(self):
+        return self._clock_cycle
+
+    @property
+    def instr_table(self):
+        return self._instr_table
+
+    @property
+    def reg_file(self):
+        return self._reg_file
+
+    @property
+    def completed(self):
+        return self._completed
+
+    @property
+    def stats(self):
+        return self._stats
+
+    @property
+    def sim_stats(self):
+        return self._sim_stats
+
+    @property
+    def source(self):
+        return self._source
+
+    @property
+    def memory(self):
+        return self._memory
+
+    @property
+    def num_instructions(self):
+        return len(self._instr_table)
+
+    # The columns of the instruction table, one entry per issued
+    # instruction, 0 where the instruction has not got that far.
+    @property
+    def issue(self):
+        return self._instr_table.issue
+
+    @property
+    def exec_start(self):
+        return self._instr_table.exec_start
+
+    @property
+    def exec_complete(self):
+        return self._instr_table.exec_complete
 
-    print("\nFinished at Clock Cycle: %s" % str((clock_cycle)))
-    summarize_results(clock_cycle, instr_table)
-    for reg,value in reg_file.items():
-        print("Register %s: %d" % (reg, value[1]))
+    @property
+    def write_result(self):
+        return self._instr_table.write_result
+
+    # The register values by name.
+    @property
+    def registers(self):
+        return dict(rf.register_values(self._reg_file))
+
+    def is_finished(self):
+        return self._completed
+
+    # The result as a dictionary, e.g. for a JSON report. The table is a
+    # list of [Issue, Exec Start, Exec Complete, Write Result] entries.
+    def to_dict(self):
+        columns = [self._instr_table.column(name) for name in it.COLUMNS]
+        return {"clock_cycle": self._clock_cycle,
+                "completed":   self._completed,
+                "columns":     list(it.COLUMNS),
+                "table":       [[column[idx] for column in columns]
+                                for idx in range(len(self._instr_table))],
+                "registers":   self.registers,
+                "stats":       self._stats}
+
+
+# Simulate the instructions of the given source (a text or binary trace
+# file, or a list of Instructions) on the machine described by config (the
+# default machine if none is given) and return a SimulationResult. Nothing
+# is printed; on_cycle, if given, is called with the SimulatorState after
+# every simulated cycle, e.g. to trace it.
+# If event_driven is set, idle cycles are skipped (and on_cycle is not
+# called for them). If collect_stats is set, statistics are collected.
+# If max_cycles is given, the simulation stops once the clock reaches it.
+# If a checkpoint file is given, the state is saved to it (see 
+# checkpoint.py) every checkpoint_every clock cycles, if given, and when the
+# simulation stops. If resume is given, the simulation carries on from the
+# state saved in that checkpoint file instead of starting from source;
+# the machine, event_driven and collect_stats are then the checkpoint's.
+# If memo_window is given, the timing of windows of that many instructions
+# is memoized in memo_cache (see timing_cache.py), which cannot be combined
+# with on_cycle, periodic checkpoints or statistics.
+# If a DataMemory is given, loads and stores read and write it (see
+# data_memory.py), which cannot be combined with memoized timing either.
+def simulate(source=None, config=None, event_driven=False, max_cycles=None,
+             collect_stats=False, on_cycle=None, memory=None,
+             checkpoint=None, checkpoint_every=None, resume=None,
+             memo_window=None, memo_cache=None):
+    state = create_state(source, config, event_driven, collect_stats, memory,
+                         resume)
+    run_state(state, on_cycle, max_cycles, checkpoint, checkpoint_every,
+              memo_window, memo_cache)
+    return SimulationResult.from_state(state)
+
+
+# Create the state of a simulation for simulate, or load it from the
+# checkpoint file given as resume.
+def create_state(source=None, config=None, event_driven=False,
+                 collect_stats=False, memory=None, resume=None):
+    if resume is not None:
+        return cp.load_checkpoint(resume)
+    mc.apply_config(config)
+    return SimulatorState(source, event_driven, collect_stats, memory)
+
+
+# Run the state of a simulation for simulate.
+def run_state(state, on_cycle=None, max_cycles=None, checkpoint=None,
+              checkpoint_every=None, memo_window=None, memo_cache=None):
+    if memo_window is not None:
+        if (on_cycle is not None or checkpoint_every or
+            state.stats is not None):
+            raise ValueError("Memoized timing cannot be combined with "
+                             "per-cycle output, periodic checkpoints or "
+                             "statistics!")
+        if state.memory is not None:
+            raise ValueError("Memoized timing cannot be combined with a "
+                             "data memory!")
+        if memo_cache is None: memo_cache = tc.TimingCache()
+
+    if checkpoint is not None and checkpoint_every is not None:
+        callbacks = [periodic_checkpoint(checkpoint, checkpoint_every,
+                                         state.clock_cycle)]
+        if on_cycle is not None: callbacks.insert(0, on_cycle)
+        if len(callbacks) == 1:
+            on_cycle = callbacks[0]
+        else:
+            def on_cycle(state):
+                for callback in callbacks: callback(state)
+
+    if memo_window is not None:
+        tc.advance_memoized(state, memo_cache, memo_window, max_cycles,
+                            sys.modules[__name__])
+    else:
+        advance_simulation(state, on_cycle=on_cycle, max_cycles=max_cycles)
+    if checkpoint is not None:
+        cp.save_checkpoint(state, checkpoint)
+    return state
+
+
+# Run a simulation as simulate does and hand its results to the given
+# output writer (see output_writers.py), by default printing the final
+# instruction (summary) table and register file as text. The table is only
+# passed to the writer after every simulated cycle if the writer was
+# created with per_cycle set, so runs that do not trace every cycle do not
+# pay for it. Only instructions that have been issued are shown in the
+# per-cycle tables, and idle cycles skipped when event_driven is set are
+# not written. If the simulation is interrupted (Ctrl-C), the results so
+# far are written. Returns the SimulationResult.
+def run_tomasulo_sim(filename=None, event_driven=False, config=None,
+                     writer=None, collect_stats=False, max_cycles=None,
+                     checkpoint=None, checkpoint_every=None, resume=None,
+                     memo_window=None, memo_cache=None, memory=None):
+    if writer is None: writer = ow.TextWriter(sys.stdout)
+    on_cycle = None
+    if writer.per_cycle:
+        on_cycle = lambda state: writer.write_cycle(state.clock_cycle,
+                                                    state.instr_table)
+    state = create_state(filename, config, event_driven, collect_stats,
+                         memory, resume)
+    try:
+        run_state(state, on_cycle, max_cycles, checkpoint, checkpoint_every,
+                  memo_window, memo_cache)
+    except KeyboardInterrupt:
+        writer.flush()
+        print("Simulator abruptly interrrupted. Exiting...")
+
+    result = SimulationResult.from_state(state)
+    writer.write_final(result.clock_cycle, result.instr_table,
+                       result.reg_file)
+    writer.close()
+    return result
+
+
+# Return an on_cycle callback that saves the state to the given checkpoint
+# file whenever the clock has passed another multiple of every cycles since
+# the given starting clock cycle. Skipped idle cycles are caught up with at
+# the next simulated cycle.
+def periodic_checkpoint(filename, every, start_cycle=0):
+    if every < 1: raise ValueError("Checkpoints must be at least 1 cycle "
+                                   "apart!")
+    next_cycle = [start_cycle + every]
+    def save(state):
+        if state.clock_cycle >= next_cycle[0]:
+            cp.save_checkpoint(state, filename)
+            next_cycle[0] = state.clock_cycle + every
+    return save
+
+
+# Run the instructions of the given file in functional-only mode (see 
+# functional.py): every instruction is applied to the register file, and to
+# the data memory if one is given, in program order, with no timing.
+# Returns the final register file, which can be compared with the one left
+# by run_simulation.
+def run_functional(filename=None, memory=None):
+    return fn.run_instructions(open_instruction_source(filename),
+                               memory=memory)
 
 
 # Main block: If an input file is specified, then generate the 
 # list that input file. Otherwise do not pass in the name 
 # of the file to the simulator function and use the default
-# file.
+# file. The input file can be a text trace or a binary trace.
+# Passing --event-driven skips idle clock cycles. --format selects the
+# output writer, --per-cycle also writes the table after every cycle and
+# --output writes to a file instead of standard output. --issue-width sets
+# the number of instructions issued per cycle. --profile and
+# --stats report timings and statistics of the run on standard error.
+# --checkpoint saves the state of the simulation to a file when it stops
+# (at --max-cycles or at the end) and every --checkpoint-every cycles, and
+# --resume carries on from such a file instead of an input file.
+# --functional only computes and writes the final register values, and
+# --check-registers compares the registers left by the simulation with
+# them, listing any that differ on standard error. --memo-window memoizes
+# the timing of windows of that many instructions, keeping at most
+# --memo-entries of them, and --memo-verify runs the trace again with and
+# without memoized timing, listing any difference on standard error.
+# --memory models the data memory, starting from
+# the given image file if any, and --memory-dump writes the words stored
+# to it at the end.
 if __name__ == '__main__':
-    if len(sys.argv) > 1:
-        print("Input File: " + str(sys.argv[1]))
-        run_tomasulo_sim(sys.argv[1])
-    else:
-        run_tomasulo_sim()
+    parser = argparse.ArgumentParser(description="Tomasulo simulator")
+    parser.add_argument("filename", nargs="?", default=None)
+    parser.add_argument("--event-driven", action="store_true",
+                        help="skip clock cycles in which nothing happens")
+    parser.add_argument("--format", choices=sorted(ow.WRITERS),
+                        default="text", help="output format")
+    parser.add_argument("--per-cycle", action="store_true",
+                        help="write the table after every clock cycle")
+    parser.add_argument("--output", default=None,
+                        help="output file (default: standard output)")
+    parser.add_argument("--profile", action="store_true",
+                        help="report the time spent in each block of the "
+                        "simulation loop on standard error")
+    parser.add_argument("--issue-width", type=int, default=None,
+                        help="instructions issued per clock cycle")
+    parser.add_argument("--stats", action="store_true",
+                        help="report stalls, waits and occupancy on "
+                        "standard error")
+    parser.add_argument("--max-cycles", type=int, default=None,
+                        help="stop the simulation at this clock cycle")
+    parser.add_argument("--checkpoint", default=None,
+                        help="file to save the simulator state to")
+    parser.add_argument("--checkpoint-every", type=int, default=None,
+                        help="save the state every this many clock cycles")
+    parser.add_argument("--resume", default=None,
+                        help="checkpoint file to resume the simulation from")
+    parser.add_argument("--functional", action="store_true",
+                        help="only compute the final register values, "
+                        "without timing")
+    parser.add_argument("--check-registers", action="store_true",
+                        help="check the final register values against the "
+                        "functional-only mode")
+    parser.add_argument("--memo-window", type=int, default=None,
+                        help="memoize the timing of windows of this many "
+                        "instructions")
+    parser.add_argument("--memo-entries", type=int,
+                        default=tc.DEFAULT_MAX_ENTRIES,
+                        help="windows kept by the memoized timing")
+    parser.add_argument("--memo-verify", action="store_true",
+                        help="check the memoized timing against a run "
+                        "without it")
+    parser.add_argument("--memory", nargs="?", const="", default=None,
+                        metavar="IMAGE",
+                        help="model the data memory read by loads and "
+                        "written by stores, starting from the given image "
+                        "file of doubles (empty if none is given); words "
+                        "never stored to and past the end of the image "
+                        "hold %r, the initial register value" %
+                        dm.DEFAULT_MEMORY_VALUE)
+    parser.add_argument("--memory-dump", default=None,
+                        help="file to write the words stored to memory to")
+    args = parser.parse_args()
+    image_file = args.memory or None
+    def create_memory():
+        if args.memory is None: return None
+        return dm.DataMemory(dm.open_image(image_file))
+    if args.profile:
+        profiling.enable(sys.modules[__name__], report_at_exit=True)
+    if args.filename is not None and args.format == "text":
+        print("Input File: " + str(args.filename))
+    writer = ow.create_writer(args.format, args.output, args.per_cycle)
+    if args.functional:
+        memory = create_memory()
+        writer.write_registers(run_functional(args.filename, memory))
+        writer.close()
+        if args.memory_dump is not None and memory is not None:
+            with open(args.memory_dump, "w") as fp:
+                dm.write_stored_words(memory.image, fp)
+        sys.exit(0)
+    config = None
+    if args.issue_width is not None:
+        config = mc.MachineConfig(issue_width=args.issue_width)
+    result = run_tomasulo_sim(args.filename, args.event_driven, config,
+                              writer, collect_stats=args.stats,
+                              max_cycles=args.max_cycles,
+                              checkpoint=args.checkpoint,
+                              checkpoint_every=args.checkpoint_every,
+                              resume=args.resume,
+                              memo_window=args.memo_window,
+                              memo_cache=tc.TimingCache(args.memo_entries),
+                              memory=create_memory())
+    if result.sim_stats is not None:
+        result.sim_stats.report(result.num_instructions, sys.stderr)
+    if args.memory_dump is not None and result.memory is not None:
+        with open(args.memory_dump, "w") as fp:
+            dm.write_stored_words(result.memory.image, fp)
+    failed = False
+    if args.memo_verify:
+        mismatches = tc.verify_memoized(result.source, config,
+                                        args.memo_window or tc.DEFAULT_WINDOW,
+                                        args.max_cycles, args.event_driven,
+                                        tc.TimingCache(args.memo_entries))
+        for what, value, expected in mismatches:
+            sys.stderr.write("Memoized %s: %r, without memoization %r\n" %
+                             (what, value, expected))
+        failed = failed or bool(mismatches)
+    if args.check_registers:
+        memory = None
+        if result.memory is not None:
+            memory = dm.DataMemory(dm.open_image(
+                result.memory.image.filename))
+        mismatches = fn.compare_registers(result.reg_file,
+                                          run_functional(result.source,
+                                                         memory))
+        for reg, value, expected in mismatches:
+            sys.stderr.write("Register %s: %r, functional-only mode %r\n" %
+                             (reg, value, expected))
+        failed = failed or bool(mismatches)
+    if failed: sys.exit(1)